@@ -0,0 +1,75 @@
+"""
+Benchmark of the plot rendering time against the window length.
+
+Renders the CPU plot of synthetic data sampled at 1 Hz, without decimation
+and with each decimation method, and prints the render time and the size
+of the PNG image.
+
+Run it with:
+    python benchmarks/bench_decimation.py --cores 16
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils  # noqa: E402
+
+# Window lengths in minutes
+WINDOWS = (1, 10, 60, 6 * 60, 24 * 60)
+
+
+def synthetic_cpu(minutes: int, cores: int, seed: int = 0) -> pd.DataFrame:
+    r"""Create CPU samples taken every second.
+
+    :param minutes: Window length in minutes
+    :param cores: Number of cores
+    :param seed: Seed of the random generator, defaults to 0
+    :return: Dataframe with a column per core and the total as the last one
+    """
+    rng = np.random.default_rng(seed)
+    samples = minutes * 60
+    values = np.clip(
+        rng.normal(30, 10, (samples, cores)).cumsum(axis=0) % 100, 0, 100)
+    data = pd.DataFrame(
+        values,
+        index=pd.date_range('2023-01-01', periods=samples, freq='s',
+                            name='Datetime'),
+        columns=[f'Core_{i}' for i in range(cores)],
+    )
+    data['Total'] = data.mean(axis=1)
+    return data
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--cores', type=int, default=16)
+    parser.add_argument(
+        '--max-full-minutes', type=int, default=60,
+        help='longest window also rendered without decimation')
+    args = parser.parse_args()
+
+    graph_builder = utils.GraphBuilder()
+    print(f'{"window":>8} {"method":>8} {"seconds":>8} {"png KB":>8}')
+    for minutes in WINDOWS:
+        data = synthetic_cpu(minutes, args.cores)
+        for method in (None, 'minmax', 'lttb'):
+            if method is None and minutes > args.max_full_minutes:
+                continue
+            image = BytesIO()
+            start = time.perf_counter()
+            graph_builder.lineplot('CPU', data, image, decimation=method)
+            elapsed = time.perf_counter() - start
+            size = len(image.getvalue()) / 1024
+            print(f'{minutes:>6}min {str(method):>8} '
+                  f'{elapsed:>8.2f} {size:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
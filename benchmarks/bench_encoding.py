@@ -0,0 +1,121 @@
+"""
+Benchmark of the compressed encoding of the samples of the metrics store.
+
+Generates a window of samples of each metric family with
+sources.SyntheticSource at 1 Hz (with some jitter on the timestamps, as the
+ticks of a sampler), keeps them as a pickled DataFrame and in a metrics
+store with the 'raw' and the 'chunks' encodings (see codec.py), and prints
+the bytes per sample of each one, the samples per second read back from
+each one, and the time to read a short window of the store.
+
+The samples of the stores are read as arrays (see StoreSegment.read), the
+same for both encodings, without the DataFrame that MetricsStore.read
+builds on top of them.
+
+Run it with:
+    python benchmarks/bench_encoding.py --hours 24 --cores 64
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np  # noqa: E402
+from sources import SyntheticSource  # noqa: E402
+from store import ENCODINGS, MetricsStore, to_datetime_index  # noqa: E402
+
+# Epoch time in nanoseconds of the start of the window
+START = 1_675_857_600 * 10**9
+
+# Metric families of the benchmark
+FAMILIES = ('cpu', 'memory', 'disk_io', 'pressure', 'processes')
+
+# Short windows read from each store
+WINDOWS = 20
+
+
+def size(path: str) -> int:
+    r"""Get the size of the files of a directory.
+
+    :param path: Directory
+    :return: Size in bytes
+    """
+    return sum(os.path.getsize(os.path.join(directory, filename))
+               for directory, _, filenames in os.walk(path)
+               for filename in filenames)
+
+
+def best(function: object, repeat: int) -> float:
+    r"""Time the fastest of a few calls of a function.
+
+    :param function: Function without arguments
+    :param repeat: Number of calls
+    :return: Seconds of the fastest call
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hours', type=float, default=24.0)
+    parser.add_argument('--cores', type=int, default=64)
+    parser.add_argument(
+        '--jitter', type=float, default=500.0,
+        help='largest jitter of the timestamps in microseconds')
+    parser.add_argument(
+        '--window', type=float, default=600.0,
+        help='seconds of the short windows read from the stores')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--families', nargs='+', default=list(FAMILIES))
+    args = parser.parse_args()
+
+    source = SyntheticSource(cores=args.cores, rate=1.0)
+    stop = START + int(args.hours * 3600e9)
+    jitter = int(args.jitter * 1000)
+    random = np.random.default_rng(0)
+    windows = random.integers(START, stop - int(args.window * 1e9), WINDOWS)
+
+    print(f'{args.hours:g} hours at 1 Hz, {args.cores} cores, '
+          f'jitter of {args.jitter:g} us')
+    print(f'{"family":>10} {"format":>8} {"bytes/sample":>13} '
+          f'{"read Msample/s":>15} {f"{args.window:g}s window":>14}')
+    for name in args.families:
+        data = source.read(name, START, stop)
+        timestamps = source.timestamps(START, stop) + random.integers(
+            -jitter, jitter + 1, len(data))
+        data.index = to_datetime_index(timestamps)
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        seconds = best(lambda: pickle.loads(blob), args.repeat)
+        print(f'{name:>10} {"pickle":>8} {len(blob) / len(data):13.1f} '
+              f'{len(data) / seconds / 1e6:15.2f} {"-":>14}')
+
+        for encoding in ENCODINGS:
+            with tempfile.TemporaryDirectory() as path:
+                store = MetricsStore(path)
+                writer = store.writer(rollups=False, encoding=encoding)
+                writer.extend(name, timestamps, data.to_numpy(),
+                              list(data.columns))
+                writer.close()
+                segment, = store.segments(name)
+                read = best(segment.read, args.repeat)
+                window = best(lambda: [
+                    segment.read(int(first), int(first + args.window * 1e9))
+                    for first in windows
+                ], args.repeat) / WINDOWS
+                print(f'{name:>10} {encoding:>8} '
+                      f'{size(path) / len(data):13.1f} '
+                      f'{len(data) / read / 1e6:15.2f} '
+                      f'{window * 1e3:12.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
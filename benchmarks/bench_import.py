@@ -0,0 +1,79 @@
+"""
+Benchmark of the cold start of the report.
+
+Imports the modules of the app in fresh interpreters and prints the median
+import time, with the heavy libraries (seaborn, matplotlib, reportlab, fitz)
+that were imported along the way. The last row is the time of the deferred
+imports, paid by the first plot and PDF of the process instead.
+
+Run it with:
+    python benchmarks/bench_import.py --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that should only be imported on first use
+HEAVY_MODULES = ('seaborn', 'matplotlib', 'reportlab', 'fitz')
+
+# Code timed in the fresh interpreter, by benchmark
+SNIPPETS = {
+    'import utils': 'import utils',
+    'import report': 'import report',
+    'first use': (
+        'import utils\n'
+        'start = time.perf_counter()\n'
+        'utils.PdfBuilder().logo\n'
+        'utils.PdfBuilder().format_text("")\n'
+        'import seaborn, matplotlib.figure'
+    ),
+}
+
+TEMPLATE = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{snippet}
+print(json.dumps([
+    time.perf_counter() - start,
+    [name for name in {heavy!r} if name in sys.modules],
+]))
+'''
+
+
+def measure(snippet: str) -> tuple:
+    r"""Run a snippet in a fresh interpreter.
+
+    :param snippet: Code to be timed
+    :return: Time in seconds and heavy libraries imported
+    """
+    code = TEMPLATE.format(root=ROOT, snippet=snippet, heavy=HEAVY_MODULES)
+    output = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True, text=True, check=True, cwd=ROOT,
+    ).stdout
+    elapsed, modules = json.loads(output.splitlines()[-1])
+    return elapsed, modules
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"benchmark":>14} {"seconds":>8}  heavy modules imported')
+    for name, snippet in SNIPPETS.items():
+        runs = [measure(snippet) for _ in range(args.repeat)]
+        elapsed = statistics.median(run[0] for run in runs)
+        modules = ', '.join(runs[-1][1]) or '-'
+        print(f'{name:>14} {elapsed:>8.3f}  {modules}')
+
+
+if __name__ == '__main__':
+    main()
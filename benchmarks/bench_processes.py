@@ -0,0 +1,74 @@
+"""
+Benchmark of the top of the processes on a host with many processes.
+
+Starts idle child processes until the host runs the requested number of
+processes, then times the ticks of the process collectors (psutil and /proc)
+with a budget of processes read per tick and without one (every process on
+every tick), and prints the time of a tick and the CPU share of a sampler at
+1 Hz.
+
+Run it with:
+    python benchmarks/bench_processes.py --processes 1000 5000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import psutil  # noqa: E402
+from collectors import ProcessCollector  # noqa: E402
+from procfs import ProcProcessCollector  # noqa: E402
+
+# Ticks timed per collector and budget
+TICKS = 20
+
+
+def spawn(count: int, children: list) -> None:
+    r"""Start idle child processes until the host runs a number of them.
+
+    :param count: Number of processes of the host
+    :param children: Child processes started so far, the new ones are added
+    """
+    for _ in range(count - len(psutil.pids())):
+        children.append(subprocess.Popen(
+            ['sleep', '3600'], stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=[1000, 5000])
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument(
+        '--budget', type=int, default=500,
+        help='processes read per tick')
+    args = parser.parse_args()
+
+    children = []
+    try:
+        for count in sorted(args.processes):
+            spawn(count, children)
+            print(f'{len(psutil.pids())} processes')
+            for collector_class in (ProcessCollector, ProcProcessCollector):
+                for budget in (args.budget, count * 2):
+                    collector = collector_class(args.top, budget)
+                    seconds = timeit.timeit(collector.collect,
+                                            number=TICKS) / TICKS
+                    label = 'all' if budget > count else budget
+                    print(f'{collector_class.__name__:>22} budget={label:<6} '
+                          f'{seconds * 1e3:>9.2f}ms/tick '
+                          f'{seconds * 100:>6.2f}% of a CPU at 1 Hz')
+    finally:
+        for child in children:
+            child.kill()
+        for child in children:
+            child.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark of the per-tick cost of the /proc collectors against psutil.
+
+Times one tick of every collector, read with psutil (collectors.py) and from
+/proc (procfs.py), then runs a sampler with all of them at 10 to 100 Hz and
+prints the CPU time of the sampling thread, the jitter and the missed ticks
+(see Sampler.overhead). Linux only.
+
+Run it with:
+    python benchmarks/bench_procfs.py --seconds 10
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import collectors  # noqa: E402
+import procfs  # noqa: E402
+from sampler import Sampler  # noqa: E402
+
+# Sampling rates in Hz
+RATES = (10, 20, 50, 100)
+
+
+def tick_cost(collector: object, repeat: int = 5) -> float:
+    r"""Time one tick of a collector.
+
+    :param collector: Collector to be sampled
+    :param repeat: Number of measurements, defaults to 5
+    :return: Fastest time of a tick in seconds
+    """
+    timer = timeit.Timer(collector.collect)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def sampler_overhead(fast_path: bool, rate: float, seconds: float) -> dict:
+    r"""Run a sampler with all the collectors and measure its footprint.
+
+    :param fast_path: Read /proc instead of psutil
+    :param rate: Ticks per second
+    :param seconds: Time to sample
+    :return: Footprint of the sampler (see Sampler.overhead)
+    """
+    sampler = Sampler(interval=1 / rate)
+    for name in collectors.COLLECTORS:
+        sampler.add_collector(procfs.collector(name, fast_path))
+    sampler.start()
+    sampler.join(seconds)
+    sampler.stop()
+    sampler.join()
+    return sampler.overhead()
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--seconds', type=float, default=10.0,
+        help='time sampled at each rate')
+    args = parser.parse_args()
+    if not sys.platform.startswith('linux'):
+        raise SystemExit('The /proc collectors are only used on Linux')
+
+    print(f'{"collector":>10} {"psutil us":>10} {"/proc us":>10}')
+    for name in collectors.COLLECTORS:
+        slow = tick_cost(collectors.COLLECTORS[name]())
+        fast = tick_cost(procfs.collector(name))
+        print(f'{name:>10} {slow * 1e6:>10.1f} {fast * 1e6:>10.1f}')
+
+    print(f'\n{"rate":>6} {"reader":>7} {"cpu %":>7} {"jitter p95 ms":>14} '
+          f'{"missed":>7}')
+    for rate in RATES:
+        for fast_path in (False, True):
+            overhead = sampler_overhead(fast_path, rate, args.seconds)
+            print(f'{rate:>4}Hz {"/proc" if fast_path else "psutil":>7} '
+                  f'{overhead["thread_cpu_percent"]:>7.2f} '
+                  f'{overhead["jitter_p95"] * 1e3:>14.2f} '
+                  f'{overhead["missed_ticks"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of the pipeline of a report with high-rate synthetic samples.
+
+Generates the CPU samples of a window with sources.SyntheticSource (e.g. 256
+cores at 10 kHz), writes them to a temporary metrics store, reads them back,
+decimates them and renders the plot, and prints the time of each stage.
+
+Run it with:
+    python benchmarks/bench_synthetic.py --cores 256 --rate 10000 --seconds 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils  # noqa: E402
+from decimation import decimate  # noqa: E402
+from sources import SyntheticSource  # noqa: E402
+from store import MetricsStore  # noqa: E402
+
+# Epoch time in nanoseconds of the start of the window
+START = 1_675_857_600 * 10**9
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--cores', type=int, default=256)
+    parser.add_argument('--rate', type=float, default=10_000.0)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--max-points', type=int, default=2000)
+    args = parser.parse_args()
+
+    source = SyntheticSource(cores=args.cores, rate=args.rate)
+    stop = START + int(args.seconds * 1e9)
+    timings = []
+
+    start = time.perf_counter()
+    data = source.read('cpu', START, stop)
+    timings.append(('generate', time.perf_counter() - start))
+
+    with tempfile.TemporaryDirectory() as path:
+        store = MetricsStore(path)
+        writer = store.writer()
+        start = time.perf_counter()
+        writer.extend('cpu', data.index.asi8, data.to_numpy(),
+                      list(data.columns))
+        writer.close()
+        timings.append(('write', time.perf_counter() - start))
+
+        start = time.perf_counter()
+        data = store.read('cpu', START, stop)
+        timings.append(('read', time.perf_counter() - start))
+
+    start = time.perf_counter()
+    decimated = decimate(data, args.max_points)
+    timings.append(('decimate', time.perf_counter() - start))
+
+    start = time.perf_counter()
+    utils.GraphBuilder().lineplot('CPU', decimated, BytesIO(),
+                                  decimation=None)
+    timings.append(('lineplot', time.perf_counter() - start))
+
+    print(f'{len(data)} samples x {len(data.columns)} series '
+          f'({data.to_numpy().nbytes / 1024**2:.0f} MB)')
+    for stage, elapsed in timings:
+        print(f'{stage:>10} {elapsed:>8.2f}s')
+
+
+if __name__ == '__main__':
+    main()
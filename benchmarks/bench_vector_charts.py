@@ -0,0 +1,62 @@
+"""
+Benchmark of the vector charts against the raster (PNG) charts.
+
+Builds a one page PDF with the CPU chart of synthetic data sampled at 1 Hz,
+embedded as a PNG image and as vector graphics, and prints the build time
+and the size of the PDF for each window length.
+
+Run it with:
+    python benchmarks/bench_vector_charts.py --cores 16
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+from reportlab.platypus import SimpleDocTemplate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils  # noqa: E402
+from bench_decimation import WINDOWS, synthetic_cpu  # noqa: E402
+from decimation import decimate  # noqa: E402
+
+
+def build(chart_format: str, data: object) -> tuple:
+    r"""Build a PDF with one chart.
+
+    :param chart_format: 'raster' or 'vector'
+    :param data: Decimated CPU data
+    :return: Build time in seconds and size of the PDF in bytes
+    """
+    pdf_builder = utils.PdfBuilder()
+    start = time.perf_counter()
+    if chart_format == 'vector':
+        chart = pdf_builder.format_vector_chart('CPU', data)
+    else:
+        image = utils.render_lineplot(
+            {'device': 'CPU', 'data': data, 'decimation': None})
+        chart = pdf_builder.format_image(filename=BytesIO(image))
+    output = BytesIO()
+    SimpleDocTemplate(output, pagesize=pdf_builder.pagesize).build([chart])
+    return time.perf_counter() - start, len(output.getvalue())
+
+
+def main() -> None:
+    r"""Run the benchmark and print a table with the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--cores', type=int, default=16)
+    args = parser.parse_args()
+
+    max_points = utils.GraphBuilder.default_max_points
+    print(f'{"window":>8} {"format":>8} {"seconds":>8} {"pdf KB":>8}')
+    for minutes in WINDOWS:
+        data = decimate(synthetic_cpu(minutes, args.cores), max_points)
+        for chart_format in ('raster', 'vector'):
+            elapsed, size = build(chart_format, data)
+            print(f'{minutes:>6}min {chart_format:>8} '
+                  f'{elapsed:>8.2f} {size / 1024:>8.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+"""
+Benchmark suite of the collection overhead and of the report build latency.
+
+Times each stage of a report with synthetic samples (see sources.py), for
+every combination of core count and window length:
+
+    collect: One tick of each collector of this machine, with the append to
+        the buffer (the cost of the sampler on the host)
+    collect_procfs: The same with the fast-path collectors of Linux
+    collect_processes: One tick of the top of the processes of this machine
+        (see also bench_processes.py)
+    tick_synthetic: One tick of the synthetic CPU collector
+    dataframe: Dataframe of the samples of a buffer (RingBuffer.to_frame)
+    summary: Summary of the samples of a buffer, from the statistics kept
+        as they were appended (RingBuffer.summary)
+    lineplot: CPU plot (GraphBuilder.lineplot)
+    build_pdf: PDF with the logo, a text and the CPU plot
+        (PdfBuilder.build_pdf)
+    rasterize: First page of that PDF as the PNG shown by the frontend
+    generate_pdf: Whole report with every section (HardwareReport)
+    generate_pdf_store: The same from a metrics store written with the
+        rollups of the samples (see rollup.py), as the reports of long
+        windows (e.g. --windows 86400 604800)
+
+The windows are sampled at 1 Hz. The results are saved as JSON, and compared
+with the results of a previous run to catch the regressions before a deploy
+(the exit code is 1 if a benchmark got slower than the tolerance).
+
+Run it with:
+    python benchmarks/suite.py --cores 4 64 256 --windows 60 3600 \
+        --output results.json
+    python benchmarks/suite.py --compare results.json --tolerance 0.2
+"""
+import argparse
+import datetime as dt
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from io import BytesIO
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import collectors  # noqa: E402
+import procfs  # noqa: E402
+import utils  # noqa: E402
+from report import HardwareReport  # noqa: E402
+from sources import ReplaySource  # noqa: E402
+from sources import SyntheticSource  # noqa: E402
+from stats import DEFAULT_BLOCK  # noqa: E402
+from store import MetricsStore, RingBuffer  # noqa: E402
+
+# Epoch time in seconds of the start of the windows
+START = 1_675_857_600
+
+# Width in pixels of the pages rendered by the frontend (see main.py)
+PAGE_WIDTH = 1200
+
+# Seconds of synthetic samples written at once to a store (a day at 1 Hz)
+STORE_CHUNK = 24 * 60 * 60
+
+# Benchmarks by name, with the parameters they take
+BENCHMARKS = {}
+
+
+def benchmark(*params: str) -> object:
+    r"""Register a benchmark.
+
+    The benchmark is called with a value of each parameter, does the setup
+    and returns the function to be timed.
+
+    :param params: Names of the parameters, 'cores', 'window' or 'collector'
+    :return: Decorator of the benchmark
+    """
+    def register(function: object) -> object:
+        BENCHMARKS[function.__name__] = (function, params)
+        return function
+    return register
+
+
+def synthetic_cpu(cores: int, window: int) -> object:
+    r"""Get the CPU samples of a window, sampled at 1 Hz.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Dataframe with a column per core and the total
+    """
+    return SyntheticSource(cores=cores, rate=1.0).read(
+        'cpu', START * 10**9, (START + window) * 10**9)
+
+
+def tick(collector: object) -> object:
+    r"""Get one tick of a collector, as the sampler runs it.
+
+    :param collector: Collector to be sampled
+    :return: Function collecting a sample and appending it to a buffer
+    """
+    buffer = RingBuffer(
+        capacity=1024,
+        dtype=getattr(collector, 'dtype', np.float64),
+        stats_block=DEFAULT_BLOCK,
+    )
+    timestamps = itertools.count(START * 10**9, 10**9)
+    columns = getattr(collector, 'columns', None)
+
+    def run() -> None:
+        buffer.append(next(timestamps), collector.collect(), columns)
+    return run
+
+
+@benchmark('collector')
+def collect(collector: str) -> object:
+    r"""Time one tick of a collector of this machine.
+
+    :param collector: Name of the collector (see collectors.COLLECTORS)
+    :return: Function collecting a sample into a buffer
+    """
+    return tick(collectors.COLLECTORS[collector]())
+
+
+@benchmark('collector')
+def collect_procfs(collector: str) -> object:
+    r"""Time one tick of a fast-path collector of Linux.
+
+    :param collector: Name of the collector (see collectors.COLLECTORS)
+    :return: Function collecting a sample into a buffer
+    """
+    return tick(procfs.collector(collector))
+
+
+@benchmark()
+def collect_processes() -> object:
+    r"""Time one tick of the top of the processes of this machine.
+
+    :return: Function collecting a sample into a buffer
+    """
+    return tick(procfs.collector('processes'))
+
+
+@benchmark('cores')
+def tick_synthetic(cores: int) -> object:
+    r"""Time one tick of the synthetic CPU collector.
+
+    :param cores: Number of cores
+    :return: Function collecting a sample into a buffer
+    """
+    return tick(collectors.SyntheticCpuCollector(cores, seed=0))
+
+
+@benchmark('cores', 'window')
+def dataframe(cores: int, window: int) -> object:
+    r"""Time the dataframe of the CPU samples of a buffer.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function building the dataframe
+    """
+    data = synthetic_cpu(cores, window)
+    buffer = RingBuffer(capacity=len(data))
+    buffer.extend(data.index.asi8, data.to_numpy(), list(data.columns))
+    return buffer.to_frame
+
+
+@benchmark('cores', 'window')
+def summary(cores: int, window: int) -> object:
+    r"""Time the summary of the CPU samples of a buffer.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function summarizing a window of the buffer
+    """
+    data = synthetic_cpu(cores, window)
+    buffer = RingBuffer(capacity=len(data), stats_block=DEFAULT_BLOCK)
+    buffer.extend(data.index.asi8, data.to_numpy(), list(data.columns))
+    # A window that doesn't start on a block, as the ones of the reports
+    return lambda: buffer.summary(data.index.asi8[len(data) // 3])
+
+
+@benchmark('cores', 'window')
+def lineplot(cores: int, window: int) -> object:
+    r"""Time the plot of the CPU samples.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function drawing the plot
+    """
+    data = synthetic_cpu(cores, window)
+    graph_builder = utils.GraphBuilder()
+    return lambda: graph_builder.lineplot('CPU', data, BytesIO())
+
+
+def build(image: bytes) -> bytes:
+    r"""Build a PDF with the logo, a text and a plot.
+
+    :param image: PNG image of the plot
+    :return: PDF file
+    """
+    pdf_builder = utils.PdfBuilder()
+    output = BytesIO()
+    parts = [
+        pdf_builder.logo,
+        pdf_builder.format_text('CPU Info\n\nPhysical cores: 0'),
+        pdf_builder.format_image(filename=BytesIO(image)),
+    ]
+    pdf_builder.build_pdf(
+        pdf_builder.create_template('', pdf_builder.pagesize, output), parts)
+    return output.getvalue()
+
+
+@benchmark('cores', 'window')
+def build_pdf(cores: int, window: int) -> object:
+    r"""Time the PDF with the logo, a text and the CPU plot.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function building the PDF
+    """
+    image = utils.render_lineplot(
+        {'device': 'CPU', 'data': synthetic_cpu(cores, window)})
+    return lambda: build(image)
+
+
+@benchmark('cores', 'window')
+def rasterize(cores: int, window: int) -> object:
+    r"""Time the PNG of the first page of the PDF of the CPU plot.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function rendering the page
+    """
+    pdf = build(utils.render_lineplot(
+        {'device': 'CPU', 'data': synthetic_cpu(cores, window)}))
+    return lambda: utils.render_page(pdf, 0, PAGE_WIDTH)
+
+
+@benchmark('cores', 'window')
+def generate_pdf(cores: int, window: int) -> object:
+    r"""Time the whole report of synthetic samples.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function generating the report
+    """
+    source = SyntheticSource(cores=cores, rate=1.0)
+    start = dt.datetime.fromtimestamp(START)
+    stop = dt.datetime.fromtimestamp(START + window)
+
+    def run() -> None:
+        # The plots are rendered in this process, so the time doesn't
+        # depend on the start of a pool of workers
+        HardwareReport(
+            start_time=start, stop_time=stop, source=source,
+            render_workers=1, output=BytesIO(),
+        ).generate_pdf()
+    return run
+
+
+@benchmark('cores', 'window')
+def generate_pdf_store(cores: int, window: int) -> object:
+    r"""Time the whole report of the samples of a metrics store.
+
+    :param cores: Number of cores
+    :param window: Window length in seconds
+    :return: Function generating the report, the store is removed with it
+    """
+    source = SyntheticSource(cores=cores, rate=1.0)
+    directory = tempfile.TemporaryDirectory()
+    store = MetricsStore(directory.name)
+    writer = store.writer()
+    for first in range(START, START + window, STORE_CHUNK):
+        # The last second of the chunk is the first of the next one
+        bounds = (first * 10**9,
+                  min(first + STORE_CHUNK, START + window) * 10**9 - 1)
+        timestamps = source.timestamps(*bounds)
+        for name in ('cpu', 'memory', 'swap', 'disk_io', 'net_io'):
+            data = source.read(name, *bounds)
+            writer.extend(name, timestamps, data.to_numpy(),
+                          list(data.columns))
+    writer.close()
+    start = dt.datetime.fromtimestamp(START)
+    stop = dt.datetime.fromtimestamp(START + window)
+
+    def run() -> None:
+        HardwareReport(
+            start_time=start, stop_time=stop, source=ReplaySource(store),
+            render_workers=1, output=BytesIO(),
+        ).generate_pdf()
+    # The files are removed with the function
+    run.directory = directory
+    return run
+
+
+def measure(function: object, repeat: int) -> dict:
+    r"""Time a function, as timeit does.
+
+    :param function: Function to be timed
+    :param repeat: Number of measurements
+    :return: Calls per measurement, and the min, median, mean and max time
+    of a call in seconds
+    """
+    timer = timeit.Timer(function)
+    # As many calls per measurement as take 0.2 seconds (at least one)
+    number, _ = timer.autorange()
+    times = [elapsed / number for elapsed in timer.repeat(repeat, number)]
+    return {
+        'number': number,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'max': max(times),
+    }
+
+
+def run(names: list, grid: dict, repeat: int) -> list:
+    r"""Run the benchmarks for every combination of their parameters.
+
+    :param names: Names of the benchmarks
+    :param grid: Values of each parameter
+    :param repeat: Number of measurements of each benchmark
+    :return: Result of each benchmark and combination
+    """
+    results = []
+    for name in names:
+        function, params = BENCHMARKS[name]
+        for values in itertools.product(*(grid[param] for param in params)):
+            arguments = dict(zip(params, values))
+            result = {'benchmark': name, 'params': arguments}
+            result.update(measure(function(**arguments), repeat))
+            results.append(result)
+            print(f'{name:>15} {key(result)[1]:<28} '
+                  f'{result["median"] * 1e3:>12.3f}ms')
+    return results
+
+
+def key(result: dict) -> tuple:
+    r"""Get the key of a result, to compare it with other runs.
+
+    :param result: Result of a benchmark
+    :return: Name of the benchmark and its parameters
+    """
+    return result['benchmark'], ' '.join(
+        f'{param}={value}' for param, value in result['params'].items())
+
+
+def regressions(results: list, baseline: list, tolerance: float) -> list:
+    r"""Find the benchmarks slower than in a previous run.
+
+    The fastest times are compared, as they are the least noisy.
+
+    :param results: Results of this run
+    :param baseline: Results of the previous run
+    :param tolerance: Allowed slowdown, e.g. 0.2 for 20%
+    :return: Key of each slower benchmark, with the previous and the new
+    time in seconds
+    """
+    previous = {key(result): result['min'] for result in baseline}
+    return [
+        (key(result), previous[key(result)], result['min'])
+        for result in results
+        if key(result) in previous
+        and result['min'] > previous[key(result)] * (1 + tolerance)
+    ]
+
+
+def main() -> None:
+    r"""Run the benchmarks, save the results and compare them."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        'benchmarks', nargs='*',
+        help=f'benchmarks to run ({", ".join(BENCHMARKS)}), by default all '
+             'of them')
+    parser.add_argument('--cores', type=int, nargs='+', default=[4, 64])
+    parser.add_argument(
+        '--windows', type=int, nargs='+', default=[60, 3600],
+        help='window lengths in seconds')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file of the results')
+    parser.add_argument(
+        '--compare', help='JSON file of the results of a previous run')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='allowed slowdown against the previous run, e.g. 0.2 for 20%%')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    grid = {
+        'cores': args.cores,
+        'window': args.windows,
+        'collector': list(collectors.COLLECTORS),
+    }
+    results = run(args.benchmarks or list(BENCHMARKS), grid, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'created': dt.datetime.now().isoformat(),
+                'machine': {
+                    'node': platform.node(),
+                    'platform': platform.platform(),
+                    'python': platform.python_version(),
+                    'cpus': os.cpu_count(),
+                },
+                'results': results,
+            }, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        slower = regressions(results, baseline, args.tolerance)
+        for (name, params), previous, current in slower:
+            print(f'Regression: {name} {params} '
+                  f'{previous * 1e3:.3f}ms => {current * 1e3:.3f}ms')
+        if slower:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+"""
+Collectors of the cgroup (v2) of the process, for the reports of a container.
+
+Inside a container psutil and /proc show the whole host: the memory of the
+host, all its CPUs and disks. These collectors read the files of the cgroup
+the process runs in, and take the same samples as the ones of collectors.py
+(same names and columns), normalized against the limits of the cgroup:
+
+    cpu: cpu.stat, as a percentage of the CPU quota (cpu.max), or of the
+        CPUs of the cpuset without a quota
+    memory: memory.current without the inactive page cache (memory.stat),
+        out of memory.max (or of the memory of the host without a limit)
+    swap: memory.swap.current out of memory.swap.max
+    disk_io: io.stat, the I/O counters of the cgroup on each disk
+    pressure: cpu.pressure, memory.pressure and io.pressure, the pressure
+        stall information (PSI) of the cgroup (see procfs.py)
+
+The network isn't part of the cgroup, the container has its own network
+namespace, whose NICs are already the ones of /proc/net/dev.
+
+The limits (cpu.max, memory.max, the cpuset) are read again every few
+seconds (LIMITS_REFRESH), not on every tick: they are only changed by the
+container runtime, e.g. on a docker update.
+
+The root of the cgroup filesystem and the cgroup are arguments, so the
+collectors can read a fake tree of files, e.g. in tests:
+    Cgroup('/tmp/fake/sys/fs/cgroup/app')
+"""
+import os
+import time
+
+import numpy as np
+import procfs
+import psutil
+from collectors import DiskIOCollector
+
+# Mount point of the cgroup v2 filesystem
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# Root of the sys filesystem, where the names of the disks are found
+SYS_PATH = '/sys'
+
+# Counters of io.stat, in the order of DiskIOCollector.fields
+IO_STAT_FIELDS = (b'rbytes', b'wbytes', b'rios', b'wios')
+
+# Seconds the limits of a cgroup are kept before being read again
+LIMITS_REFRESH = 5.0
+
+
+def find_cgroup(root: str = CGROUP_ROOT, proc: str = procfs.PROC_PATH) -> str:
+    r"""Find the cgroup v2 of this process.
+
+    :param root: Mount point of the cgroup v2 filesystem, defaults to
+    '/sys/fs/cgroup'
+    :param proc: Root of the proc filesystem, defaults to '/proc'
+    :return: Path of the directory of the cgroup
+    """
+    with open(os.path.join(proc, 'self', 'cgroup')) as file:
+        for line in file:
+            # The line of the v2 hierarchy is "0::<path>" (only "0::/" in a
+            # container with its own cgroup namespace)
+            hierarchy, _, path = line.rstrip('\n').partition('::')
+            if hierarchy == '0':
+                return os.path.join(root, path.lstrip('/'))
+    raise FileNotFoundError('The process is not in a cgroup v2')
+
+
+def parse_cpus(cpus: str) -> int:
+    r"""Count the CPUs of a cpuset list.
+
+    e.g:
+        '0-3,8,10-11' => 7
+
+    :param cpus: List of CPUs, as in cpuset.cpus.effective
+    :return: Number of CPUs
+    """
+    count = 0
+    for part in cpus.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        count += int(last or first) - int(first) + 1
+    return count
+
+
+class Cgroup:
+    """The files of a cgroup v2, and its CPU and memory limits."""
+
+    def __init__(
+        self,
+        path: str = None,
+        root: str = CGROUP_ROOT,
+        refresh: float = LIMITS_REFRESH,
+    ) -> None:
+        r"""Find the cgroup.
+
+        :param path: Directory of the cgroup, defaults to None (the cgroup
+        of this process, see find_cgroup)
+        :param root: Mount point of the cgroup v2 filesystem, defaults to
+        '/sys/fs/cgroup'
+        :param refresh: Seconds the limits are kept before being read
+        again, defaults to LIMITS_REFRESH (0 to read them on every call)
+        """
+        if path is None:
+            path = find_cgroup(root)
+        # Every cgroup of a v2 hierarchy has this file (the v1 ones don't)
+        if not os.path.isfile(os.path.join(path, 'cgroup.controllers')):
+            raise FileNotFoundError(f'No cgroup v2 at {path!r}')
+        self.path = path
+        self.root = root
+        self.refresh = refresh
+        # Value and monotonic time of the last reading of each limit
+        self._limits = {}
+
+    @property
+    def name(self) -> str:
+        r"""Path of the cgroup inside the hierarchy, e.g. '/docker/ab12'."""
+        path = os.path.relpath(self.path, self.root)
+        if path.startswith(os.pardir):
+            # A cgroup given outside of the root
+            return self.path
+        return '/' if path == os.curdir else f'/{path}'
+
+    def open(self, filename: str) -> procfs.ProcFile:
+        r"""Open a file of the cgroup, to be read on every tick.
+
+        :param filename: Name of the file, e.g. 'cpu.stat'
+        :return: File read again in place (see procfs.ProcFile)
+        """
+        return procfs.ProcFile(os.path.join(self.path, filename))
+
+    def read(self, filename: str) -> str:
+        r"""Read a file of the cgroup once.
+
+        :param filename: Name of the file, e.g. 'cpu.max'
+        :return: Content of the file
+        """
+        with open(os.path.join(self.path, filename)) as file:
+            return file.read()
+
+    def cached(self, key: str, function: object) -> object:
+        r"""Get a value read at most every refresh seconds.
+
+        :param key: Name of the value, e.g. 'cpu.max'
+        :param function: Function without arguments reading the value
+        :return: Value of the last call of the function, called again if it
+        is older than refresh
+        """
+        now = time.monotonic()
+        value, before = self._limits.get(key, (None, None))
+        if before is None or now - before >= self.refresh:
+            value = function()
+            self._limits[key] = value, now
+        return value
+
+    def cpus(self) -> int:
+        r"""Get the number of CPUs the cgroup can run on.
+
+        :return: CPUs of the cpuset, or of the host without a cpuset
+        """
+        return self.cached('cpuset.cpus.effective', self._cpus)
+
+    def _cpus(self) -> int:
+        try:
+            return parse_cpus(self.read('cpuset.cpus.effective')) or (
+                os.cpu_count() or 1)
+        except FileNotFoundError:
+            # The cpuset controller isn't enabled for the cgroup
+            return os.cpu_count() or 1
+
+    def cpu_limit(self) -> float:
+        r"""Get the number of CPUs worth of time the cgroup can use.
+
+        :return: CPU quota over the period of cpu.max (e.g. 1.5), at most
+        the CPUs of the cpuset
+        """
+        return self.cached('cpu.max', self._cpu_limit)
+
+    def _cpu_limit(self) -> float:
+        cpus = self.cpus()
+        try:
+            quota, period = self.read('cpu.max').split()
+        except FileNotFoundError:
+            # The root cgroup, or the cpu controller isn't enabled
+            return float(cpus)
+        if quota == 'max':
+            return float(cpus)
+        return min(int(quota) / int(period), cpus)
+
+    def memory_limit(self, filename: str = 'memory.max') -> int:
+        r"""Get a memory limit of the cgroup.
+
+        :param filename: File of the limit, 'memory.max' or
+        'memory.swap.max', defaults to 'memory.max'
+        :return: Limit in bytes, None without a limit
+        """
+        return self.cached(filename, lambda: self._memory_limit(filename))
+
+    def _memory_limit(self, filename: str) -> int:
+        try:
+            limit = self.read(filename).strip()
+        except FileNotFoundError:
+            return None
+        return None if limit == 'max' else int(limit)
+
+
+def keyed_values(content: bytes) -> dict:
+    r"""Parse the "<key> <value>" lines of a cgroup file (e.g. cpu.stat).
+
+    :param content: Content of the file
+    :return: Integer value of each key
+    """
+    fields = bytes(content).split()
+    return dict(zip(fields[::2], map(int, fields[1::2])))
+
+
+class CgroupCpuCollector:
+    """CPU utilization of the cgroup, against its quota.
+
+    The user, system and total times are the share of the CPU quota used
+    since the previous tick, and Throttled the share of the time the cgroup
+    was throttled for using its whole quota.
+    """
+
+    name = 'cpu'
+    columns = ['User', 'System', 'Throttled', 'Total']
+    keys = (b'user_usec', b'system_usec', b'throttled_usec', b'usage_usec')
+
+    def __init__(self, cgroup: Cgroup = None) -> None:
+        r"""Open cpu.stat and take the first reading.
+
+        :param cgroup: Cgroup to be sampled, defaults to None (the cgroup of
+        this process)
+        """
+        self.cgroup = cgroup or Cgroup()
+        self._stat = self.cgroup.open('cpu.stat')
+        self._previous = self._read()
+
+    def _read(self) -> tuple:
+        values = keyed_values(self._stat.read())
+        # throttled_usec is only there with the cpu controller
+        return (np.array([values.get(key, 0) for key in self.keys],
+                         dtype=np.float64),
+                time.monotonic())
+
+    def collect(self) -> np.ndarray:
+        r"""Take one CPU sample.
+
+        :return: Percentage of the quota used (user, system and total) and
+        percentage of the time throttled
+        """
+        current, now = self._read()
+        previous, before = self._previous
+        self._previous = current, now
+        elapsed = (now - before) * 1e6
+        if elapsed <= 0:
+            return np.zeros(len(self.columns))
+        sample = 100 * (current - previous) / elapsed
+        # The throttled time is wall time, the others CPU time over all the
+        # CPUs of the quota
+        sample[[0, 1, 3]] /= self.cgroup.cpu_limit()
+        return np.clip(sample, 0, 100).round(1)
+
+
+class CgroupMemoryCollector:
+    """Memory usage of the cgroup in bytes, against its limit.
+
+    The used memory is memory.current without the inactive page cache,
+    which the kernel reclaims before reaching the limit (as docker stats
+    does), and the total is the limit (memory.max), or the memory of the
+    host if the cgroup has no limit.
+    """
+
+    name = 'memory'
+    dtype = np.int64
+    columns = ['Total', 'Available', 'Used']
+
+    def __init__(self, cgroup: Cgroup = None) -> None:
+        r"""Open the memory files.
+
+        :param cgroup: Cgroup to be sampled, defaults to None (the cgroup of
+        this process)
+        """
+        self.cgroup = cgroup or Cgroup()
+        self._current = self.cgroup.open('memory.current')
+        self._stat = self.cgroup.open('memory.stat')
+        self._sample = np.zeros(len(self.columns), dtype=np.int64)
+        self.collect()
+
+    def collect(self) -> np.ndarray:
+        r"""Take one memory sample.
+
+        :return: Limit, available and used memory in bytes
+        """
+        total = self.cgroup.memory_limit() or self.cgroup.cached(
+            'host memory', lambda: psutil.virtual_memory().total)
+        inactive = keyed_values(self._stat.read()).get(b'inactive_file', 0)
+        used = max(int(self._current.read()) - inactive, 0)
+        self._sample[:] = total, max(total - used, 0), used
+        return self._sample
+
+
+class CgroupSwapCollector:
+    """Swap usage of the cgroup in bytes, against its limit."""
+
+    name = 'swap'
+    dtype = np.int64
+    columns = ['Total', 'Free', 'Used']
+
+    def __init__(self, cgroup: Cgroup = None) -> None:
+        r"""Open memory.swap.current.
+
+        :param cgroup: Cgroup to be sampled, defaults to None (the cgroup of
+        this process)
+        """
+        self.cgroup = cgroup or Cgroup()
+        self._current = self.cgroup.open('memory.swap.current')
+        self._sample = np.zeros(len(self.columns), dtype=np.int64)
+
+    def collect(self) -> np.ndarray:
+        r"""Take one swap sample.
+
+        :return: Limit, free and used swap in bytes
+        """
+        total = self.cgroup.memory_limit('memory.swap.max')
+        swap = self.cgroup.cached(
+            'host swap', lambda: psutil.swap_memory().total)
+        # Without a limit (or a limit above it) the swap of the host
+        total = swap if total is None else min(total, swap)
+        used = int(self._current.read())
+        self._sample[:] = total, max(total - used, 0), used
+        return self._sample
+
+
+class CgroupDiskIOCollector(DiskIOCollector):
+    """Cumulative I/O counters of the cgroup on each disk, from io.stat."""
+
+    def __init__(self, cgroup: Cgroup = None) -> None:
+        r"""Open io.stat.
+
+        :param cgroup: Cgroup to be sampled, defaults to None (the cgroup of
+        this process)
+        """
+        self.cgroup = cgroup or Cgroup()
+        self._stat = self.cgroup.open('io.stat')
+        self._disks = None
+        # Name of each disk by its "<major>:<minor>" numbers
+        self._names = {}
+        self.columns = []
+        self._sample = np.zeros(0)
+
+    def disk_name(self, device: bytes) -> str:
+        r"""Get the name of a disk from its numbers.
+
+        :param device: "<major>:<minor>" numbers of the disk, as in io.stat
+        :return: Name of the disk (e.g. 'sda'), or its numbers if it isn't
+        in /sys
+        """
+        name = self._names.get(device)
+        if name is None:
+            name = device.decode()
+            path = os.path.join(SYS_PATH, 'dev', 'block', name)
+            if os.path.exists(path):
+                name = os.path.basename(os.path.realpath(path))
+            self._names[device] = name
+        return name
+
+    def collect(self) -> np.ndarray:
+        r"""Take one sample of the disk counters.
+
+        :return: Counters of the disks named by columns, as
+        '<disk>:<counter>'
+        """
+        disks = []
+        counters = []
+        # Lines as "8:0 rbytes=1 wbytes=2 rios=3 wios=4 dbytes=0 dios=0"
+        for line in bytes(self._stat.read()).splitlines():
+            device, *fields = line.split()
+            values = dict(field.split(b'=') for field in fields)
+            disks.append(device)
+            counters.append([values.get(field, b'0')
+                             for field in IO_STAT_FIELDS])
+
+        if disks != self._disks:
+            # The cgroup did I/O on a new disk, the columns are a new list so
+            # the buffers find the positions of the names again
+            self._disks = disks
+            self.columns = [f'{self.disk_name(disk)}:{field}'
+                            for disk in disks for field in self.fields]
+            self._sample = np.zeros(len(self.columns))
+        sample = self._sample.reshape(len(disks), len(self.fields))
+        for row, values in zip(sample, counters):
+            row[:] = list(map(int, values))
+        return self._sample
+
+
+class CgroupPressureCollector(procfs.ProcPressureCollector):
+    """Pressure stall information (PSI) of the cgroup."""
+
+    def __init__(self, cgroup: Cgroup = None) -> None:
+        r"""Open the pressure files and take the first reading.
+
+        :param cgroup: Cgroup to be sampled, defaults to None (the cgroup of
+        this process)
+        """
+        self.cgroup = cgroup or Cgroup()
+        super().__init__()
+
+    def _paths(self) -> list:
+        return [(resource,
+                 os.path.join(self.cgroup.path, f'{resource}.pressure'))
+                for resource in self.resources]
+
+
+# Collectors of a cgroup by name, as COLLECTORS
+CGROUP_COLLECTORS = {
+    collector.name: collector
+    for collector in (
+        CgroupCpuCollector,
+        CgroupMemoryCollector,
+        CgroupSwapCollector,
+        CgroupDiskIOCollector,
+        CgroupPressureCollector,
+    )
+}
+
+
+def collector(name: str, cgroup: Cgroup = None, **options) -> object:
+    r"""Create the collector of a metric family for a cgroup.
+
+    :param name: Collector name (e.g. 'cpu', 'memory')
+    :param cgroup: Cgroup to be sampled, defaults to None (the cgroup of
+    this process)
+    :param options: Arguments of the collectors of the host
+    :return: Collector of the cgroup, or the one of the host (see procfs.py)
+    for the metrics that aren't part of the cgroup (e.g. the network) or
+    whose files are missing (e.g. a controller not enabled)
+    """
+    if name in CGROUP_COLLECTORS:
+        try:
+            return CGROUP_COLLECTORS[name](cgroup)
+        except (OSError, ValueError, IndexError):
+            pass
+    return procfs.collector(name, **options)
@@ -0,0 +1,424 @@
+"""
+Command line interface of the hardware report, without the frontend.
+
+    collect: Sample the machine and persist the samples in a metrics store
+        (the collector daemon, see daemon.py)
+    render: Create the report of one window from the metrics store
+    batch: Create the reports of consecutive windows (e.g. one per hour)
+        from the metrics store
+    rollup: Write the rollups of the samples stored before they were kept
+        (see rollup.py), for the reports of long windows
+    agent: Sample the machine and push the samples to a fleet aggregator
+    aggregate: Receive the samples of a fleet and create the fleet report
+        (see fleet.py)
+
+The reports of a batch are created one after the other, so the memory used
+is the one of a single window, and their plots are rendered over one pool of
+worker processes that is kept for the whole batch.
+
+Run it with:
+    python cli.py collect --path metrics --interval 1
+    python cli.py render --start 2023-02-08T12:00 --stop 2023-02-08T13:00
+    python cli.py batch --start 2023-02-08 --stop 2023-02-09 --window 3600
+"""
+import argparse
+import datetime as dt
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+
+import daemon
+import fleet
+import numpy as np
+import rollup
+from daemon import DEFAULT_STORE_PATH
+from report import HardwareReport
+from store import MetricsStore, to_datetime_index, to_epoch_ns
+
+# Sections of the report that can be enabled
+SECTIONS = ('system', 'cpu', 'memory', 'disk', 'network')
+
+# Default directory of the reports of a batch
+DEFAULT_OUTPUT_PATH = 'reports'
+
+# Samples read at once to write the rollups of a store (a day at 1 Hz)
+ROLLUP_CHUNK = 24 * 60 * 60
+
+
+def windows(start: dt.datetime, stop: dt.datetime, length: float) -> list:
+    r"""Split a time range into consecutive windows.
+
+    :param start: Start of the time range
+    :param stop: End of the time range
+    :param length: Length of each window in seconds, the last one can be
+    shorter
+    :return: List of (start, stop) of the windows
+    """
+    if length <= 0:
+        raise ValueError('The window length must be positive')
+    step = dt.timedelta(seconds=length)
+    bounds = []
+    while start < stop:
+        bounds.append((start, min(start + step, stop)))
+        start += step
+    return bounds
+
+
+def floor_time(moment: dt.datetime, length: float) -> dt.datetime:
+    r"""Round a datetime down to a whole number of windows since midnight.
+
+    e.g. with windows of one hour, 12:03:27 => 12:00:00
+
+    :param moment: Datetime to be rounded
+    :param length: Length of the windows in seconds, longer windows than a
+    day start at midnight
+    :return: Start of the window of the datetime
+    """
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = (moment - midnight).total_seconds()
+    return midnight + dt.timedelta(seconds=elapsed - elapsed % min(
+        length, 24 * 60 * 60))
+
+
+def store_range(store: MetricsStore) -> tuple:
+    r"""Get the time range of all the samples of a store.
+
+    :param store: Metrics store
+    :return: Local datetimes of the first and last samples, or None if the
+    store is empty
+    """
+    bounds = [store.time_range(name) for name in store.families()]
+    bounds = [bound for bound in bounds if bound is not None]
+    if not bounds:
+        return None
+    first, last = to_datetime_index(np.array([
+        min(bound[0] for bound in bounds),
+        max(bound[1] for bound in bounds),
+    ], dtype=np.int64)).floor('us')
+    return first.to_pydatetime(), last.to_pydatetime()
+
+
+def render(
+    store: MetricsStore,
+    start: dt.datetime,
+    stop: dt.datetime,
+    output: str = None,
+    **options,
+) -> str:
+    r"""Create the report of one window from a metrics store.
+
+    :param store: Metrics store with the samples of the window
+    :param start: Start of the window
+    :param stop: End of the window
+    :param output: Path with the filename of the PDF file, defaults to None
+    (Hardware_Report_<current time>.pdf)
+    :param options: Other arguments of HardwareReport, e.g. the sections
+    :return: Path with the filename of the PDF file
+    """
+    report = HardwareReport(
+        start_time=start,
+        stop_time=stop,
+        store=store,
+        output=output,
+        **options,
+    )
+    report.generate_pdf()
+    if report.overhead:
+        # The footprint of the report is also saved next to the PDF file
+        report.write_overhead(
+            os.path.splitext(report.canvas.filename)[0] + '.json')
+    return report.canvas.filename
+
+
+def batch(
+    store: MetricsStore,
+    start: dt.datetime,
+    stop: dt.datetime,
+    length: float = 3600.0,
+    output_path: str = DEFAULT_OUTPUT_PATH,
+    workers: int = None,
+    host: str = None,
+    skip_empty: bool = True,
+    **options,
+) -> list:
+    r"""Create the reports of consecutive windows from a metrics store.
+
+    :param store: Metrics store with the samples of the windows
+    :param start: Start of the first window
+    :param stop: End of the last window
+    :param length: Length of each window in seconds, defaults to 3600.0
+    :param output_path: Directory of the PDF files, defaults to 'reports'
+    :param workers: Processes rendering the plots, defaults to None (the
+    number of CPUs)
+    :param host: Name of the machine in the filenames, defaults to None
+    (this machine)
+    :param skip_empty: Don't create the reports of the windows without any
+    sample, defaults to True
+    :param options: Other arguments of HardwareReport, e.g. the sections
+    :return: Paths with the filenames of the PDF files
+    """
+    os.makedirs(output_path, exist_ok=True)
+    host = host or socket.gethostname()
+    workers = workers or os.cpu_count() or 1
+
+    # The vector charts are drawn in this process, only the raster plots
+    # use the pool. The workers import matplotlib once for the whole batch.
+    pool = None
+    if options.get('chart_format', 'raster') == 'raster' and workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+
+    filenames = []
+    try:
+        for window_start, window_stop in windows(start, stop, length):
+            if skip_empty and not any(
+                    store.count(name, to_epoch_ns(window_start),
+                                to_epoch_ns(window_stop))
+                    for name in store.families()):
+                continue
+            filename = os.path.join(
+                output_path,
+                f'Hardware_Report_{host}_{window_start:%Y_%m_%d_%H_%M_%S}.pdf',
+            )
+            filenames.append(render(
+                store,
+                window_start,
+                window_stop,
+                filename,
+                render_workers=workers,
+                render_pool=pool,
+                **options,
+            ))
+            print(filename)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return filenames
+
+
+def write_rollups(store: MetricsStore) -> list:
+    r"""Write the rollups of the metric families of a store without any.
+
+    e.g. the samples collected before the rollups were kept, the families
+    with rollups are left as they are.
+
+    :param store: Metrics store
+    :return: Names of the families whose rollups were written
+    """
+    names = []
+    writer = store.writer()
+    try:
+        for name in store.families():
+            if name in rollup.EXCLUDED or any(
+                    store.segments(rollup.family(name, tier))
+                    for tier in rollup.TIERS):
+                continue
+            for segment in store.segments(name):
+                for timestamps, values in segment.blocks(ROLLUP_CHUNK):
+                    writer.write_rollups(name, timestamps, values,
+                                         segment.columns)
+            names.append(name)
+    finally:
+        writer.close()
+    return names
+
+
+def address(value: str) -> tuple:
+    r"""Parse a network address.
+
+    :param value: Address as host:port
+    :return: Host and port
+    """
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def parse_args() -> argparse.Namespace:
+    r"""Parse the arguments of the command line.
+
+    :return: Arguments of the command
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    collect = commands.add_parser(
+        'collect', help='sample the machine into a metrics store')
+    collect.add_argument(
+        '--path', default=DEFAULT_STORE_PATH,
+        help='directory of the metrics store')
+    collect.add_argument(
+        '--interval', type=float, default=1.0,
+        help='time in seconds between two samples')
+    collect.add_argument(
+        '--flush-interval', type=float, default=10.0,
+        help='time in seconds between two writes to the files')
+    collect.add_argument(
+        '--duration', type=float,
+        help='time in seconds to sample, by default until interrupted')
+    collect.add_argument(
+        '--cgroup', action='store_true',
+        help='sample the cgroup of the process against its limits (e.g. in '
+             'a container) instead of the host')
+
+    for name, description in (
+            ('render', 'create the report of one window'),
+            ('batch', 'create the reports of consecutive windows')):
+        command = commands.add_parser(name, help=description)
+        command.add_argument(
+            '--path', default=DEFAULT_STORE_PATH,
+            help='directory of the metrics store')
+        command.add_argument(
+            '--start', type=dt.datetime.fromisoformat,
+            required=name == 'render',
+            help='start of the window (ISO format, local time), by default '
+                 'the first sample of the store')
+        command.add_argument(
+            '--stop', type=dt.datetime.fromisoformat,
+            required=name == 'render',
+            help='end of the window (ISO format, local time), by default '
+                 'the last sample of the store')
+        command.add_argument(
+            '--sections', nargs='+', choices=SECTIONS, default=SECTIONS,
+            help='sections of the report')
+        command.add_argument(
+            '--chart-format', choices=('raster', 'vector'), default='raster',
+            help='PNG images or vector graphics')
+        command.add_argument(
+            '--decimation', choices=('minmax', 'lttb'), default='minmax',
+            help='method used to reduce the plotted points')
+        command.add_argument(
+            '--workers', type=int,
+            help='processes rendering the plots, by default the CPUs')
+        command.add_argument(
+            '--overhead', action='store_true',
+            help='append a page with the time spent creating the report, '
+                 'also saved as JSON next to the PDF file')
+
+    rollups = commands.add_parser(
+        'rollup', help='write the rollups of the samples stored without them')
+    rollups.add_argument(
+        '--path', default=DEFAULT_STORE_PATH,
+        help='directory of the metrics store')
+
+    agent = commands.add_parser(
+        'agent', help='push the samples to a fleet aggregator')
+    agent.add_argument(
+        '--address', type=address, required=True,
+        help='host:port of the aggregator')
+    agent.add_argument(
+        '--host', help='name of the machine in the fleet')
+    agent.add_argument(
+        '--interval', type=float, default=1.0,
+        help='time in seconds between two samples')
+    agent.add_argument(
+        '--push-interval', type=float, default=5.0,
+        help='time in seconds between two pushes')
+
+    aggregate = commands.add_parser(
+        'aggregate', help='receive the samples of a fleet')
+    aggregate.add_argument(
+        '--address', type=address,
+        default=('127.0.0.1', fleet.DEFAULT_PORT),
+        help='host:port to listen on')
+    aggregate.add_argument(
+        '--duration', type=float,
+        help='time in seconds to receive samples, by default until '
+             'interrupted')
+    aggregate.add_argument(
+        '--output', help='filename of the PDF file')
+    aggregate.add_argument(
+        '--top', type=int, default=10,
+        help='number of hosts in the top tables')
+    aggregate.add_argument(
+        '--synthetic-agents', type=int, default=0,
+        help='agents with made-up samples started on loopback, to try the '
+             'fleet report on one machine')
+
+    commands.choices['render'].add_argument(
+        '--output', help='filename of the PDF file')
+    batch_command = commands.choices['batch']
+    batch_command.add_argument(
+        '--window', type=float, default=3600.0,
+        help='length of each window in seconds')
+    batch_command.add_argument(
+        '--output-path', default=DEFAULT_OUTPUT_PATH,
+        help='directory of the PDF files')
+    batch_command.add_argument(
+        '--host', help='name of the machine in the filenames')
+    batch_command.add_argument(
+        '--keep-empty', action='store_true',
+        help='also create the reports of the windows without samples')
+    return parser.parse_args()
+
+
+def main() -> None:
+    r"""Run the command of the command line."""
+    args = parse_args()
+    if args.command == 'collect':
+        stop_time = None
+        if args.duration is not None:
+            stop_time = dt.datetime.now() + dt.timedelta(seconds=args.duration)
+        try:
+            daemon.run(args.path, args.interval, stop_time,
+                       args.flush_interval, args.cgroup)
+        except FileNotFoundError as error:
+            # e.g. --cgroup outside of a cgroup v2
+            raise SystemExit(str(error))
+        return
+    if args.command == 'agent':
+        try:
+            fleet.FleetAgent(
+                args.address, args.host, args.interval, args.push_interval,
+            ).run()
+        except KeyboardInterrupt:
+            pass
+        return
+    if args.command == 'aggregate':
+        print(fleet.run_aggregator(
+            args.address, args.duration, args.output, args.top,
+            args.synthetic_agents,
+        ))
+        return
+
+    if not os.path.isdir(args.path):
+        raise SystemExit(f'No metrics store at {args.path!r}')
+    store = MetricsStore(args.path)
+    if args.command == 'rollup':
+        for name in write_rollups(store):
+            print(name)
+        return
+    options = {section: section in args.sections for section in SECTIONS}
+    options.update(
+        chart_format=args.chart_format,
+        decimation=args.decimation,
+        overhead=args.overhead,
+    )
+
+    if args.command == 'render':
+        print(render(store, args.start, args.stop, args.output,
+                     render_workers=args.workers, **options))
+        return
+
+    start, stop = args.start, args.stop
+    if start is None or stop is None:
+        bounds = store_range(store)
+        if bounds is None:
+            raise SystemExit(f'No samples in {args.path!r}')
+        # The windows start at a round time, e.g. on the hour
+        start = start or floor_time(bounds[0], args.window)
+        # The last sample is inside the last window
+        stop = stop or bounds[1] + dt.timedelta(microseconds=1)
+    batch(
+        store,
+        start,
+        stop,
+        args.window,
+        args.output_path,
+        args.workers,
+        args.host,
+        not args.keep_empty,
+        **options,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Compressed encoding of the samples of the metrics store.
+
+The samples of a segment of the store are encoded in chunks of rows (see
+store.py), each with everything needed to decode it, so the rows of a time
+window are read by decoding only the chunks that overlap it. The encoding
+is lossless and decoded with a few vectorized NumPy operations per chunk:
+
+    timestamps: The first timestamp, the first difference and the
+        differences of the differences (delta-of-delta), which are all zero
+        on a regular grid and small with the jitter of the ticks, in the
+        narrowest of int8, int16, int32 or int64 that fits them all
+    decimal columns: The columns whose values have at most a few decimals
+        (e.g. the CPU percentages rounded to 0.1, the byte counts, the I/O
+        counters) are scaled to integers, and kept as their first value and
+        the differences between consecutive rows, in the narrowest integer
+        type that fits them (e.g. int8 or int16 for a CPU percentage)
+    other columns: The bits of each float are XORed with the ones of the
+        previous row (as in Gorilla), which leaves mostly zero bytes for
+        the series that change slowly (and keeps the NaNs of missing values)
+
+The differences and the XORs are then split in byte planes (the same byte
+of every value next to each other, as the Blosc shuffle) and compressed with
+zlib, which packs the runs of zero (or 0xff) high bytes that the bit-level
+encoding of Gorilla would pack, without a loop over the values.
+
+A chunk is made of:
+
+    header          rows, columns and the width of the delta-of-delta
+                    timestamps
+    timestamps      int64 first, int64 first difference and the
+                    delta-of-delta
+    columns         decimals (-1 for XOR) and width of each column
+    first row       int64 scaled values (or float bits for XOR)
+    values          zlib of the byte planes of the differences of the
+                    columns of each width, then of the XORs
+"""
+import struct
+import zlib
+
+import numpy as np
+
+# Rows per chunk (an hour at 1 Hz)
+CHUNK_SAMPLES = 60 * 60
+
+# Most decimals of the values encoded as integers
+MAX_DECIMALS = 4
+
+# Integers exactly represented by a float64
+MAX_EXACT_INTEGER = 2**53
+
+# Byte widths of the integers of the differences
+WIDTHS = (1, 2, 4, 8)
+
+# Rows, columns and width of the delta-of-delta timestamps
+HEADER = struct.Struct('<IIB')
+
+# zlib level of the values, favoring the speed of the writer
+ZLIB_LEVEL = 1
+
+
+def narrowest(low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    r"""Get the narrowest signed integer width fitting ranges of values.
+
+    :param low: Minimum of each range
+    :param high: Maximum of each range
+    :return: Width in bytes (1, 2, 4 or 8) of each range
+    """
+    widths = np.full(np.shape(low), 8, dtype=np.uint8)
+    for width in reversed(WIDTHS[:-1]):
+        limit = 2**(8 * width - 1)
+        widths[(low >= -limit) & (high < limit)] = width
+    return widths
+
+
+def decimals(values: np.ndarray) -> np.ndarray:
+    r"""Find the fewest decimals that represent every value of each column.
+
+    :param values: 2D array of float values with a column per series
+    :return: Number of decimals of each column (0 for integers), -1 for the
+    columns with more than MAX_DECIMALS, values that aren't finite or -0.0
+    """
+    counts = np.full(values.shape[1], -1, dtype=np.int8)
+    # -0.0 equals 0.0 but would be decoded as 0.0, only the bits keep its sign
+    signed = (np.signbit(values) & (values == 0)).any(axis=0)
+    for count in range(MAX_DECIMALS + 1):
+        pending = np.flatnonzero((counts < 0) & ~signed)
+        if not len(pending):
+            break
+        scale = 10.0**count
+        subset = values[:, pending]
+        with np.errstate(invalid='ignore'):
+            integers = np.rint(subset * scale)
+            exact = ((integers / scale == subset).all(axis=0)
+                     & (np.abs(integers).max(axis=0, initial=0)
+                        < MAX_EXACT_INTEGER))
+        counts[pending[exact]] = count
+    return counts
+
+
+def planes(array: np.ndarray) -> bytes:
+    r"""Split a 2D array of values in byte planes.
+
+    :param array: 2D array with a row per sample and a column per series
+    :return: Bytes of every value, the first byte of each value of the
+    first column (in the order of the rows) first, then of the next columns,
+    and the same for the next bytes
+    """
+    rows, columns = array.shape
+    return np.ascontiguousarray(array).view(np.uint8).reshape(
+        rows, columns, array.itemsize).transpose(2, 1, 0).tobytes()
+
+
+def from_planes(
+    buffer: bytes,
+    offset: int,
+    dtype: object,
+    rows: int,
+    columns: int,
+) -> np.ndarray:
+    r"""Join byte planes back into a 2D array of values (see planes).
+
+    :param buffer: Bytes of the planes
+    :param offset: Position of the first byte of the planes in the buffer
+    :param dtype: NumPy type of the values
+    :param rows: Number of rows of the array
+    :param columns: Number of columns of the array
+    :return: 2D array with a row per sample and a column per series
+    """
+    dtype = np.dtype(dtype)
+    bytes_ = np.frombuffer(buffer, np.uint8, rows * columns * dtype.itemsize,
+                           offset)
+    return np.ascontiguousarray(
+        bytes_.reshape(dtype.itemsize, columns, rows).transpose(2, 1, 0)
+    ).view(dtype).reshape(rows, columns)
+
+
+def encode(timestamps: np.ndarray, values: np.ndarray) -> bytes:
+    r"""Encode a chunk of samples.
+
+    :param timestamps: Epoch times of the samples in nanoseconds, in order
+    :param values: 2D array with a row per sample and a column per series
+    :return: Encoded chunk
+    """
+    rows, columns = values.shape
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    deltas = np.diff(timestamps)
+    steps = np.diff(deltas)
+    step_width = int(narrowest(steps.min(initial=0), steps.max(initial=0)))
+
+    if values.dtype.kind in 'iub':
+        counts = np.zeros(columns, dtype=np.int8)
+    else:
+        values = np.asarray(values, dtype=np.float64)
+        counts = decimals(values)
+    scaled = counts >= 0
+    integers = np.empty((rows, columns), dtype=np.int64)
+    if scaled.all():
+        integers[:] = (np.rint(values * 10.0**counts) if counts.any()
+                       else values)
+    else:
+        integers[:, scaled] = np.rint(
+            values[:, scaled] * 10.0**counts[scaled])
+        integers[:, ~scaled] = values[:, ~scaled].view(np.int64)
+
+    differences = np.diff(integers, axis=0)
+    widths = np.full(columns, 8, dtype=np.uint8)
+    widths[scaled] = narrowest(differences[:, scaled].min(axis=0, initial=0),
+                               differences[:, scaled].max(axis=0, initial=0))
+    # The bits of the other columns are XORed instead
+    differences[:, ~scaled] = integers[1:, ~scaled] ^ integers[:-1, ~scaled]
+
+    # A chunk without rows (or without a difference) keeps the same layout
+    first = np.zeros((1, columns), dtype=np.int64)
+    first[:rows] = integers[:1]
+    return b''.join([
+        HEADER.pack(rows, columns, step_width),
+        (timestamps[:1] if rows else np.zeros(1, np.int64)).tobytes(),
+        (deltas[:1] if len(deltas) else np.zeros(1, np.int64)).tobytes(),
+        steps.astype(f'<i{step_width}').tobytes(),
+        counts.tobytes(),
+        widths.tobytes(),
+        first.tobytes(),
+        zlib.compress(b''.join(
+            planes(differences[:, group].astype(f'<i{width}'))
+            for width, group in _groups(counts, widths)
+        ), ZLIB_LEVEL),
+    ])
+
+
+def _groups(counts: np.ndarray, widths: np.ndarray) -> list:
+    # Width and columns of each group of values, the XORs last
+    groups = [(width, np.flatnonzero((widths == width) & (counts >= 0)))
+              for width in WIDTHS]
+    groups.append((8, np.flatnonzero(counts < 0)))
+    return [(width, group) for width, group in groups if len(group)]
+
+
+def decode_timestamps(chunk: object) -> np.ndarray:
+    r"""Decode the timestamps of a chunk only.
+
+    :param chunk: Encoded chunk (bytes or a buffer, e.g. of a memmap)
+    :return: Epoch times of the samples in nanoseconds
+    """
+    return _decode_timestamps(chunk)[0]
+
+
+def _decode_timestamps(chunk: object) -> tuple:
+    # Timestamps of a chunk and the offset of its values
+    rows, _, step_width = HEADER.unpack_from(chunk)
+    offset = HEADER.size
+    first, delta = np.frombuffer(chunk, np.int64, 2, offset)
+    offset += 16
+    steps = np.frombuffer(chunk, f'<i{step_width}', max(rows - 2, 0), offset)
+    offset += steps.nbytes
+    timestamps = np.empty(rows, dtype=np.int64)
+    timestamps[:1] = 0
+    if rows > 1:
+        # The differences are the first one plus the sums of the steps
+        differences = timestamps[1:]
+        differences[0] = delta
+        np.cumsum(steps, out=differences[1:])
+        differences[1:] += delta
+    np.cumsum(timestamps, out=timestamps)
+    timestamps += first
+    return timestamps, offset
+
+
+def decode(chunk: object, dtype: object = np.float64) -> tuple:
+    r"""Decode a chunk of samples.
+
+    :param chunk: Encoded chunk (bytes or a buffer, e.g. of a memmap)
+    :param dtype: NumPy type of the values, defaults to np.float64
+    :return: Timestamps and values (one row per timestamp)
+    """
+    rows, columns, _ = HEADER.unpack_from(chunk)
+    timestamps, offset = _decode_timestamps(chunk)
+    counts = np.frombuffer(chunk, np.int8, columns, offset)
+    offset += columns
+    widths = np.frombuffer(chunk, np.uint8, columns, offset)
+    offset += columns
+    integers = np.empty((rows, columns), dtype=np.int64)
+    integers[:1] = np.frombuffer(chunk, np.int64, columns, offset)
+    offset += 8 * columns
+
+    differences = zlib.decompress(chunk[offset:])
+    offset = 0
+    for width, group in _groups(counts, widths):
+        count = len(group)
+        if count == columns:
+            # Every column in one group, without fancy indexing
+            group = slice(None)
+        if rows > 1:
+            integers[1:, group] = from_planes(
+                differences, offset, f'<i{width}', rows - 1, count)
+            offset += (rows - 1) * count * width
+
+    scaled = counts >= 0
+    if scaled.all():
+        np.cumsum(integers, axis=0, out=integers)
+        if np.dtype(dtype).kind != 'f':
+            return timestamps, integers.astype(dtype, copy=False)
+        values = integers / 10.0**counts
+        return timestamps, values.astype(dtype, copy=False)
+
+    integers[:, scaled] = np.cumsum(integers[:, scaled], axis=0)
+    integers[:, ~scaled] = np.bitwise_xor.accumulate(
+        integers[:, ~scaled], axis=0)
+    values = integers.view(np.float64)
+    values[:, scaled] = integers[:, scaled] / 10.0**counts[scaled]
+    return timestamps, values.astype(dtype, copy=False)
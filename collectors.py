@@ -0,0 +1,425 @@
+"""
+Collectors that take one sample of a device on each tick of the sampler.
+
+Every collector has a ``name`` (the key of its data in the sampler) and a
+``collect()`` method returning a dict with the values of the current tick.
+"""
+import collections
+import heapq
+import time
+
+import numpy as np
+import psutil
+
+
+class CpuCollector:
+    """Per-core and total CPU utilization.
+
+    Both come from the same pair of ``psutil.cpu_times(percpu=True)``
+    readings: the utilization is the busy share of the time elapsed on each
+    core since the previous tick, and the total is the busy share of the
+    time elapsed on all the cores. Nothing sleeps inside collect(), so the
+    interval is set by the sampler alone (sub-second intervals included).
+    """
+
+    name = 'cpu'
+
+    # Times not spent doing work
+    idle_fields = ('idle', 'iowait')
+    # On Linux the guest times are already part of user and nice
+    guest_fields = ('guest', 'guest_nice')
+
+    def __init__(self) -> None:
+        r"""Take the first reading, used as reference for the first tick."""
+        self._previous = self._read()
+        self._set_fields(psutil.cpu_times()._fields)
+        self._set_columns(len(self._previous))
+
+    def _set_fields(self, fields: tuple) -> None:
+        # Types of CPU time of the columns of a reading
+        self._idle = np.array([field in self.idle_fields
+                               for field in fields])
+        self._counted = np.array([field not in self.guest_fields
+                                  for field in fields])
+
+    def _read(self) -> np.ndarray:
+        # One row per core and one column per type of CPU time
+        return np.array(psutil.cpu_times(percpu=True), dtype=np.float64)
+
+    def _set_columns(self, cores: int) -> None:
+        self.columns = [f'Core_{i}' for i in range(cores)] + ['Total']
+
+    def collect(self) -> np.ndarray:
+        r"""Take one CPU sample.
+
+        :return: Percentage of each core and of the whole system
+        """
+        current = self._read()
+        if current.shape != self._previous.shape:
+            # A core went online or offline, the new reading becomes the
+            # reference for the next tick and this sample is missing (not a
+            # dip to 0% in the charts and the statistics)
+            self._previous = current
+            self._set_columns(len(current))
+            return np.full(len(self.columns), np.nan)
+
+        delta = current - self._previous
+        self._previous = current
+
+        elapsed = delta[:, self._counted].sum(axis=1)
+        busy = np.clip(
+            elapsed - delta[:, self._idle & self._counted].sum(axis=1),
+            0,
+            None,
+        )
+        sample = np.empty(len(self.columns))
+        # Cores without any elapsed time (very short interval) are idle
+        np.divide(busy, elapsed, out=sample[:-1],
+                  where=elapsed > 0)
+        sample[:-1][elapsed <= 0] = 0.0
+        total_elapsed = elapsed.sum()
+        sample[-1] = busy.sum() / total_elapsed if total_elapsed > 0 else 0.0
+        return np.clip(sample * 100, 0, 100).round(1)
+
+
+class MemoryCollector:
+    """Physical memory usage, in bytes."""
+
+    name = 'memory'
+    dtype = np.int64
+
+    def collect(self) -> dict:
+        r"""Take one memory sample.
+
+        :return: Total, available and used memory in bytes
+        """
+        # Statistics about system memory usage, read again on every tick
+        svmem = psutil.virtual_memory()
+        return {
+            # The total physical memory (exclusive swap)
+            'Total': svmem.total,
+            # The memory to processes without the system going into swap
+            'Available': svmem.available,
+            # Memory used, calculated differently depending on the platform
+            # and designed for informational purposes only
+            'Used': svmem.used,
+        }
+
+
+class SwapCollector:
+    """Swap memory usage, in bytes."""
+
+    name = 'swap'
+    dtype = np.int64
+
+    def collect(self) -> dict:
+        r"""Take one swap sample.
+
+        :return: Total, free and used swap in bytes
+        """
+        # System swap memory statistics, read again on every tick
+        swap = psutil.swap_memory()
+        return {
+            # The total swap memory
+            'Total': swap.total,
+            # Free: Memory not being used at all that is readily available;
+            # note that this doesn’t reflect the actual memory available
+            'Free': swap.free,
+            # Used swap memory
+            'Used': swap.used,
+        }
+
+
+class DiskIOCollector:
+    """Cumulative I/O counters of each disk.
+
+    The counters are stored as they are, the throughput and IOPS are
+    computed from their differences when the report is generated (see
+    utils.counter_rates). They are stored as floats, so a disk that shows
+    up during the analysis has a missing (NaN) history instead of zeros.
+    """
+
+    name = 'disk_io'
+    fields = ('read_bytes', 'write_bytes', 'read_count', 'write_count')
+
+    def collect(self) -> dict:
+        r"""Take one sample of the disk counters.
+
+        :return: Counters named as '<disk>:<counter>'
+        """
+        # psutil already handles the counters that wrap around (nowrap)
+        counters = psutil.disk_io_counters(perdisk=True, nowrap=True) or {}
+        return {
+            f'{disk}:{field}': getattr(io, field)
+            for disk, io in counters.items()
+            for field in self.fields
+        }
+
+
+class NetIOCollector:
+    """Cumulative I/O counters of each NIC (network interface card).
+
+    As for the disks, the rates are computed when the report is generated
+    and a NIC plugged in (or out) during the analysis has missing values
+    for the time it wasn't there.
+    """
+
+    name = 'net_io'
+    fields = ('bytes_recv', 'bytes_sent', 'packets_recv', 'packets_sent')
+
+    def collect(self) -> dict:
+        r"""Take one sample of the network counters.
+
+        :return: Counters named as '<nic>:<counter>'
+        """
+        counters = psutil.net_io_counters(pernic=True, nowrap=True)
+        return {
+            f'{nic}:{field}': getattr(io, field)
+            for nic, io in counters.items()
+            for field in self.fields
+        }
+
+
+class ProcessCollector:
+    """CPU and memory of the heaviest processes, to attribute the spikes.
+
+    Each tick keeps a bounded top: the ``top`` processes using the most CPU
+    and the ``top`` using the most memory (RSS), as ranks named
+    '<rank>:pid', '<rank>:cpu' and '<rank>:rss' ordered by CPU, with NaN
+    for the unused ranks. The CPU is a percentage of one CPU (as in top),
+    so a process running on many cores goes above 100 %.
+
+    The process table isn't rebuilt on every tick: the psutil.Process
+    handles are cached by PID, and only the PIDs that started or exited
+    since the previous tick are added or removed. Reading every process
+    would still cost a few milliseconds per hundred processes, so a tick
+    reads at most ``budget`` of them: the current top, then the others in
+    turn (the new processes first). The usage of the processes not read
+    on a tick is their usage at their previous reading, so on a host with
+    more processes than the budget the overhead of a tick stays the same
+    and a new heavy process shows up within a few ticks.
+    """
+
+    name = 'processes'
+    fields = ('pid', 'cpu', 'rss')
+
+    def __init__(self, top: int = 10, budget: int = 500) -> None:
+        r"""Read the processes running.
+
+        :param top: Processes kept by CPU and by memory on each tick,
+        defaults to 10
+        :param budget: Maximum number of processes read on each tick,
+        defaults to 500
+        """
+        if top <= 0 or budget <= 0:
+            raise ValueError('The top and the budget must be positive')
+        self.top = top
+        self.budget = max(budget, 2 * top)
+        self.columns = [f'{rank}:{field}'
+                        for rank in range(2 * top) for field in self.fields]
+        # Name of each PID that was in the top, to label the ranks
+        self.names = {}
+        # Cached handle and last reading of each process: handle, name, CPU
+        # time in seconds, time of the reading, CPU percentage and RSS
+        self._processes = {}
+        # PIDs still to be read in the current turn
+        self._queue = collections.deque()
+        self._ranked = []
+        self._sample = np.full(len(self.columns), np.nan)
+        # First reading of every process, used as reference for the first
+        # tick
+        self._update_table()
+        for pid in list(self._processes):
+            self._read(pid)
+
+    def _pids(self) -> set:
+        return set(psutil.pids())
+
+    def _handle(self, pid: int) -> object:
+        return psutil.Process(pid)
+
+    def _read_process(self, handle: object, name: bool) -> tuple:
+        # Name (if asked), CPU time in seconds and RSS in bytes. Raises
+        # ProcessLookupError if the process exited and PermissionError if
+        # it can't be read (e.g. processes of other users on some systems).
+        try:
+            # One read of /proc/<pid>/stat for all the attributes on Linux
+            with handle.oneshot():
+                cpu_times = handle.cpu_times()
+                rss = handle.memory_info().rss
+                return (handle.name() if name else None,
+                        cpu_times.user + cpu_times.system, rss)
+        except psutil.NoSuchProcess as error:
+            raise ProcessLookupError(handle.pid) from error
+        except psutil.AccessDenied as error:
+            raise PermissionError(handle.pid) from error
+
+    def _update_table(self) -> None:
+        # Only the processes started or exited since the previous tick
+        pids = self._pids()
+        for pid in self._processes.keys() - pids:
+            del self._processes[pid]
+        new = pids - self._processes.keys()
+        for pid in new:
+            try:
+                self._processes[pid] = [self._handle(pid), None, None,
+                                        None, 0.0, 0]
+            except psutil.Error:
+                continue
+        # The new processes are read first, a spike often comes from one
+        self._queue.extendleft(new)
+
+    def _read(self, pid: int) -> None:
+        process = self._processes.get(pid)
+        if process is None:
+            return
+        try:
+            name, cpu_time, rss = self._read_process(
+                process[0], process[1] is None)
+        except ProcessLookupError:
+            del self._processes[pid]
+            return
+        except PermissionError:
+            return
+        now = time.monotonic()
+        if name is not None:
+            process[1] = name
+        if process[2] is not None and now > process[3]:
+            process[4] = max(cpu_time - process[2], 0.0) / (now - process[3])
+        process[2], process[3], process[5] = cpu_time, now, rss
+
+    def collect(self) -> np.ndarray:
+        r"""Take one sample of the heaviest processes.
+
+        :return: PID, CPU percentage and RSS in bytes of each rank, named by
+        columns
+        """
+        self._update_table()
+        # The current top is read on every tick, the others in turn
+        read = set()
+        for pid in self._ranked:
+            self._read(pid)
+            read.add(pid)
+        refilled = False
+        while len(read) < self.budget:
+            if not self._queue:
+                if refilled:
+                    # Every process was read on this tick
+                    break
+                self._queue.extend(self._processes)
+                refilled = True
+            pid = self._queue.popleft()
+            if pid not in read:
+                self._read(pid)
+                read.add(pid)
+
+        # Only the processes read on this tick are ranked: the others were
+        # below the top when they were last read. The idle processes (e.g.
+        # kernel threads) aren't ranked.
+        candidates = [(pid, self._processes[pid]) for pid in read
+                      if pid in self._processes]
+        by_cpu = heapq.nlargest(
+            self.top,
+            (item for item in candidates if item[1][4] > 0),
+            key=lambda item: item[1][4],
+        )
+        by_rss = heapq.nlargest(
+            self.top,
+            (item for item in candidates if item[1][5] > 0),
+            key=lambda item: item[1][5],
+        )
+        ranked = dict(by_cpu)
+        ranked.update(by_rss)
+        ranked = sorted(ranked.items(), key=lambda item: -item[1][4])
+        self._ranked = [pid for pid, _ in ranked]
+
+        sample = self._sample
+        sample[:] = np.nan
+        for rank, (pid, process) in enumerate(ranked):
+            self.names[pid] = process[1]
+            sample[3 * rank:3 * rank + 3] = pid, 100 * process[4], process[5]
+        return sample
+
+
+class SyntheticCpuCollector:
+    """Stand-in of CpuCollector with made-up values, without psutil.
+
+    Each core follows a random walk between 0 and 100 %, and the total is
+    their mean. Meant for tests and demos (e.g. many agents of a fleet on
+    one machine), seeded to be reproducible.
+    """
+
+    name = 'cpu'
+
+    def __init__(self, cores: int = 4, seed: int = None) -> None:
+        r"""Contain the initial arguments.
+
+        :param cores: Number of cores, defaults to 4
+        :param seed: Seed of the random walk, defaults to None
+        """
+        self._random = np.random.default_rng(seed)
+        self._usage = self._random.uniform(0, 100, cores)
+        self.columns = [f'Core_{i}' for i in range(cores)] + ['Total']
+
+    def collect(self) -> np.ndarray:
+        r"""Take one made-up CPU sample.
+
+        :return: Percentage of each core and of the whole system
+        """
+        self._usage = np.clip(
+            self._usage + self._random.normal(0, 5, len(self._usage)),
+            0,
+            100,
+        )
+        return np.append(self._usage, self._usage.mean()).round(1)
+
+
+class SyntheticMemoryCollector:
+    """Stand-in of MemoryCollector with made-up values, without psutil.
+
+    The used memory follows a random walk between 5 and 95 % of the total.
+    """
+
+    name = 'memory'
+    dtype = np.int64
+
+    def __init__(self, total: int = 16 * 1024**3, seed: int = None) -> None:
+        r"""Contain the initial arguments.
+
+        :param total: Total memory in bytes, defaults to 16 GB
+        :param seed: Seed of the random walk, defaults to None
+        """
+        self._random = np.random.default_rng(seed)
+        self.total = total
+        self._used = self._random.uniform(0.05, 0.95)
+
+    def collect(self) -> dict:
+        r"""Take one made-up memory sample.
+
+        :return: Total, available and used memory in bytes
+        """
+        self._used = float(np.clip(
+            self._used + self._random.normal(0, 0.02), 0.05, 0.95))
+        used = int(self.total * self._used)
+        return {
+            'Total': self.total,
+            'Available': self.total - used,
+            'Used': used,
+        }
+
+
+# Collectors by name, in the order of the report sections
+COLLECTORS = {
+    collector.name: collector
+    for collector in (
+        CpuCollector,
+        MemoryCollector,
+        SwapCollector,
+        DiskIOCollector,
+        NetIOCollector,
+    )
+}
+
+# Collectors that aren't in COLLECTORS, only sampled by the reports that ask
+# for them (the top of the processes costs more than the other collectors)
+OPTIONAL_COLLECTORS = {ProcessCollector.name: ProcessCollector}
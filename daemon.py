@@ -0,0 +1,91 @@
+"""
+Always-on collector that persists the samples in a metrics store.
+
+Reports can only sample the present, so to get reports of past windows (e.g.
+yesterday's incident) this daemon keeps sampling the machine and writing the
+samples to a store.MetricsStore, which HardwareReport then reads.
+
+Run it with:
+    python daemon.py --path metrics --interval 1
+"""
+import argparse
+import datetime as dt
+
+import collectors
+from sampler import Sampler
+from sources import CgroupSource, PsutilSource
+from store import MetricsStore
+
+# Default location of the metrics store
+DEFAULT_STORE_PATH = 'metrics'
+
+
+def run(
+    path: str = DEFAULT_STORE_PATH,
+    interval: float = 1.0,
+    stop_time: dt.datetime = None,
+    flush_interval: float = 10.0,
+    cgroup: bool = False,
+) -> None:
+    r"""Sample every collector and persist the samples until stopped.
+
+    :param path: Directory of the metrics store, defaults to 'metrics'
+    :param interval: Time in seconds between two samples, defaults to 1.0
+    :param stop_time: Time to stop sampling, defaults to None (until the
+    process is interrupted)
+    :param flush_interval: Time in seconds between two writes of the
+    buffered samples to the files, defaults to 10.0
+    :param cgroup: Sample the cgroup of the process against its limits
+    (e.g. in a container, see cgroup.py) instead of the host, defaults to
+    False
+    """
+    source = CgroupSource() if cgroup else PsutilSource()
+    store = MetricsStore(path)
+    # The reports of the store show the machine it was sampled on
+    store.write_machine_info(source.machine_info())
+    writer = store.writer()
+    # The buffers only keep the latest samples, the history is in the store
+    # (whose reports summarize the samples they read), with its rollups
+    # written by the writer
+    sampler = Sampler(
+        interval=interval,
+        stop_time=stop_time,
+        capacity=max(int(flush_interval / interval), 1) + 1,
+        stats_block=None,
+        rollups=False,
+    )
+    for name in [*collectors.COLLECTORS, 'pressure']:
+        collector = source.collector(name)
+        # e.g. no pressure stall information outside of Linux
+        if collector is not None:
+            sampler.add_collector(collector)
+    sampler.add_sink(writer.append)
+    sampler.start()
+    try:
+        # Join with a timeout, so the process can be interrupted
+        while not sampler.join(timeout=flush_interval):
+            writer.flush()
+    except KeyboardInterrupt:
+        sampler.stop()
+        sampler.join()
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--path', default=DEFAULT_STORE_PATH,
+        help='directory of the metrics store')
+    parser.add_argument(
+        '--interval', type=float, default=1.0,
+        help='time in seconds between two samples')
+    parser.add_argument(
+        '--flush-interval', type=float, default=10.0,
+        help='time in seconds between two writes to the files')
+    parser.add_argument(
+        '--cgroup', action='store_true',
+        help='sample the cgroup of the process against its limits')
+    args = parser.parse_args()
+    run(args.path, args.interval, flush_interval=args.flush_interval,
+        cgroup=args.cgroup)
@@ -0,0 +1,145 @@
+"""
+Decimation of the time series before they are plotted.
+
+A chart is only about a thousand pixels wide, so plotting more points than
+that only costs rendering time (and image size) without changing the
+picture. These functions reduce a Dataframe to a maximum number of points
+per series while keeping its peaks:
+
+    minmax: The rows are split into buckets and each bucket is replaced by
+        the minimum and the maximum of every column. Vectorized across all
+        the columns, which share the same index.
+    lttb: Largest-Triangle-Three-Buckets, keeps in each bucket the point
+        that forms the largest triangle with its neighbours, which follows
+        the shape of the series more closely.
+"""
+import numpy as np
+import pandas as pd
+
+
+def minmax_decimate(data: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    r"""Keep the minimum and maximum of each column in buckets of rows.
+
+    :param data: Dataframe indexed by datetime
+    :param max_points: Maximum number of rows of the result
+    :return: Dataframe with two rows per bucket: the minimum at the time of
+    its first row and the maximum at the time of its last row
+    """
+    buckets = max_points // 2
+    if len(data) <= max_points or buckets < 1:
+        return data
+
+    # Every bucket has at least two rows, so its first and last timestamps
+    # are different
+    bounds = np.linspace(0, len(data), buckets + 1).astype(np.intp)
+    starts, ends = bounds[:-1], bounds[1:] - 1
+    values = data.to_numpy(dtype=np.float64)
+    # fmin/fmax ignore the missing values, unless the whole bucket is missing
+    minimums = np.fmin.reduceat(values, starts, axis=0)
+    maximums = np.fmax.reduceat(values, starts, axis=0)
+
+    decimated = np.empty((2 * buckets, values.shape[1]))
+    decimated[0::2] = minimums
+    decimated[1::2] = maximums
+    rows = np.empty(2 * buckets, dtype=np.intp)
+    rows[0::2] = starts
+    rows[1::2] = ends
+    return pd.DataFrame(decimated, index=data.index[rows],
+                        columns=data.columns)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    r"""Select the points of a series with Largest-Triangle-Three-Buckets.
+
+    :param x: Position of the points, in increasing order
+    :param y: Value of the points
+    :param threshold: Number of points to keep
+    :return: Indices of the selected points
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    # The first and the last points are always kept, the others are split
+    # into threshold - 2 buckets
+    bounds = np.linspace(1, length - 1, threshold - 1).astype(np.intp)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, length - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        # Third vertex of the triangle: the average of the next bucket
+        if i + 2 < len(bounds):
+            next_x = x[stop:bounds[i + 2]].mean()
+            with np.errstate(invalid='ignore'):
+                next_y = np.nanmean(y[stop:bounds[i + 2]])
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        # Missing values are never selected, unless all of them are missing
+        previous = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[i + 1] = previous
+    return selected
+
+
+def lttb_decimate(data: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    r"""Decimate each column with Largest-Triangle-Three-Buckets.
+
+    The columns select different rows, so the result has the union of them
+    and each column is linearly interpolated on the rows it didn't select,
+    which draws exactly the same line.
+
+    :param data: Dataframe indexed by datetime
+    :param max_points: Maximum number of points kept per column
+    :return: Decimated Dataframe
+    """
+    if len(data) <= max_points:
+        return data
+
+    x = data.index.values.astype(np.int64).astype(np.float64)
+    values = data.to_numpy(dtype=np.float64)
+    selections = [lttb_indices(x, values[:, column], max_points)
+                  for column in range(values.shape[1])]
+    rows = np.unique(np.concatenate(selections))
+
+    decimated = np.full((len(rows), values.shape[1]), np.nan)
+    for column, selected in enumerate(selections):
+        position = np.searchsorted(rows, selected)
+        decimated[position, column] = values[selected, column]
+    decimated = pd.DataFrame(decimated, index=data.index[rows],
+                             columns=data.columns)
+    return decimated.interpolate(method='index', limit_area='inside')
+
+
+# Available decimation methods by name
+METHODS = {
+    'minmax': minmax_decimate,
+    'lttb': lttb_decimate,
+}
+
+
+def decimate(
+    data: pd.DataFrame,
+    max_points: int,
+    method: str = 'minmax',
+) -> pd.DataFrame:
+    r"""Reduce a Dataframe to a maximum number of points per series.
+
+    :param data: Dataframe indexed by datetime
+    :param max_points: Maximum number of points per series
+    :param method: 'minmax' or 'lttb', defaults to 'minmax'. None keeps all
+    the points.
+    :return: Decimated Dataframe
+    """
+    if method is None:
+        return data
+    if method not in METHODS:
+        raise ValueError(
+            f'Unknown decimation method {method!r}, '
+            f'expected one of {tuple(METHODS)}'
+        )
+    return METHODS[method](data, max_points)
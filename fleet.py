@@ -0,0 +1,559 @@
+"""
+Reports of a fleet of machines.
+
+Every machine runs a FleetAgent, which samples it like the report does and
+pushes the samples to a FleetAggregator over TCP, in batches. The aggregator
+keeps the samples of each host in its own ring buffers and creates the fleet
+report: the top hosts by CPU and memory usage, with a sparkline per host.
+
+The batches are sent as length-prefixed NumPy arrays::
+
+    uint32 header length | uint32 payload length
+    header   JSON with the host, family, columns, dtype and number of rows
+    payload  int64 timestamps (epoch nanoseconds), then the values with a
+             row per timestamp, both little-endian
+
+Run it with:
+    python cli.py aggregate --address 0.0.0.0:9100 --duration 3600
+    python cli.py agent --address aggregator:9100
+    python cli.py aggregate --duration 60 --synthetic-agents 20
+"""
+import datetime as dt
+import json
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+import pandas as pd
+import procfs
+import utils
+from collectors import SyntheticCpuCollector, SyntheticMemoryCollector
+from decimation import decimate
+from sampler import DEFAULT_CAPACITY, Sampler
+from store import RingBuffer, to_datetime_index, to_epoch_ns
+
+# Default TCP port of the aggregator
+DEFAULT_PORT = 9100
+
+# Lengths of the header and of the payload of a batch
+PREFIX = struct.Struct('<II')
+
+# Points of the sparklines
+SPARKLINE_POINTS = 120
+
+PdfBuilder = utils.PdfBuilder()
+
+
+def encode_batch(
+    host: str,
+    family: str,
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    columns: list,
+) -> bytes:
+    r"""Serialize a batch of samples.
+
+    :param host: Name of the machine that took the samples
+    :param family: Metric family (collector name)
+    :param timestamps: Epoch times of the samples in nanoseconds
+    :param values: 2D array with a row per sample and a column per series
+    :param columns: Names of the columns of the values
+    :return: Length-prefixed batch
+    """
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+    header = json.dumps({
+        'host': host,
+        'family': family,
+        'columns': list(columns),
+        'dtype': values.dtype.str,
+        'rows': len(timestamps),
+    }).encode()
+    payload = (np.ascontiguousarray(timestamps, dtype='<i8').tobytes()
+               + values.tobytes())
+    return PREFIX.pack(len(header), len(payload)) + header + payload
+
+
+def decode_batch(header: bytes, payload: bytes) -> tuple:
+    r"""Deserialize a batch of samples.
+
+    :param header: JSON header of the batch
+    :param payload: Timestamps and values of the batch
+    :return: Host, family, timestamps, values and columns
+    """
+    header = json.loads(header)
+    rows, columns = header['rows'], header['columns']
+    timestamps = np.frombuffer(payload, dtype='<i8', count=rows)
+    values = np.frombuffer(
+        payload, dtype=header['dtype'], offset=timestamps.nbytes,
+    ).reshape(rows, len(columns))
+    return header['host'], header['family'], timestamps, values, columns
+
+
+def read_batch(stream: object) -> tuple:
+    r"""Read the next batch of a stream.
+
+    :param stream: Binary file object, e.g. the file of a socket
+    :return: Batch (see decode_batch), or None at the end of the stream
+    """
+    prefix = stream.read(PREFIX.size)
+    if len(prefix) < PREFIX.size:
+        return None
+    header_length, payload_length = PREFIX.unpack(prefix)
+    header = stream.read(header_length)
+    payload = stream.read(payload_length)
+    if len(header) < header_length or len(payload) < payload_length:
+        return None
+    return decode_batch(header, payload)
+
+
+class FleetAgent:
+    """Sample this machine and push the samples to a fleet aggregator.
+
+    The samples are kept in the ring buffers of a Sampler until they are
+    pushed, so the aggregator can be restarted (or unreachable for a while)
+    without losing them, up to the capacity of the buffers.
+    """
+
+    def __init__(
+        self,
+        address: tuple,
+        host: str = None,
+        interval: float = 1.0,
+        push_interval: float = 5.0,
+        collectors: list = None,
+        capacity: int = DEFAULT_CAPACITY,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param address: Host and port of the aggregator
+        :param host: Name of this machine in the fleet, defaults to None
+        (the hostname)
+        :param interval: Time in seconds between two samples, defaults to
+        1.0
+        :param push_interval: Time in seconds between two pushes to the
+        aggregator, defaults to 5.0
+        :param collectors: Collectors to be sampled, defaults to None (the
+        CPU and memory collectors)
+        :param capacity: Maximum number of samples kept per collector until
+        they are pushed, defaults to DEFAULT_CAPACITY
+        """
+        self.address = address
+        self.host = host or socket.gethostname()
+        self.push_interval = push_interval
+        self.sampler = Sampler(interval=interval, capacity=capacity)
+        if collectors is None:
+            collectors = [procfs.collector('cpu'), procfs.collector('memory')]
+        for collector in collectors:
+            self.sampler.add_collector(collector)
+        # Timestamp of the last sample pushed of each collector
+        self._pushed = {}
+        self._connection = None
+        self._thread = None
+
+    def push(self) -> bool:
+        r"""Push the samples taken since the previous push.
+
+        :return: True if the aggregator received them, they are pushed again
+        next time otherwise
+        """
+        batches = []
+        with self.sampler.lock:
+            for name in self.sampler.collectors:
+                buffer = self.sampler.buffer(name)
+                start = self._pushed.get(name)
+                start = None if start is None else start + 1
+                timestamps = buffer.timestamps(start)
+                if len(timestamps):
+                    batches.append((name, np.array(timestamps),
+                                    np.array(buffer.values(start)),
+                                    list(buffer.columns)))
+        if not batches:
+            return True
+        try:
+            if self._connection is None:
+                self._connection = socket.create_connection(self.address)
+            self._connection.sendall(b''.join(
+                encode_batch(self.host, name, timestamps, values, columns)
+                for name, timestamps, values, columns in batches
+            ))
+        except OSError:
+            self.close()
+            return False
+        for name, timestamps, _, _ in batches:
+            self._pushed[name] = int(timestamps[-1])
+        return True
+
+    def close(self) -> None:
+        r"""Close the connection to the aggregator."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def run(self, stop_time: dt.datetime = None) -> None:
+        r"""Sample and push the samples until stopped.
+
+        :param stop_time: Time to stop sampling, defaults to None (until
+        stop() is called or the process is interrupted)
+        """
+        self.sampler.stop_time = stop_time
+        self.sampler.start()
+        try:
+            while not self.sampler.join(timeout=self.push_interval):
+                self.push()
+        finally:
+            self.sampler.stop()
+            self.sampler.join()
+            self.push()
+            self.close()
+
+    def start(self, stop_time: dt.datetime = None) -> 'FleetAgent':
+        r"""Run the agent on a background thread (see run).
+
+        :param stop_time: Time to stop sampling, defaults to None
+        :return: The agent itself, so it can be chained
+        """
+        self._thread = threading.Thread(
+            target=self.run, args=(stop_time,), name='fleet-agent',
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        r"""Ask the agent to stop, after a last push."""
+        self.sampler.stop()
+
+    def join(self, timeout: float = None) -> bool:
+        r"""Wait for the agent thread to finish.
+
+        :param timeout: Maximum time in seconds to wait, defaults to None
+        :return: True if the thread has finished
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self._thread is None or not self._thread.is_alive()
+
+
+class _BatchHandler(socketserver.StreamRequestHandler):
+    """Receive the batches of one agent connection."""
+
+    def handle(self) -> None:
+        aggregator = self.server.aggregator
+        with aggregator._connected:
+            aggregator._connections += 1
+        try:
+            while True:
+                batch = read_batch(self.rfile)
+                if batch is None:
+                    return
+                aggregator.add_batch(*batch)
+        finally:
+            with aggregator._connected:
+                aggregator._connections -= 1
+                aggregator._connected.notify_all()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FleetAggregator:
+    """Receive the samples of the agents of a fleet, indexed by host.
+
+    Each host has a ring buffer per metric family, so the memory used is
+    bounded by the capacity and the number of hosts.
+    """
+
+    def __init__(
+        self,
+        address: tuple = ('127.0.0.1', DEFAULT_PORT),
+        capacity: int = DEFAULT_CAPACITY,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param address: Host and port to listen on, defaults to
+        ('127.0.0.1', DEFAULT_PORT). Port 0 picks a free port (see address)
+        :param capacity: Maximum number of samples kept per host and
+        collector, defaults to DEFAULT_CAPACITY
+        """
+        self.capacity = capacity
+        self._data = {}
+        self._lock = threading.Lock()
+        # Number of open agent connections
+        self._connections = 0
+        self._connected = threading.Condition()
+        self._server = _Server(address, _BatchHandler)
+        self._server.aggregator = self
+        self._thread = None
+
+    @property
+    def address(self) -> tuple:
+        r"""Host and port the aggregator listens on."""
+        return self._server.server_address[:2]
+
+    def start(self) -> 'FleetAggregator':
+        r"""Start receiving batches on a background thread.
+
+        :return: The aggregator itself, so it can be chained
+        """
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='fleet-aggregator',
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def wait_disconnected(self, timeout: float = None) -> bool:
+        r"""Wait until every agent has closed its connection.
+
+        :param timeout: Maximum time in seconds to wait, defaults to None
+        :return: True if there are no open connections
+        """
+        with self._connected:
+            return self._connected.wait_for(
+                lambda: self._connections == 0, timeout)
+
+    def stop(self) -> None:
+        r"""Stop receiving batches and close the socket."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+
+    def add_batch(
+        self,
+        host: str,
+        family: str,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        columns: list,
+    ) -> None:
+        r"""Append a batch of samples of a host.
+
+        :param host: Name of the machine that took the samples
+        :param family: Metric family (collector name)
+        :param timestamps: Epoch times of the samples in nanoseconds
+        :param values: 2D array with a row per sample and a column per series
+        :param columns: Names of the columns of the values
+        """
+        with self._lock:
+            buffers = self._data.setdefault(host, {})
+            if family not in buffers:
+                buffers[family] = RingBuffer(self.capacity, values.dtype)
+            buffer = buffers[family]
+            # A batch sent again after a failed push can have samples the
+            # buffer already has
+            last = buffer.timestamps()[-1:]
+            if len(last):
+                keep = timestamps > last[0]
+                timestamps, values = timestamps[keep], values[keep]
+            buffer.extend(timestamps, values, columns)
+
+    def hosts(self) -> list:
+        r"""Names of the hosts that pushed samples, sorted."""
+        with self._lock:
+            return sorted(self._data)
+
+    def frame(
+        self,
+        host: str,
+        family: str,
+        start_time: dt.datetime = None,
+        stop_time: dt.datetime = None,
+    ) -> pd.DataFrame:
+        r"""Get the samples of a host inside a time window.
+
+        :param host: Name of the machine
+        :param family: Metric family (collector name)
+        :param start_time: Start of the window, defaults to None
+        :param stop_time: End of the window, defaults to None
+        :return: Dataframe with the samples, indexed by datetime (empty if
+        the host has no samples of the family)
+        """
+        start = None if start_time is None else to_epoch_ns(start_time)
+        stop = None if stop_time is None else to_epoch_ns(stop_time)
+        with self._lock:
+            buffer = self._data.get(host, {}).get(family)
+            if buffer is None:
+                return pd.DataFrame(index=to_datetime_index(
+                    np.array([], dtype=np.int64)))
+            return buffer.to_frame(start, stop)
+
+
+def fleet_usage(
+    aggregator: FleetAggregator,
+    start_time: dt.datetime = None,
+    stop_time: dt.datetime = None,
+) -> dict:
+    r"""Get the CPU and memory usage of every host of the fleet.
+
+    :param aggregator: Aggregator with the samples of the hosts
+    :param start_time: Start of the window, defaults to None
+    :param stop_time: End of the window, defaults to None
+    :return: Dataframe per host, with the 'CPU' and 'Memory' percentages
+    """
+    usage = {}
+    for host in aggregator.hosts():
+        cpu = aggregator.frame(host, 'cpu', start_time, stop_time)
+        memory = aggregator.frame(host, 'memory', start_time, stop_time)
+        usage[host] = pd.concat(
+            {
+                'CPU': cpu['Total'] if 'Total' in cpu else pd.Series(
+                    dtype=float),
+                'Memory': utils.memory_percentage('memory', memory),
+            },
+            axis=1,
+        )
+    return usage
+
+
+class FleetReport:
+    """PDF report of the hosts of a fleet."""
+
+    def __init__(
+        self,
+        aggregator: FleetAggregator,
+        start_time: dt.datetime = None,
+        stop_time: dt.datetime = None,
+        top: int = 10,
+        output: str = None,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param aggregator: Aggregator with the samples of the hosts
+        :param start_time: Start of the window, defaults to None
+        :param stop_time: End of the window, defaults to None
+        :param top: Number of hosts in the top tables, defaults to 10
+        :param output: Path with the filename of the PDF file, defaults to
+        None (Fleet_Report_<current time>.pdf)
+        """
+        self.aggregator = aggregator
+        self.start_time = start_time
+        self.stop_time = stop_time
+        self.top = top
+        current_time = dt.datetime.now()
+        self.canvas = PdfBuilder.create_template(
+            current_time.strftime('%d_%m_%Y_%H_%M_%S'),
+            PdfBuilder.pagesize,
+            output or f'Fleet_Report_{current_time:%d_%m_%Y_%H_%M_%S}.pdf',
+        )
+        self.parts = [PdfBuilder.logo, PdfBuilder.format_text(
+            f'FLEET HARDWARE REPORT\n'
+            f'Date: {current_time:%d/%m/%Y}\n'
+            f'Time: {current_time:%H:%M:%S}\n\n'
+        )]
+
+    def generate_pdf(self) -> None:
+        r"""Create the PDF file of the report."""
+        usage = fleet_usage(self.aggregator, self.start_time, self.stop_time)
+        summary = pd.DataFrame(
+            {
+                host: {
+                    'CPU mean': data['CPU'].mean(),
+                    'CPU peak': data['CPU'].max(),
+                    'Memory mean': data['Memory'].mean(),
+                    'Memory peak': data['Memory'].max(),
+                    'Samples': len(data),
+                }
+                for host, data in usage.items()
+            },
+            index=['CPU mean', 'CPU peak', 'Memory mean', 'Memory peak',
+                   'Samples'],
+        ).T
+        self.parts.append(PdfBuilder.format_text(
+            f'Hosts: {len(summary)}\n\n'))
+
+        def percent(value: float) -> str:
+            return '-' if value != value else f'{value:.1f}%'
+
+        for device in ('CPU', 'Memory'):
+            self.parts.append(PdfBuilder.format_text(
+                f'Top {self.top} hosts by {device} usage\n'))
+            data = [['Host', 'Mean', 'Peak', f'{device} (%)']]
+            top = summary.sort_values(f'{device} mean', ascending=False)
+            for host, row in top.head(self.top).iterrows():
+                data.append([
+                    host,
+                    percent(row[f'{device} mean']),
+                    percent(row[f'{device} peak']),
+                    self.sparkline(usage[host][device]),
+                ])
+            self.parts.append(PdfBuilder.format_table(data))
+            self.parts.append(PdfBuilder.format_text('\n'))
+
+        self.parts.append(PdfBuilder.go_next_page())
+        self.parts.append(PdfBuilder.format_text('All hosts\n'))
+        data = [['Host', 'CPU (%)', 'Memory (%)', 'Samples']]
+        for host, data_frame in usage.items():
+            data.append([
+                host,
+                self.sparkline(data_frame['CPU']),
+                self.sparkline(data_frame['Memory']),
+                int(summary.loc[host, 'Samples']),
+            ])
+        self.parts.append(PdfBuilder.format_table(data))
+        PdfBuilder.build_pdf(self.canvas, self.parts)
+
+    def sparkline(self, series: pd.Series) -> object:
+        r"""Draw the sparkline of a percentage series.
+
+        :param series: Percentages indexed by datetime
+        :return: Drawing with the line for the PDF
+        """
+        series = decimate(series.to_frame(), SPARKLINE_POINTS).iloc[:, 0]
+        return PdfBuilder.format_sparkline(series.to_numpy())
+
+
+def run_aggregator(
+    address: tuple = ('127.0.0.1', DEFAULT_PORT),
+    duration: float = None,
+    output: str = None,
+    top: int = 10,
+    agents: int = 0,
+) -> str:
+    r"""Receive the samples of the fleet and create its report.
+
+    :param address: Host and port to listen on, defaults to
+    ('127.0.0.1', DEFAULT_PORT)
+    :param duration: Time in seconds to receive samples, defaults to None
+    (until the process is interrupted)
+    :param output: Path with the filename of the PDF file, defaults to None
+    :param top: Number of hosts in the top tables, defaults to 10
+    :param agents: Agents with synthetic samples started on loopback, e.g.
+    to try the fleet report on one machine, defaults to 0
+    :return: Path with the filename of the PDF file
+    """
+    aggregator = FleetAggregator(address).start()
+    stop_time = None
+    if duration is not None:
+        stop_time = dt.datetime.now() + dt.timedelta(seconds=duration)
+    fleet = [
+        FleetAgent(
+            aggregator.address,
+            host=f'synthetic-{i:03d}',
+            push_interval=1.0,
+            collectors=[SyntheticCpuCollector(seed=i),
+                        SyntheticMemoryCollector(seed=i)],
+        ).start(stop_time)
+        for i in range(agents)
+    ]
+    try:
+        stopped = threading.Event()
+        stopped.wait(duration)
+    except KeyboardInterrupt:
+        pass
+    for agent in fleet:
+        agent.stop()
+    for agent in fleet:
+        agent.join()
+    if fleet:
+        # The last batches of the agents are still being received
+        aggregator.wait_disconnected(timeout=10)
+
+    report = FleetReport(aggregator, top=top, output=output)
+    report.generate_pdf()
+    aggregator.stop()
+    return report.canvas.filename
@@ -0,0 +1,127 @@
+"""
+Live view of the samples while they are being collected.
+
+The report is only generated once the analysis period is over, the live view
+shows the same devices in near real time instead. It polls the buffers of a
+running sampler and only converts the samples appended since the previous
+poll, so the charts can be extended with the new rows (delta updates)
+instead of being drawn again on every refresh.
+"""
+import datetime as dt
+
+import pandas as pd
+import utils
+from sampler import Sampler
+from store import to_epoch_ns
+
+# Title of each live chart
+LIVE_CHARTS = {
+    'cpu': 'CPU usage (%)',
+    'memory': 'Memory usage (%)',
+    'disk': 'Disk throughput (MB/s)',
+    'network': 'Network throughput (MB/s)',
+}
+
+# Collectors read by each chart
+LIVE_COLLECTORS = {
+    'cpu': ('cpu',),
+    'memory': ('memory', 'swap'),
+    'disk': ('disk_io',),
+    'network': ('net_io',),
+}
+
+# Counters of the bytes in and out of each I/O collector
+IO_BYTES = {
+    'disk_io': ('read_bytes', 'write_bytes'),
+    'net_io': ('bytes_recv', 'bytes_sent'),
+}
+
+MEGABYTE = 1024**2
+
+
+class LiveFeed:
+    """Incremental reader of the samples of a running sampler.
+
+    Every read returns the rows of a chart appended since the previous read
+    of that chart, already converted to what the chart shows:
+
+        cpu: Total CPU usage, the per-core series are left to the report
+        memory: Memory and swap usage in percentage
+        disk: Read plus written bytes per second of each disk
+        network: Received plus sent bytes per second of each NIC
+    """
+
+    def __init__(self, sampler: Sampler, history: float = 300.0) -> None:
+        r"""Contain the initial arguments.
+
+        :param sampler: Running sampler with the cpu, memory, swap, disk_io
+        and net_io collectors
+        :param history: Time in seconds before now of the first read of a
+        chart, defaults to 300.0
+        """
+        self.sampler = sampler
+        self.history = history
+        # Timestamp of the last sample read of each collector
+        self._last = {}
+        # Last counters read of each I/O collector, the rate of the first
+        # new sample is computed from them
+        self._counters = {}
+
+    def reset(self, chart: str) -> None:
+        r"""Read the history of a chart again on its next read.
+
+        :param chart: Name of the chart (see LIVE_CHARTS)
+        """
+        for name in LIVE_COLLECTORS[chart]:
+            self._last.pop(name, None)
+            self._counters.pop(name, None)
+
+    def read(self, chart: str) -> pd.DataFrame:
+        r"""Get the new rows of a chart.
+
+        :param chart: Name of the chart (see LIVE_CHARTS)
+        :return: Dataframe indexed by datetime with a column per series,
+        empty if nothing was sampled since the previous read
+        """
+        if chart == 'cpu':
+            data = self._samples('cpu')
+            # No columns until the first sample
+            return data[['Total']] if 'Total' in data else pd.DataFrame()
+        if chart == 'memory':
+            memory = self._samples('memory')
+            # Up to the same tick as the memory, in case one was appended
+            # between the two reads
+            swap = self._samples('swap', stop=self._last['memory'])
+            return pd.concat(
+                {
+                    'Memory': utils.memory_percentage('memory', memory),
+                    'Swap': utils.memory_percentage('swap', swap),
+                },
+                axis=1,
+            )
+        name, = LIVE_COLLECTORS[chart]
+        return self._throughput(name)
+
+    def _samples(self, name: str, stop: int = None) -> pd.DataFrame:
+        # Samples of a collector appended since its previous read
+        if name not in self._last:
+            start = dt.datetime.now() - dt.timedelta(seconds=self.history)
+            self._last[name] = to_epoch_ns(start)
+        data, self._last[name] = self.sampler.frame_since(
+            name, self._last[name], stop)
+        return data
+
+    def _throughput(self, name: str) -> pd.DataFrame:
+        # Throughput of the new samples of an I/O collector, in MB/s
+        data = self._samples(name)
+        if data.empty:
+            return pd.DataFrame()
+        previous = self._counters.get(name)
+        self._counters[name] = data.iloc[-1:]
+        if previous is not None:
+            data = pd.concat([previous, data])
+        rates = utils.device_rates(data)
+        if rates.empty:
+            return pd.DataFrame()
+        throughput = utils.io_throughput(rates, *IO_BYTES[name])
+        return (throughput / MEGABYTE).round(3)
@@ -1,14 +1,52 @@
 """Main script for the FronEnd using Streamlit."""
+import base64
 import datetime as dt
+import os
+import socket
+import time
 
-import fitz
+import collectors
+import live
+import procfs
 import streamlit as st
 import utils
-from PIL import Image
+from daemon import DEFAULT_STORE_PATH
 from report import HardwareReport
+from sampler import Sampler
+from store import MetricsStore
 
 img = 'https://i.gifer.com/74pZ.gif'
 
+# Width in pixels of the rendered report pages, about the width of the
+# container in the wide layout
+PAGE_WIDTH = 1200
+# Maximum number of rendered pages kept in the cache
+PAGE_CACHE_ENTRIES = 64
+# Maximum number of reports kept in the cache and for how long (seconds)
+REPORT_CACHE_ENTRIES = 16
+REPORT_CACHE_TTL = 60 * 60
+# Samples kept by the sampler shared by all the sessions (one day at 1 Hz)
+SHARED_SAMPLER_CAPACITY = 24 * 60 * 60
+# Time in seconds between two updates of the live charts, never shorter
+# than the interval of the shared sampler
+LIVE_REFRESH_INTERVALS = (1, 2, 5, 10)
+# Time in seconds shown by the live charts when they are drawn
+LIVE_HISTORY = 5 * 60
+# Rows appended to a live chart before it's drawn again with only the last
+# LIVE_HISTORY seconds, so the browser doesn't keep every point
+LIVE_MAX_ROWS = 4 * LIVE_HISTORY
+# Sections of the report that can be enabled
+SECTIONS = {
+    'system': 'System',
+    'cpu': 'CPU',
+    'memory': 'Memory',
+    'disk': 'Disk',
+    'network': 'Network',
+    'processes': 'Processes',
+}
+# Sections disabled until they are checked
+OPTIONAL_SECTIONS = {'processes'}
+
 st.set_page_config(
     layout='wide',
     initial_sidebar_state='expanded',
@@ -38,7 +76,9 @@ with st.spinner('Wait for it...'):
     STOP_DATE = sub_columns[1].date_input(
         'To', value=STOP_DATE, min_value=START_DATE)
 
-    START_TIME = dt.datetime.now().time()
+    # Whole minutes, so the default window (and the cached report) is the
+    # same on every rerun of the script
+    START_TIME = dt.datetime.now().replace(second=0, microsecond=0).time()
     STOP_TIME = utils.addMins(START_TIME, 1)
     START_TIME = sub_columns[0].time_input(
         'From', value=START_TIME, label_visibility='collapsed'
@@ -50,36 +90,245 @@ with st.spinner('Wait for it...'):
     START = dt.datetime.combine(START_DATE, START_TIME)
     STOP = dt.datetime.combine(STOP_DATE, STOP_TIME)
 
+    # --------------------------- Sections selection -------------------------
+    window_selection_c.markdown('### Select the sections of the report:')
+    ENABLED_SECTIONS = tuple(
+        (section, window_selection_c.checkbox(
+            label, value=section not in OPTIONAL_SECTIONS))
+        for section, label in SECTIONS.items()
+    )
+    # The processes are sampled by another shared sampler (see
+    # shared_sampler)
+    PROCESSES = dict(ENABLED_SECTIONS)['processes']
+
     create_report = sub_columns[0].button('Create Report')
 
-    def displayPDF(filename: str) -> None:
-        """Convert the report PDF file to images and displays to the frontend.
+    # --------------------------- Live view ----------------------------------
+    window_selection_c.markdown('### Watch the machine live:')
+    LIVE_VIEW = window_selection_c.checkbox('Live view', value=False)
+    LIVE_REFRESH = window_selection_c.select_slider(
+        'Refresh every (seconds)', options=LIVE_REFRESH_INTERVALS,
+        disabled=not LIVE_VIEW,
+    )
 
-        :param filename: Path with the filename of the PDF file
+    @st.experimental_singleton
+    def shared_sampler(processes: bool) -> Sampler:
+        """Start the sampler shared by all the sessions of the app.
+
+        Every report reads its window from the same samples, so overlapping
+        windows (or the same window requested again) don't sample again.
+        It runs the collectors of the live view and of the sections, and
+        keeps the statistics of the families summarized by the reports only
+        (see stats.SUMMARIZED). The processes, the heaviest collector, are
+        only sampled by a second sampler, shared by the sessions with the
+        processes section.
+
+        :param processes: Also sample the heaviest processes
+        :return: Sampler running the collectors
         """
-        doc = fitz.open(filename)
-        zoom = 4
-        mat = fitz.Matrix(zoom, zoom)
-
-        for i in range(len(doc)):
-            page = doc.load_page(i)
-            pix = page.get_pixmap(matrix=mat)
-            # set the mode depending on alpha
-            mode = 'RGBA' if pix.alpha else 'RGB'
-            img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-            st.image(img, caption='')
-        doc.close()
+        sampler = Sampler(interval=1.0, capacity=SHARED_SAMPLER_CAPACITY)
+        names = [*collectors.COLLECTORS, 'pressure']
+        if processes:
+            names += list(collectors.OPTIONAL_COLLECTORS)
+        for name in names:
+            collector = procfs.collector(name)
+            # e.g. no pressure stall information outside of Linux
+            if collector is not None:
+                sampler.add_collector(collector)
+        return sampler.start()
+
+    @st.experimental_memo(
+        ttl=REPORT_CACHE_TTL,
+        max_entries=REPORT_CACHE_ENTRIES,
+        show_spinner=False,
+    )
+    def build_report(
+        start: dt.datetime,
+        stop: dt.datetime,
+        sections: tuple,
+        host: str,
+    ) -> str:
+        """Create the report PDF file of a window.
+
+        The reports are cached by window, enabled sections and host.
+
+        :param start: Start time for analysis
+        :param stop: Stop time for analysis
+        :param sections: Pairs of section name and whether it's enabled
+        :param host: Name of the machine, part of the cache key
+        :return: Path with the filename of the PDF file
+        """
+        sampler = shared_sampler(dict(sections)['processes'])
+        # A window before the start of the app can only be reported from
+        # the samples persisted by the collector daemon (see daemon.py)
+        store = None
+        if start < sampler.started_at and os.path.isdir(DEFAULT_STORE_PATH):
+            store = MetricsStore(DEFAULT_STORE_PATH)
 
-    if create_report:
         report = HardwareReport(
-            start_time=START,
-            stop_time=STOP,
-            system=True,
-            cpu=True,
-            memory=True,
-            disk=True,
-            network=True,
+            start_time=start,
+            stop_time=stop,
+            sampler=sampler,
+            store=store,
+            **dict(sections),
         )
         report.generate_pdf()
-        displayPDF(report.canvas.filename)
+        return report.canvas.filename
+
+    @st.experimental_memo(max_entries=PAGE_CACHE_ENTRIES, show_spinner=False)
+    def render_page(
+        filename: str,
+        modified: float,
+        page_number: int,
+        width: int,
+    ) -> bytes:
+        """Render one page of the report PDF file as a PNG image.
+
+        The rendered pages are cached by report (filename and modification
+        time) and page, so going back to a page doesn't render it again.
+
+        :param filename: Path with the filename of the PDF file
+        :param modified: Modification time of the file, part of the cache key
+        :param page_number: Page to be rendered, starting at 0
+        :param width: Width of the image in pixels
+        :return: PNG image of the page
+        """
+        return utils.render_page(filename, page_number, width)
+
+    def displayPDF(filename: str) -> None:
+        """Display the report PDF file in the frontend.
+
+        Only the selected page is rendered (see render_page), the whole PDF
+        can be downloaded or opened in the browser PDF viewer instead.
+
+        :param filename: Path with the filename of the PDF file
+        """
+        with open(filename, 'rb') as file:
+            pdf = file.read()
+        st.download_button(
+            'Download PDF', pdf,
+            file_name=os.path.basename(filename), mime='application/pdf',
+        )
+
+        mode = st.radio('Viewer', ('Pages', 'Embedded'), horizontal=True)
+        if mode == 'Embedded':
+            encoded = base64.b64encode(pdf).decode()
+            st.markdown(
+                f'<iframe src="data:application/pdf;base64,{encoded}" '
+                'width="100%" height="1000" type="application/pdf"></iframe>',
+                unsafe_allow_html=True,
+            )
+            return
+
+        import fitz
+
+        with fitz.open(stream=pdf, filetype='pdf') as doc:
+            pages = len(doc)
+        page_number = st.number_input(
+            f'Page (of {pages})', min_value=1, max_value=pages, value=1)
+        st.image(
+            render_page(filename, os.path.getmtime(filename),
+                        page_number - 1, PAGE_WIDTH),
+            caption='',
+            use_column_width=True,
+        )
+
+    def draw_live_view(container: object) -> dict:
+        """Add the empty live charts to the frontend.
+
+        :param container: Streamlit container of the charts
+        :return: State of the live view, updated by update_live_view
+        """
+        sampler = shared_sampler(PROCESSES)
+        charts = {}
+        for chart, title in live.LIVE_CHARTS.items():
+            container.markdown(f'#### {title}')
+            charts[chart] = {
+                'placeholder': container.empty(),
+                'element': None,
+                'columns': None,
+                'rows': 0,
+            }
+        return {
+            'feed': live.LiveFeed(sampler, history=LIVE_HISTORY),
+            'charts': charts,
+            'refresh': max(LIVE_REFRESH, sampler.interval),
+            'updated': None,
+        }
+
+    def update_live_view(view: dict) -> None:
+        """Append the new samples to the live charts.
+
+        Only the rows sampled since the previous update are sent to the
+        browser (add_rows), a chart is only drawn again when its series
+        change (e.g. a NIC plugged in) or it has LIVE_MAX_ROWS rows. Calls
+        closer than the refresh interval do nothing.
+
+        :param view: State of the live view (see draw_live_view)
+        """
+        now = time.monotonic()
+        if view['updated'] is not None and (
+                now - view['updated'] < view['refresh']):
+            return
+        view['updated'] = now
+
+        feed = view['feed']
+        for chart, state in view['charts'].items():
+            rows = feed.read(chart)
+            if rows.empty:
+                continue
+            if state['element'] is not None and (
+                    list(rows.columns) == state['columns']
+                    and state['rows'] + len(rows) <= LIVE_MAX_ROWS):
+                state['element'].add_rows(rows)
+                state['rows'] += len(rows)
+                continue
+            if state['element'] is not None:
+                # Draw again with the recent history only
+                feed.reset(chart)
+                rows = feed.read(chart)
+            state['element'] = state['placeholder'].line_chart(rows)
+            state['columns'] = list(rows.columns)
+            state['rows'] = len(rows)
+
+    live_view = None
+    if LIVE_VIEW:
+        live_view = draw_live_view(st.expander('Live view', expanded=True))
+        update_live_view(live_view)
+
+    if create_report:
+        started_at = shared_sampler(PROCESSES).started_at
+        if START < started_at and not os.path.isdir(DEFAULT_STORE_PATH):
+            st.warning(
+                'The window starts before the app, there are only samples '
+                'of past windows when the collector is running '
+                '("python daemon.py")'
+            )
+
+        # The samples are collected in the background, so the page keeps
+        # being updated until the end of the analysis period
+        window = max((STOP - START).total_seconds(), 1)
+        progress = st.progress(0)
+        while dt.datetime.now() < STOP:
+            elapsed = (dt.datetime.now() - START).total_seconds()
+            progress.progress(min(max(elapsed / window, 0.0), 1.0))
+            if live_view is not None:
+                update_live_view(live_view)
+            remaining = (STOP - dt.datetime.now()).total_seconds()
+            time.sleep(min(max(remaining, 0), 0.5))
+        progress.progress(1.0)
+
+        # Keep the report across the reruns of the script, e.g. when a page
+        # is selected in the viewer
+        st.session_state['report_filename'] = build_report(
+            START, STOP, ENABLED_SECTIONS, socket.gethostname())
         st.success('Done!')
+
+    if 'report_filename' in st.session_state:
+        displayPDF(st.session_state['report_filename'])
+
+# The live charts keep being updated until the session reruns the script
+# (any widget change) or ends
+while live_view is not None:
+    update_live_view(live_view)
+    time.sleep(live_view['refresh'])
@@ -0,0 +1,408 @@
+"""
+Fast-path collectors for Linux, reading /proc directly.
+
+psutil opens, reads and parses a /proc file on every call, and returns new
+named tuples for every core, disk and NIC. These collectors take the same
+samples (same names, columns and values as the ones in collectors.py) with
+less work per tick:
+
+    - the /proc files are opened once and read again with os.preadv into a
+      buffer allocated once (see ProcFile)
+    - the fields of each file are found once, each tick only converts the
+      numbers into arrays allocated once, which are returned as they are
+      (collectors with ``columns``, see sampler.Sampler)
+
+They are used whenever /proc can be read (see collector), the collectors of
+collectors.py (psutil) are the fallback on the other systems. The pressure
+stall information (ProcPressureCollector) has no psutil equivalent, it's only
+sampled on Linux.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from collectors import (COLLECTORS, OPTIONAL_COLLECTORS, CpuCollector,
+                        DiskIOCollector, NetIOCollector, ProcessCollector)
+
+# Root of the proc filesystem
+PROC_PATH = '/proc'
+
+# Columns of the CPU lines of /proc/stat, in the order of the kernel
+STAT_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq',
+               'softirq', 'steal', 'guest', 'guest_nice')
+
+# Size in bytes of the sectors counted in /proc/diskstats
+SECTOR_SIZE = 512
+
+# Position of utime, stime and rss in /proc/<pid>/stat, after the name
+STAT_UTIME, STAT_STIME, STAT_RSS = 11, 12, 21
+
+
+class ProcFile:
+    """A /proc file kept open and read again in place on every tick."""
+
+    def __init__(self, path: str, size: int = 4096) -> None:
+        r"""Open the file.
+
+        :param path: Path of the file, e.g. '/proc/stat'
+        :param size: Initial size of the buffer in bytes, it grows to fit
+        the whole file, defaults to 4096
+        """
+        self.path = path
+        self._fd = None
+        self._fd = os.open(path, os.O_RDONLY)
+        self._buffer = bytearray(size)
+        # Bytes read past the end of the buffer when the file grew
+        self._spare = bytearray(size)
+
+    def read(self) -> bytearray:
+        r"""Read the current content of the file.
+
+        The buffer is kept the length of the content, so the content is read
+        in place and returned without a copy, and only resized (in place)
+        when the length of the file changes, e.g. a counter with one more
+        digit.
+
+        :return: Content of the file, the buffer itself, valid until the next
+        read
+        """
+        length = 0
+        while True:
+            view = memoryview(self._buffer)[length:]
+            read = os.preadv(self._fd, [view, self._spare], length)
+            view.release()
+            if not read:
+                # The end of the file
+                del self._buffer[length:]
+                return self._buffer
+            extra = length + read - len(self._buffer)
+            if extra > 0:
+                # The file is longer than the buffer
+                self._buffer.extend(memoryview(self._spare)[:extra])
+            length += read
+
+    def close(self) -> None:
+        r"""Close the file."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __del__(self) -> None:
+        r"""Close the file when it is garbage collected."""
+        self.close()
+
+
+class ProcCpuCollector(CpuCollector):
+    """Per-core and total CPU utilization, from /proc/stat."""
+
+    def __init__(self) -> None:
+        r"""Open /proc/stat and take the first reading."""
+        self._stat = ProcFile(os.path.join(PROC_PATH, 'stat'))
+        # Two readings are alternated: the current one and the previous
+        self._readings = [None, None]
+        self._current = 0
+        self._previous = self._read()
+        self._set_fields(STAT_FIELDS[:self._previous.shape[1]])
+        self._set_columns(len(self._previous))
+
+    def _read(self) -> np.ndarray:
+        # The lines of the cores follow the total ("cpu  ...")
+        lines = self._stat.read().split(b'\n')
+        cores = [line for line in lines[1:] if line.startswith(b'cpu')]
+        columns = len(cores[0].split()) - 1
+        self._current ^= 1
+        reading = self._readings[self._current]
+        if reading is None or reading.shape != (len(cores), columns):
+            reading = np.empty((len(cores), columns))
+            self._readings[self._current] = reading
+        for row, line in zip(reading, cores):
+            row[:] = list(map(int, line.split()[1:]))
+        return reading
+
+
+class ProcMemoryCollector:
+    """Physical memory usage in bytes, from /proc/meminfo.
+
+    The values are the ones of psutil.virtual_memory().
+    """
+
+    name = 'memory'
+    dtype = np.int64
+    columns = ['Total', 'Available', 'Used']
+    keys = (b'MemTotal:', b'MemFree:', b'MemAvailable:', b'Buffers:',
+            b'Cached:', b'SReclaimable:')
+
+    def __init__(self) -> None:
+        r"""Open /proc/meminfo and find the fields."""
+        self._meminfo = ProcFile(os.path.join(PROC_PATH, 'meminfo'))
+        self._fields = np.zeros(len(self.keys), dtype=np.int64)
+        self._sample = np.zeros(len(self.columns), dtype=np.int64)
+        self._index = None
+        self._read()
+
+    def _read(self) -> np.ndarray:
+        r"""Read the fields in bytes, in the order of keys."""
+        tokens = self._meminfo.read().split()
+        if self._index is None or any(
+                tokens[index - 1] != key
+                for index, key in zip(self._index, self.keys)):
+            # Position of the value of each key, found again if the lines
+            # changed (e.g. after a kernel update)
+            self._index = [tokens.index(key) + 1 for key in self.keys]
+        for position, index in enumerate(self._index):
+            self._fields[position] = int(tokens[index])
+        self._fields *= 1024
+        return self._fields
+
+    def collect(self) -> np.ndarray:
+        r"""Take one memory sample.
+
+        :return: Total, available and used memory in bytes
+        """
+        total, free, available, buffers, cached, reclaimable = self._read()
+        # "free" adds the reclaimable slab memory to the cached memory
+        used = total - free - (cached + reclaimable) - buffers
+        if used < 0:
+            # e.g. in containers, where some of the fields are emulated
+            used = total - free
+        self._sample[:] = total, available, used
+        return self._sample
+
+
+class ProcSwapCollector(ProcMemoryCollector):
+    """Swap memory usage in bytes, from /proc/meminfo."""
+
+    name = 'swap'
+    columns = ['Total', 'Free', 'Used']
+    keys = (b'SwapTotal:', b'SwapFree:')
+
+    def collect(self) -> np.ndarray:
+        r"""Take one swap sample.
+
+        :return: Total, free and used swap in bytes
+        """
+        total, free = self._read()
+        self._sample[:] = total, free, total - free
+        return self._sample
+
+
+class ProcDiskIOCollector(DiskIOCollector):
+    """Cumulative I/O counters of each disk, from /proc/diskstats."""
+
+    def __init__(self) -> None:
+        r"""Open /proc/diskstats."""
+        self._diskstats = ProcFile(os.path.join(PROC_PATH, 'diskstats'))
+        self._disks = None
+        self.columns = []
+        self._sample = np.zeros(0)
+
+    def collect(self) -> np.ndarray:
+        r"""Take one sample of the disk counters.
+
+        :return: Counters of the disks named by columns, as
+        '<disk>:<counter>'
+        """
+        disks = []
+        counters = []
+        for line in self._diskstats.read().splitlines():
+            fields = line.split()
+            if len(fields) == 7:
+                # A partition of Linux 2.6: reads, sectors read, writes and
+                # sectors written
+                reads, read_sectors, writes, write_sectors = fields[3:7]
+            elif len(fields) >= 14:
+                reads, read_sectors = fields[3], fields[5]
+                writes, write_sectors = fields[7], fields[9]
+            else:
+                continue
+            disks.append(fields[2])
+            # In the order of fields
+            counters.append((read_sectors, write_sectors, reads, writes))
+
+        if disks != self._disks:
+            # A disk was added or removed, the columns are a new list so the
+            # buffers find the positions of the names again
+            self._disks = disks
+            self.columns = [f'{disk.decode()}:{field}'
+                            for disk in disks for field in self.fields]
+            self._sample = np.zeros(len(self.columns))
+        sample = self._sample.reshape(len(disks), len(self.fields))
+        for row, values in zip(sample, counters):
+            row[:] = list(map(int, values))
+        sample[:, :2] *= SECTOR_SIZE
+        return self._sample
+
+
+class ProcNetIOCollector(NetIOCollector):
+    """Cumulative I/O counters of each NIC, from /proc/net/dev."""
+
+    def __init__(self) -> None:
+        r"""Open /proc/net/dev."""
+        self._dev = ProcFile(os.path.join(PROC_PATH, 'net', 'dev'))
+        self._nics = None
+        self.columns = []
+        self._sample = np.zeros(0)
+
+    def collect(self) -> np.ndarray:
+        r"""Take one sample of the network counters.
+
+        :return: Counters of the NICs named by columns, as '<nic>:<counter>'
+        """
+        nics = []
+        counters = []
+        # The first two lines are the header
+        for line in self._dev.read().splitlines()[2:]:
+            name, _, fields = line.rpartition(b':')
+            fields = fields.split()
+            nics.append(name.strip())
+            # In the order of fields: bytes and packets received and sent
+            counters.append((fields[0], fields[8], fields[1], fields[9]))
+
+        if nics != self._nics:
+            self._nics = nics
+            self.columns = [f'{nic.decode()}:{field}'
+                            for nic in nics for field in self.fields]
+            self._sample = np.zeros(len(self.columns))
+        sample = self._sample.reshape(len(nics), len(self.fields))
+        for row, values in zip(sample, counters):
+            row[:] = list(map(int, values))
+        return self._sample
+
+
+class ProcProcessCollector(ProcessCollector):
+    """CPU and memory of the heaviest processes, from /proc/<pid>/stat.
+
+    The name, the CPU time and the RSS of a process are all in its stat
+    file, so each process is one read instead of the two files (and the
+    Process objects) of psutil. There are too many processes to keep their
+    files open, they are opened on every reading.
+    """
+
+    def __init__(self, top: int = 10, budget: int = 500) -> None:
+        r"""Contain the initial arguments.
+
+        :param top: Processes kept by CPU and by memory on each tick,
+        defaults to 10
+        :param budget: Maximum number of processes read on each tick,
+        defaults to 500
+        """
+        self._ticks = os.sysconf('SC_CLK_TCK')
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+        super().__init__(top, budget)
+
+    def _pids(self) -> set:
+        return {int(entry) for entry in os.listdir(PROC_PATH)
+                if entry.isdigit()}
+
+    def _handle(self, pid: int) -> object:
+        return os.path.join(PROC_PATH, str(pid), 'stat')
+
+    def _read_process(self, handle: object, name: bool) -> tuple:
+        try:
+            with open(handle, 'rb', buffering=0) as file:
+                stat = file.read()
+        except FileNotFoundError as error:
+            raise ProcessLookupError(handle) from error
+        # The name is between parentheses and can contain spaces
+        end = stat.rfind(b')')
+        fields = stat[end + 2:].split()
+        return (
+            stat[stat.find(b'(') + 1:end].decode(errors='replace')
+            if name else None,
+            (int(fields[STAT_UTIME]) + int(fields[STAT_STIME])) / self._ticks,
+            int(fields[STAT_RSS]) * self._page_size,
+        )
+
+
+class ProcPressureCollector:
+    """Pressure stall information (PSI) of the host, from /proc/pressure.
+
+    The share of the time some (or all) of the tasks were stalled waiting
+    for the CPU, the memory or the I/O, from the growth of the stalled time
+    of each file since the previous tick, in percent.
+    """
+
+    name = 'pressure'
+    resources = ('cpu', 'memory', 'io')
+
+    def __init__(self) -> None:
+        r"""Open the pressure files and take the first reading."""
+        self._files = [(resource, ProcFile(path))
+                       for resource, path in self._paths()]
+        self.columns = []
+        self._index = {}
+        previous = self._read()
+        for resource, kind in previous:
+            self._index[resource, kind] = len(self.columns)
+            self.columns.append(f'{resource}:{kind}')
+        self._previous = previous, time.monotonic()
+        self._sample = np.zeros(len(self.columns))
+
+    def _paths(self) -> list:
+        directory = os.path.join(PROC_PATH, 'pressure')
+        return [(resource, os.path.join(directory, resource))
+                for resource in self.resources]
+
+    def _read(self) -> dict:
+        # Stalled time in microseconds of each resource and kind of stall,
+        # from lines as "some avg10=0.00 avg60=0.00 avg300=0.00 total=0"
+        stalled = {}
+        for resource, file in self._files:
+            for line in file.read().splitlines():
+                kind, *fields = line.split()
+                stalled[resource, kind.decode()] = int(
+                    fields[-1].partition(b'=')[2])
+        return stalled
+
+    def collect(self) -> np.ndarray:
+        r"""Take one pressure sample.
+
+        :return: Percentage of the time stalled of each resource and kind,
+        named by columns as '<resource>:<some|full>'
+        """
+        current, now = self._read(), time.monotonic()
+        previous, before = self._previous
+        self._previous = current, now
+        elapsed = (now - before) * 1e6
+        for key, position in self._index.items():
+            delta = current.get(key, 0) - previous.get(key, 0)
+            self._sample[position] = (
+                100 * delta / elapsed if elapsed > 0 else 0.0)
+        return np.clip(self._sample, 0, 100).round(2)
+
+
+# Fast-path collectors by name, as COLLECTORS
+PROC_COLLECTORS = {
+    collector.name: collector
+    for collector in (
+        ProcCpuCollector,
+        ProcMemoryCollector,
+        ProcSwapCollector,
+        ProcDiskIOCollector,
+        ProcNetIOCollector,
+        ProcProcessCollector,
+        ProcPressureCollector,
+    )
+}
+
+
+def collector(name: str, fast_path: bool = True, **options) -> object:
+    r"""Create the collector of a metric family.
+
+    :param name: Collector name (e.g. 'cpu', 'memory', 'pressure')
+    :param fast_path: Read /proc directly on Linux, defaults to True
+    :param options: Arguments of the collector, e.g. the top of the
+    processes
+    :return: Fast-path collector, or the psutil one if /proc can't be read
+    (e.g. on other systems), None if there is none (e.g. the pressure
+    outside of Linux)
+    """
+    if fast_path and sys.platform.startswith('linux'):
+        try:
+            return PROC_COLLECTORS[name](**options)
+        except (OSError, ValueError, IndexError):
+            # e.g. a file missing in a container, or a format not known
+            pass
+    collector = COLLECTORS.get(name) or OPTIONAL_COLLECTORS.get(name)
+    return None if collector is None else collector(**options)
@@ -6,36 +6,40 @@ Check those libraries for additional information:
     https://psutil.readthedocs.io/en/latest/
     https://docs.python.org/3/library/socket.html
 """
+import contextlib
 import datetime as dt
+import json
 import os
-import platform
 import socket
-from collections import defaultdict
-from glob import glob
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from io import BytesIO
 
+import collectors
+import numpy as np
 import pandas as pd
 import psutil
+import rollup
+import stats
 import utils
+from decimation import decimate
 from psutil._common import bytes2human
+from sampler import Sampler
+from sources import MetricSource, PsutilSource, ReplaySource
+from store import MetricsStore, to_datetime_index, to_epoch_ns
 
 PdfBuilder = utils.PdfBuilder()
 GraphBuilder = utils.GraphBuilder()
 
-
-# The default analysis period will have start_time as the current time and
-# stop_time as the current time plus 1 minute.
-# It will therefore be a one-minute report. For testing, just run the code.
-
-current_time = dt.datetime.now()
-start_time = current_time
-stop_time = start_time + dt.timedelta(minutes=1)
+# Processes shown in the charts and in the table of the processes section
+TOP_PROCESSES = 8
 
 
 class HardwareReport:
     """Generate a PDF file with the computer hardware report.
 
     Contain numerical and graphical information of the System, CPU,
-    Memory, Disks and Network.
+    Memory, Disks and Network, and optionally of the heaviest processes.
     """
 
     def __init__(
@@ -47,6 +51,18 @@ class HardwareReport:
         memory: bool = True,
         disk: bool = True,
         network: bool = True,
+        processes: bool = False,
+        interval: float = 1.0,
+        sampler: Sampler = None,
+        store: MetricsStore = None,
+        max_points: int = None,
+        decimation: str = 'minmax',
+        render_workers: int = None,
+        chart_format: str = 'raster',
+        render_pool: Executor = None,
+        output: str = None,
+        source: MetricSource = None,
+        overhead: bool = False,
     ) -> PdfBuilder:
         """
         Contain the initial arguments.
@@ -59,6 +75,36 @@ class HardwareReport:
             cpu = <bool Set the cpu for analysis
             disk = <bool> Set the disk for analysis
             network = <bool> Set the network for analysis
+            processes = <bool> Set the heaviest processes for analysis, to
+                attribute the CPU and memory spikes (see
+                collectors.ProcessCollector)
+            interval = <float> Time in seconds between two samples
+            sampler = <Sampler> Shared sampler already collecting the data,
+                a new one is started for this report if not given
+            store = <MetricsStore> Store with the samples persisted by the
+                collector daemon, to be read instead of sampling (e.g. for
+                a window in the past)
+            max_points = <int> Maximum number of points plotted per series,
+                by default the width of the plots in pixels. The windows
+                with that many minutes (or hours) are read from the rollups
+                of the samples (see rollup.py).
+            decimation = <str> Method used to reduce the plotted points,
+                'minmax' or 'lttb' (None plots every sample, never from the
+                rollups)
+            render_workers = <int> Processes rendering the plots at the same
+                time, by default the number of CPUs (1 renders them in this
+                process)
+            chart_format = <str> 'raster' embeds the plots as PNG images,
+                'vector' draws them as vector graphics in the PDF
+            render_pool = <Executor> Pool rendering the plots, shared by
+                many reports (e.g. a batch), instead of a pool per report
+            output = <str> Path with the filename of the PDF file, by
+                default Hardware_Report_<current time>.pdf
+            source = <MetricSource> Where the samples and the machine
+                information come from, by default this machine (psutil), or
+                the store if one is given (see sources.py)
+            overhead = <bool> Append a page with the footprint of the report
+                on the machine (see overhead_report)
 
         :output
             pdf file with the computer hardware report
@@ -70,6 +116,28 @@ class HardwareReport:
         self.memory = memory
         self.disk = disk
         self.network = network
+        self.processes = processes
+        self.plot_options = {'max_points': max_points, 'decimation': decimation}
+        self.render_workers = render_workers
+        self.render_pool = render_pool
+        if chart_format not in ('raster', 'vector'):
+            raise ValueError(
+                f'Unknown chart format {chart_format!r}, '
+                "expected 'raster' or 'vector'"
+            )
+        self.chart_format = chart_format
+        # Plots waiting to be rendered, with their position in the parts
+        self.plots = []
+        # Time and CPU time spent in each stage of each section (see span)
+        self.overhead = overhead
+        self.spans = []
+        self.section = 'report'
+        self._started = time.perf_counter()
+        # Summary of the pressure stalls, shared by the sections
+        self._pressure = None
+        # Tier and rows of the rollups read instead of the samples, by
+        # collector name
+        self._rollups = {}
 
         current_time = dt.datetime.now()
         # Current formatted time is used as part of the PDF file name
@@ -78,7 +146,7 @@ class HardwareReport:
         # A new PDF file will be created in each run of the code
         # e.g: Harware_Report_01_08_2022_11_19_56.pdf
         self.canvas = PdfBuilder.create_template(
-            current_formatted_time, PdfBuilder.pagesize
+            current_formatted_time, PdfBuilder.pagesize, output
         )
 
         # This variable "parts" will append all parts (text, images, tables)
@@ -97,91 +165,541 @@ class HardwareReport:
 
         # CPU and memory have data that vary with the analyzed time and
         # therefore need to have their values accumulated for the final values.
-        if cpu:
-            self.cpu_data = defaultdict(list)  # Accumulate CPU data
-        if memory:
-            # Return statistics about system memory usage
-            self.svmem = psutil.virtual_memory()
-            # Return system swap memory statistics
-            self.swap = psutil.swap_memory()
-            self.memory_data = defaultdict(list)  # Accumulate memory data
-            self.swap_data = defaultdict(list)  # Accumulate swap data
-
-        # Set a new current time to be trusted with the parse time
-        current_time = dt.datetime.now()
-        while start_time.timestamp() < current_time.timestamp() < stop_time.timestamp():
-
+        # The accumulation runs on the sampler thread, so creating the report
+        # doesn't block the caller for the whole analysis period.
+        # A sampler can be shared by many reports, in which case it is
+        # started (and stopped) by its owner and each report only reads the
+        # samples inside its own window.
+        # With a store the samples were (or are being) persisted by the
+        # collector daemon, so they are read instead of sampled.
+        # Other sources (e.g. synthetic samples) are read the same way.
+        if source is None:
+            source = PsutilSource() if store is None else ReplaySource(store)
+        self.source = source
+        self.store = store
+        self.owns_sampler = sampler is None and not source.recorded
+        if self.owns_sampler:
+            sampler = Sampler(
+                interval=interval, start_time=start_time, stop_time=stop_time
+            )
+            names = []
             if cpu:
-                # If supported return a list of frequencies for each CPU
-                for i, percentage in enumerate(
-                    psutil.cpu_percent(percpu=True, interval=1)
-                ):
-                    self.cpu_data[f'Core_{i}'].append(percentage)
-
-                # Append a float with the current system-wide CPU utilization
-                # as a percentage
-                self.cpu_data['Total'].append(psutil.cpu_percent())
-                # Append the current datetime
-                self.cpu_data['Datetime'].append(current_time)
-
+                names.append('cpu')
             if memory:
-                # Append the total physical memory in bytes (exclusive swap).
-                self.memory_data['Total'].append(
-                    float(
-                        self.convert_bytes_to_readable_measurement(self.svmem.total)[
-                            :-2
-                        ]
-                    )
-                )
-                # Append the total swap memory in bytes
-                self.swap_data['Total'].append(
-                    float(
-                        self.convert_bytes_to_readable_measurement(self.swap.total)[
-                            :-2]
-                    )
-                )
-                # Append the memory (in bytes) to processes without the system
-                # going into swap
-                self.memory_data['Available'] = float(
-                    self.convert_bytes_to_readable_measurement(self.svmem.available)[
-                        :-2
-                    ]
-                )
-                # Append free swap memory in bytes
-                # Free: Memory not being used at all that is readily available;
-                # note that this doesn’t reflect the actual memory available
-                self.swap_data['Free'] = float(
-                    self.convert_bytes_to_readable_measurement(self.swap.free)[
-                        :-2]
+                names += ['memory', 'swap']
+            if disk:
+                names.append('disk_io')
+            if network:
+                names.append('net_io')
+            if processes:
+                names.append('processes')
+            if cpu or memory or disk:
+                names.append('pressure')
+            for name in names:
+                collector = source.collector(name)
+                # e.g. no pressure stall information outside of Linux
+                if collector is not None:
+                    sampler.add_collector(collector)
+            sampler.start()
+        self.sampler = sampler
+
+    def wait(self, timeout: float = None) -> bool:
+        r"""Wait for the end of the analysis period.
+
+        :param timeout: Maximum time in seconds to wait, defaults to None
+        :return: True if the analysis period is over
+        """
+        if self.source.recorded and not self.source.realtime:
+            # Every sample of the window is already there
+            return True
+        remaining = (self.stop_time - dt.datetime.now()).total_seconds()
+        if timeout is not None:
+            remaining = min(remaining, timeout)
+        if self.sampler is None:
+            time.sleep(max(remaining, 0))
+            return dt.datetime.now() >= self.stop_time
+        self.sampler.join(max(remaining, 0))
+        return (
+            not self.sampler.is_alive()
+            or dt.datetime.now() >= self.stop_time
+        )
+
+    @contextlib.contextmanager
+    def span(self, stage: str, section: str = None) -> None:
+        r"""Measure the time and CPU time of a stage of the report.
+
+        e.g:
+            with self.span('dataframe'):
+                data = ...
+
+        :param stage: Stage of the report, 'collect', 'dataframe',
+        'summary', 'plot' or 'pdf build'
+        :param section: Section of the report, defaults to None (the current
+        section)
+        """
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self.spans.append({
+                'section': section or self.section,
+                'stage': stage,
+                'start': start - self._started,
+                'seconds': time.perf_counter() - start,
+                'cpu_seconds': time.process_time() - cpu_start,
+            })
+
+    def read_rollup(self, name: str) -> tuple:
+        r"""Read the coarsest rollups of a collector enough for the plots.
+
+        A tier is enough if the analysis period has as many of its buckets
+        as points are plotted (half as many with the minmax decimation,
+        which plots two points per bucket).
+
+        :param name: Collector name (e.g. 'cpu', 'memory', 'swap')
+        :return: Tier label and its rows overlapping the analysis period
+        (see rollup.py), None if no tier is enough or has rows
+        """
+        decimation = self.plot_options['decimation']
+        if decimation is None or name in rollup.EXCLUDED:
+            return None
+        points = (self.plot_options['max_points']
+                  or GraphBuilder.default_max_points)
+        if decimation == 'minmax':
+            points //= 2
+        start = to_epoch_ns(self.start_time)
+        stop = to_epoch_ns(self.stop_time)
+        for tier in rollup.choose_tiers(stop - start, points):
+            if self.source.rollups:
+                data = self.source.read(
+                    rollup.family(name, tier),
+                    start - start % rollup.TIERS[tier],
+                    stop,
                 )
-                # Append memory used, calculated differently depending on the
-                # platform and designed for informational purposes only
-                self.memory_data['Used'].append(
-                    float(
-                        self.convert_bytes_to_readable_measurement(self.svmem.used)[
-                            :-2]
-                    )
+            elif (not self.source.recorded
+                  and name in self.sampler.collectors
+                  and tier in self.sampler.buffer(name).rollups):
+                data = self.sampler.rollup(
+                    name, tier, self.start_time, self.stop_time)
+            else:
+                continue
+            # e.g. a store written before the rollups were kept
+            if not data.empty:
+                return tier, data
+        return None
+
+    def get_data(self, name: str) -> pd.DataFrame:
+        r"""Get the samples of a collector inside the analysis period.
+
+        The long periods are read from the rollups of the samples (see
+        read_rollup), a row per bucket as it is plotted: the envelope of
+        the min and the max of each bucket with the minmax decimation, its
+        mean otherwise and its max for the I/O counters.
+
+        :param name: Collector name (e.g. 'cpu', 'memory', 'swap')
+        :return: Dataframe of the samples with the datetime as index
+        """
+        with self.span('dataframe'):
+            rollups = self.read_rollup(name)
+            if rollups is not None:
+                self._rollups[name] = rollups
+                tier, rows = rollups
+                return rollup.plot_frame(name, rows, rollup.TIERS[tier],
+                                         self.plot_options['decimation'])
+            if self.source.recorded:
+                return self.source.read(
+                    name,
+                    to_epoch_ns(self.start_time),
+                    to_epoch_ns(self.stop_time),
                 )
-                # Append used swap memory in bytes
-                self.swap_data['Used'].append(
-                    float(
-                        self.convert_bytes_to_readable_measurement(self.swap.used)[
-                            :-2]
+            if name not in self.sampler.collectors:
+                # Not sampled on this machine (e.g. the pressure outside of
+                # Linux), as a store without the metric
+                return pd.DataFrame(index=to_datetime_index(
+                    np.array([], dtype=np.int64)))
+            # Once the sampler is over its buffers don't change anymore, so
+            # the Dataframe can be a view of them instead of a copy
+            return self.sampler.frame(
+                name,
+                self.start_time,
+                self.stop_time,
+                copy=self.sampler.is_alive(),
+            )
+
+    def get_summary(self, name: str, data: pd.DataFrame) -> pd.DataFrame:
+        r"""Summarize the samples of a collector inside the analysis period.
+
+        The sampler keeps the statistics up to date on every tick, so they
+        aren't computed again from the samples. The recorded samples are
+        summarized in one pass over their Dataframe, and the rollups from
+        the moments of their buckets (see rollup.summarize).
+
+        :param name: Collector name (e.g. 'cpu', 'memory', 'swap')
+        :param data: Samples of the collector inside the analysis period
+        :return: Summary of each series (see stats.SeriesStats.summary)
+        """
+        with self.span('summary'):
+            if name in self._rollups:
+                return rollup.summarize(self._rollups[name][1])
+            if self.source.recorded:
+                return stats.summarize(data)
+            return self.sampler.summary(name, self.start_time, self.stop_time)
+
+    def summary_table(
+        self,
+        label: str,
+        summary: pd.DataFrame,
+        unit: str = '%',
+    ) -> object:
+        r"""Format the summary of some series as a table.
+
+        :param label: Header of the column with the names of the series
+        :param summary: Summary of each series (see get_summary)
+        :param unit: '%' for percentages or 'B' for bytes, defaults to '%'
+        :return: Object with the formatted table for the PDF
+        """
+        columns = ['Min', 'Mean', 'Std', 'p50', 'p95', 'p99', 'Max']
+        data = [[label, *columns]]
+        for series, row in summary[columns].iterrows():
+            values = []
+            for value in row:
+                if value != value:
+                    # NaN, a series without samples in the window
+                    values.append('-')
+                elif unit == 'B':
+                    values.append(
+                        self.convert_bytes_to_readable_measurement(value))
+                else:
+                    values.append(f'{value:.1f}{unit}')
+            data.append([series, *values])
+        return PdfBuilder.format_table(data)
+
+    def append_pressure(self, resource: str) -> None:
+        r"""Append the summary of the pressure stalls of a resource.
+
+        The pressure stall information (PSI) is the share of the time some
+        tasks (or all of them) waited for the resource, sampled on Linux
+        only, nothing is appended without it.
+
+        :param resource: 'cpu', 'memory' or 'io'
+        """
+        if self._pressure is None:
+            data = self.get_data('pressure')
+            self._pressure = (
+                data if data.empty else self.get_summary('pressure', data))
+        rows = [series for series in self._pressure.index
+                if series.startswith(f'{resource}:')]
+        if not rows:
+            return
+        summary = self._pressure.loc[rows]
+        summary.index = [series.split(':')[1].capitalize()
+                         for series in rows]
+        self.parts.append(PdfBuilder.format_text(
+            'Pressure (share of the time stalled):'))
+        self.parts.append(self.summary_table('Stalled', summary))
+
+    def get_memory_data(self, name: str) -> tuple:
+        r"""Get the memory or swap samples ready to be plotted.
+
+        The samples are stored in bytes, here they are all scaled to the same
+        unit and the percentage usage is added as the last column.
+
+        :param name: Collector name ('memory' or 'swap')
+        :return: Scaled Dataframe, its unit, the last sample in bytes and the
+        summary of the series in bytes
+        """
+        data = self.get_data(name)
+        summary = self.get_summary(name, data)
+        data['Percentage_usage'] = self.memory_percentage(name, data)
+
+        if data.empty:
+            # Nothing sampled in the window, the summary uses the current
+            # values
+            collector = (self.source.collector(name)
+                         or collectors.COLLECTORS[name]())
+            sample = collector.collect()
+            if isinstance(sample, np.ndarray):
+                # The values of a collector with columns (e.g. of /proc)
+                sample = dict(zip(collector.columns, sample))
+            current = pd.DataFrame([sample])
+            current['Percentage_usage'] = self.memory_percentage(name, current)
+            last = current.iloc[-1]
+        else:
+            last = data.iloc[-1]
+
+        scaled, unit = utils.scale_bytes(data.drop(columns='Percentage_usage'))
+        scaled['Percentage_usage'] = data['Percentage_usage']
+        return scaled, unit, last, summary
+
+    def memory_percentage(self, name: str, data: pd.DataFrame) -> pd.Series:
+        r"""Compute the percentage usage of memory or swap samples.
+
+        :param name: Collector name ('memory' or 'swap')
+        :param data: Samples in bytes
+        :return: Percentage usage of each sample
+        """
+        return utils.memory_percentage(name, data)
+
+    def get_rates(self, name: str) -> pd.DataFrame:
+        r"""Get the rates per second of the I/O counters of a collector.
+
+        :param name: Collector name ('disk_io' or 'net_io')
+        :return: Dataframe of rates with (device, counter) columns
+        """
+        return utils.device_rates(self.get_data(name))
+
+    def append_io_rates(
+        self,
+        device: str,
+        name: str,
+        counters: dict,
+    ) -> None:
+        r"""Append the plot and the summary of the I/O rates to the PDF.
+
+        The plot shows the throughput (bytes in and out) of each device and
+        their total, the table the mean, percentiles and peak of every rate.
+
+        :param device: Device to be analysed (e.g. 'Disk', 'Network')
+        :param name: Collector name ('disk_io' or 'net_io')
+        :param counters: Label of each counter in the summary table, the
+        first two are the bytes in and out
+        """
+        rates = self.get_rates(name)
+        if rates.empty:
+            self.parts.append(PdfBuilder.format_text(
+                'Not enough samples in the analysis period for the rates.'))
+            return
+
+        bytes_in, bytes_out = list(counters)[:2]
+        throughput, unit = utils.scale_bytes(
+            utils.io_throughput(rates, bytes_in, bytes_out))
+
+        # Sets the table header for the rates summary
+        columns = ['Mean', 'p50', 'p95', 'p99', 'Max']
+        data = [[device, 'Rate', *columns[:-1], 'Peak']]
+        with self.span('summary'):
+            summary = stats.summarize(rates)
+        for (dev, counter), row in summary[columns].iterrows():
+            if counter not in counters:
+                continue
+            values = []
+            for value in row:
+                if value != value:
+                    # NaN, e.g. a device without two samples in a row
+                    values.append('-')
+                elif 'bytes' in counter:
+                    values.append(
+                        f'{self.convert_bytes_to_readable_measurement(value)}/s'
                     )
-                )
+                else:
+                    values.append(f'{value:.1f}/s')
+            data.append([dev, counters[counter], *values])
 
-                # Append the percentage usage calculated as (total - available)
-                # / total * 100
-                self.memory_data['Percentage_usage'].append(self.svmem.percent)
-                # Append the percentage usage calculated as (total - free) /
-                # total * 100
-                self.swap_data['Percentage_usage'].append(self.swap.percent)
-                # Append the current datetime
-                self.memory_data['Datetime'].append(current_time)
-                # Append the current datetime
-                self.swap_data['Datetime'].append(current_time)
+        self.add_plot(device, throughput, unit=f'{unit}/s')
+        self.parts.append(PdfBuilder.format_table(data))
 
-            current_time = dt.datetime.now()  # Updates the current time
+    def add_plot(
+        self,
+        device: str,
+        data: pd.DataFrame,
+        unit: str = 'GB',
+        stacked: bool = False,
+    ) -> None:
+        r"""Append a plot to the PDF, to be rendered with the others.
+
+        The image is a placeholder in the parts until render_plots() is
+        called, so the plots of all the sections are rendered concurrently.
+
+        :param device: Device to be analysed
+        :param data: Data to be plotted
+        :param unit: Unit of the memory and rate data, defaults to 'GB'
+        :param stacked: Stack the series as areas (see
+        GraphBuilder.lineplot), defaults to False
+        """
+        # Decimate before sending the data to the worker, which is much less
+        # data to be copied between the processes
+        max_points = (self.plot_options['max_points']
+                      or GraphBuilder.default_max_points)
+        with self.span('plot'):
+            data = decimate(data, max_points, self.plot_options['decimation'])
+        plot = {
+            'device': device,
+            'data': data,
+            'unit': unit,
+            'max_points': max_points,
+            'decimation': None,
+            'stacked': stacked,
+        }
+        self.plots.append((len(self.parts), plot))
+        self.parts.append(None)
+
+    def render_plots(self) -> None:
+        r"""Render the pending plots and put their images in the parts.
+
+        The plots are rendered over a pool of processes, one per plot up to
+        the number of CPUs (or render_workers) unless the report was given a
+        render_pool, and the images are put back
+        in the order they were added. The images are kept in memory, nothing
+        is written to the working directory.
+        """
+        if not self.plots:
+            return
+        if self.chart_format == 'vector':
+            # The vector charts are only a description of the paths, cheap
+            # enough to be drawn here
+            for index, plot in self.plots:
+                data = plot['data']
+                if plot['stacked']:
+                    # The stacked areas are drawn as the lines of their tops
+                    data = data.copy()
+                    data.iloc[:, :-1] = data.iloc[:, :-1].fillna(0).cumsum(
+                        axis=1)
+                self.parts[index] = PdfBuilder.format_vector_chart(
+                    plot['device'], data, plot['unit'])
+            self.plots = []
+            return
+
+        plots = [plot for _, plot in self.plots]
+        workers = self.render_workers or os.cpu_count() or 1
+        workers = min(workers, len(plots))
+        if self.render_pool is not None:
+            images = list(self.render_pool.map(utils.render_lineplot, plots))
+        elif workers == 1:
+            images = [utils.render_lineplot(plot) for plot in plots]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                images = list(pool.map(utils.render_lineplot, plots))
+        for (index, _), image in zip(self.plots, images):
+            self.parts[index] = PdfBuilder.format_image(filename=BytesIO(image))
+        self.plots = []
+
+    def process_names(self) -> dict:
+        r"""Get the names of the processes ranked by the sampler.
+
+        :return: Name of each PID, empty if the processes weren't sampled
+        by this machine (e.g. recorded samples)
+        """
+        if self.sampler is None:
+            return {}
+        collector = self.sampler.collectors.get('processes')
+        return dict(getattr(collector, 'names', {}))
+
+    def append_processes(self) -> None:
+        r"""Append the charts and the table of the heaviest processes.
+
+        The charts stack the CPU and the memory of the heaviest processes
+        over the window (the other processes of the top are added up), the
+        table has the mean and peak CPU, the peak RSS and how often each
+        heaviest process was in the top.
+        """
+        data = self.get_data('processes')
+        if data.empty:
+            self.parts.append(PdfBuilder.format_text(
+                'No process samples in the analysis period.'))
+            return
+
+        with self.span('summary'):
+            cpu, rss, presence = utils.process_usage(data)
+            names = self.process_names()
+            labels = {pid: f'{names[pid]} ({pid})' if pid in names
+                      else f'PID {pid}' for pid in cpu.columns}
+            mean_cpu = cpu.mean()
+            peak_rss = rss.max()
+            by_cpu = mean_cpu.nlargest(TOP_PROCESSES).index
+            by_rss = peak_rss.nlargest(TOP_PROCESSES).index
+
+        # Sets the table header for the heaviest processes, by CPU and then
+        # the ones only heavy by memory
+        table = [['Process', 'Mean CPU', 'Peak CPU', 'Peak RSS', 'In top']]
+        for pid in [*by_cpu, *by_rss.difference(by_cpu, sort=False)]:
+            table.append([
+                labels[pid],
+                f'{mean_cpu[pid]:.1f}%',
+                f'{cpu[pid].max():.1f}%',
+                self.convert_bytes_to_readable_measurement(peak_rss[pid]),
+                f'{presence[pid] * 100:.0f}%',
+            ])
+        self.parts.append(PdfBuilder.format_table(table))
+
+        for device, usage, heaviest, unit in (
+                ('Process CPU', cpu, by_cpu, '%'),
+                ('Process Memory', rss, by_rss, 'B')):
+            plotted = usage[heaviest].rename(columns=labels)
+            plotted['Other'] = usage.drop(columns=heaviest).sum(axis=1)
+            plotted['Total'] = usage.sum(axis=1)
+            if unit == 'B':
+                plotted, unit = utils.scale_bytes(plotted)
+            self.add_plot(device, plotted, unit=unit, stacked=True)
+
+    def overhead_report(self) -> dict:
+        r"""Get the footprint of the report on the machine, as JSON data.
+
+        :return: Analysis period, spans of each stage of each section (see
+        span), total time and CPU time of the spans, and the footprint of the
+        sampler (see Sampler.overhead), None if the samples were recorded
+        """
+        return {
+            'start_time': self.start_time.isoformat(),
+            'stop_time': self.stop_time.isoformat(),
+            'spans': list(self.spans),
+            'seconds': sum(span['seconds'] for span in self.spans),
+            'cpu_seconds': sum(span['cpu_seconds'] for span in self.spans),
+            'sampler': (None if self.sampler is None
+                        else self.sampler.overhead()),
+        }
+
+    def write_overhead(self, filename: str) -> None:
+        r"""Save the footprint of the report as a JSON file.
+
+        :param filename: Path with the filename of the JSON file
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.overhead_report(), file, indent=2)
+
+    def append_overhead(self) -> None:
+        r"""Append the appendix page with the footprint of the report.
+
+        The page is built with the PDF, so the time to build it is only in
+        the JSON export (see write_overhead).
+        """
+        overhead = self.overhead_report()
+        self.parts.append(PdfBuilder.go_next_page())
+        title = ' Appendix: Report Overhead '
+        text = f"""{title.center(88, "=")}\n\n
+            Time spent by this report in each section, and CPU time of the
+            process during that time (of all its threads).
+            """
+        self.parts.append(PdfBuilder.format_text(text))
+
+        # The spans of a stage are added up (e.g. memory and swap)
+        totals = {}
+        for span in overhead['spans']:
+            total = totals.setdefault((span['section'], span['stage']),
+                                      [0.0, 0.0])
+            total[0] += span['seconds']
+            total[1] += span['cpu_seconds']
+        data = [['Section', 'Stage', 'Time', 'CPU time']]
+        for (section, stage), (seconds, cpu_seconds) in totals.items():
+            data.append([section, stage, f'{seconds * 1e3:.1f}ms',
+                         f'{cpu_seconds * 1e3:.1f}ms'])
+        self.parts.append(PdfBuilder.format_table(data))
+
+        sampler = overhead['sampler']
+        if sampler is None:
+            text = """
+            The samples were recorded, this report didn't sample the machine.
+            """
+        else:
+            text = f"""
+            Sampler (since {self.sampler.started_at:%H:%M:%S}):
+            \tTicks: {sampler['ticks']} ({sampler['missed_ticks']} missed)
+            \tJitter: mean {sampler['jitter_mean'] * 1e3:.2f}ms, p95 {sampler['jitter_p95'] * 1e3:.2f}ms, max {sampler['jitter_max'] * 1e3:.2f}ms
+            \tSampler CPU time: {sampler['thread_cpu']:.3f}s ({sampler['thread_cpu_percent']:.2f}% of a CPU)
+            \tProcess CPU time: {sampler['process_cpu']:.3f}s ({sampler['process_cpu_percent']:.2f}% of a CPU)
+            \tProcess RSS: {self.convert_bytes_to_readable_measurement(sampler['rss'])} (peak {self.convert_bytes_to_readable_measurement(sampler['rss_peak'])})
+            """
+        self.parts.append(PdfBuilder.format_text(text))
 
     def convert_bytes_to_readable_measurement(self, byte_value, suffix='B'):
         """
@@ -191,15 +709,22 @@ class HardwareReport:
             1253656 => '1.20MB'
             1253656678 => '1.17GB'
         """
-        factor = 1024
-        for unit in ['', 'K', 'M', 'G', 'T', 'P']:
-            if byte_value < factor:
-                return f'{byte_value:.2f}{unit}{suffix}'
-            byte_value /= factor
+        return utils.convert_bytes_to_readable_measurement(byte_value, suffix)
 
     def generate_pdf(self):
         """Contain all functions to generate the PDF report."""
+        self._started = time.perf_counter()
+        self.spans = []
+        self._pressure = None
+        self._rollups = {}
+        # The report can only be generated after the analysis period
+        with self.span('collect'):
+            self.wait()
+            # Static information of the machine (system, CPU, disks and NICs)
+            info = self.source.machine_info()
+
         if self.system:
+            self.section = 'system'
             """
             System Information with six attributes:
                 System: Return the system/OS name, such as 'Linux', 'Darwin', 'Windows'.
@@ -212,10 +737,9 @@ class HardwareReport:
                     On Windows this function may return a time which is off by 1 second
                     if it’s used across different processes.
             """
-            # Return a tuple() containing the six system attributes
-            uname = platform.uname()
-
-            boot_time_timestamp = psutil.boot_time()
+            # Return a tuple() containing the six system attributes and
+            # the boot time
+            uname, boot_time_timestamp = info.uname, info.boot_time
             bt = dt.datetime.fromtimestamp(boot_time_timestamp)
 
             title = ' System Information '
@@ -232,6 +756,7 @@ class HardwareReport:
             self.parts.append(PdfBuilder.format_text(text))
 
         if self.cpu:
+            self.section = 'cpu'
             """
             CPU information with 5 attributes:
                 Physical cores: The number of physical cores
@@ -244,34 +769,42 @@ class HardwareReport:
             # CPU frequencies in Mhz (current, min and max)
             # On Linux current frequency reports the real-time value,
             # on all others it usually represents the nominal “fixed” value.
-            cpufreq = psutil.cpu_freq()
+            cpufreq = info.cpu_freq
 
             text = f"""{title.center(89, "=")}\n\n
-            Physical cores: {psutil.cpu_count(logical=False)}
-            Total cores: {psutil.cpu_count(logical=True)}
-            Max Frequency: {cpufreq.max:.2f}Mhz
+            Physical cores: {info.cpu_count.physical}
+            Total cores: {info.cpu_count.logical}
+            """
+            if cpufreq is not None:
+                text += f"""Max Frequency: {cpufreq.max:.2f}Mhz
             Min Frequency: {cpufreq.min:.2f}Mhz
             Current Frequency: {cpufreq.current:.2f}Mhz
             """
-            cpu_plot_filename = 'cpu_plot.png'
+            # In a container, the usage is a percentage of its CPU quota
+            container = getattr(info, 'cgroup', None)
+            if container is not None:
+                text += f"""CPU quota: {container.cpu_limit:.2f} CPUs (cgroup {container.path})
+            """
             # Sets the CPU data into a Dataframe
-            core = pd.DataFrame(self.cpu_data)
-            # Sets the datetime as the new index
-            core.set_index('Datetime', inplace=True)
-            # Creates the CPU plot
-            GraphBuilder.lineplot('CPU', core, cpu_plot_filename)
-
-            text += 'Peak CPU Usage:'
-            for i in range(len(core.max())):
-                text += f"""
-                \t{core.columns[i]}: {core.max()[i]}%"""
+            core = self.get_data('cpu')
 
+            text += 'CPU Usage:'
             self.parts.append(PdfBuilder.format_text(text))
-            self.parts.append(PdfBuilder.format_image(
-                filename=cpu_plot_filename))
+            # The series of a cgroup are the user, system, throttled and
+            # total times (see cgroup.CgroupCpuCollector), not cores
+            self.parts.append(self.summary_table(
+                'Core' if container is None else 'Series',
+                self.get_summary('cpu', core)))
+            self.append_pressure('cpu')
+            # Creates the CPU plot, without the share of the time throttled
+            # of a cgroup, which isn't a usage (it's in the table)
+            if container is not None:
+                core = core.drop(columns='Throttled', errors='ignore')
+            self.add_plot('CPU', core)
             self.parts.append(PdfBuilder.go_next_page())
 
         if self.memory:
+            self.section = 'memory'
             """
             Memory/Swap Information with 4 attributes:
 
@@ -288,52 +821,52 @@ class HardwareReport:
                 Free: Free swap memory
                 Used: Used swap memory
                 Percentage usage: The percentage usage calculated as:
-                                (total - free) / total * 100
+                                used / total * 100
 
             Ps. Swap memory doesn't have the attribute "available",
             we use "free".
             """
+            # Sets the memory data into a Dataframe
+            memory, unit, svmem, summary = self.get_memory_data('memory')
+
             title1 = ' Memory Information '
             text = f"""{title1.center(91, "=")}\n\n
             Total: {self.convert_bytes_to_readable_measurement(
-                self.svmem.total)}
+                svmem.Total)}
             Available: {self.convert_bytes_to_readable_measurement(
-                self.svmem.available)}
-            Used: {self.convert_bytes_to_readable_measurement(self.svmem.used)}
-            Percentage usage: {self.svmem.percent}%
+                svmem.Available)}
+            Used: {self.convert_bytes_to_readable_measurement(svmem.Used)}
+            Percentage usage: {svmem.Percentage_usage}%
             """
             self.parts.append(PdfBuilder.format_text(text))
+            self.parts.append(self.summary_table(
+                'Memory', summary.drop(index='Total', errors='ignore'), 'B'))
+            self.append_pressure('memory')
 
-            # Sets the memory data into a Dataframe
-            memory = pd.DataFrame(self.memory_data)
-            # Sets the datetime as the new index
-            memory.set_index('Datetime', inplace=True)
             # Creates the memory plot
-            plot_filename = 'memory_plot.png'
-            GraphBuilder.lineplot('Memory', memory, plot_filename)
-            self.parts.append(PdfBuilder.format_image(filename=plot_filename))
+            self.add_plot('Memory', memory, unit=unit)
             self.parts.append(PdfBuilder.go_next_page())
 
+            # Sets the swap data into a Dataframe
+            memory, unit, swap, summary = self.get_memory_data('swap')
+
             title2 = ' SWAP '
             text = f"""{title2.center(87, "=")}\n\n
             Total: {self.convert_bytes_to_readable_measurement(
-                self.swap.total)}
-            Free: {self.convert_bytes_to_readable_measurement(self.swap.free)}
-            Used: {self.convert_bytes_to_readable_measurement(self.swap.used)}
-            Percentage usage: {self.swap.percent}%
+                swap.Total)}
+            Free: {self.convert_bytes_to_readable_measurement(swap.Free)}
+            Used: {self.convert_bytes_to_readable_measurement(swap.Used)}
+            Percentage usage: {swap.Percentage_usage}%
             """
             self.parts.append(PdfBuilder.format_text(text))
+            self.parts.append(self.summary_table(
+                'Swap', summary.drop(index='Total', errors='ignore'), 'B'))
 
-            # Sets the swap data into a Dataframe
-            memory = pd.DataFrame(self.swap_data)
-            # Sets the datetime as the new index
-            memory.set_index('Datetime', inplace=True)
             # Creates the swap plot
-            plot_filename = 'swap_plot.png'
-            GraphBuilder.lineplot('Swap', memory, plot_filename)
-            self.parts.append(PdfBuilder.format_image(filename=plot_filename))
+            self.add_plot('Swap', memory, unit=unit)
 
         if self.disk:
+            self.section = 'disk'
             """
             Disk Information with 6 attributes:
                 Device: The device path (e.g. "/dev/hda1").
@@ -349,7 +882,7 @@ class HardwareReport:
             # Return all mounted disk partitions as a list of named tuples
             # including device, mount point and filesystem type, similarly
             # to “df” command on UNIX
-            partitions = psutil.disk_partitions()
+            partitions = info.partitions
             title = ' Disk Information '
             text = f"""{title.center(92, "=")}\n\n
             """
@@ -358,37 +891,50 @@ class HardwareReport:
             # Sets the table header for the Disks information
             data = [['Device', 'Mount', 'Fstype',
                      'Total', 'Used', 'Free', 'Usage(%)']]
-            for i, partition in enumerate(partitions):
-                try:
-                    partition_usage = psutil.disk_usage(partition.mountpoint)
-                    # Creates a table with the disk information
-                    data.append(
-                        [
-                            f'{partition.device}',
-                            f'{partition.mountpoint}',
-                            f'{partition.fstype}',
-                            f'{self.convert_bytes_to_readable_measurement(partition_usage.total)}',
-                            f'{self.convert_bytes_to_readable_measurement(partition_usage.used)}',
-                            f'{self.convert_bytes_to_readable_measurement(partition_usage.free)}',
-                            f'{partition_usage.percent}%',
-                        ]
-                    )
-                except PermissionError:
-                    # This can be catched due to the disk that isn't ready
+            for partition in partitions:
+                partition_usage = partition.usage
+                if partition_usage is None:
+                    # The disk wasn't ready when its usage was read
                     continue
+                # Creates a table with the disk information
+                data.append(
+                    [
+                        f'{partition.device}',
+                        f'{partition.mountpoint}',
+                        f'{partition.fstype}',
+                        f'{self.convert_bytes_to_readable_measurement(partition_usage.total)}',
+                        f'{self.convert_bytes_to_readable_measurement(partition_usage.used)}',
+                        f'{self.convert_bytes_to_readable_measurement(partition_usage.free)}',
+                        f'{partition_usage.percent}%',
+                    ]
+                )
             self.parts.append(PdfBuilder.format_table(data))
 
-            # Return IO statistics since boot
-            disk_io = psutil.disk_io_counters()
-
-            text = f"""
+            # IO statistics since boot
+            disk_io = info.disk_io
+            if disk_io is not None:
+                text = f"""
             Total bytes read: {self.convert_bytes_to_readable_measurement(disk_io.read_bytes)}
             Total bytes written: {self.convert_bytes_to_readable_measurement(disk_io.write_bytes)}
             """
-            self.parts.append(PdfBuilder.format_text(text))
+                self.parts.append(PdfBuilder.format_text(text))
+
+            # Throughput and IOPS of each disk during the analysis period
+            self.append_io_rates(
+                'Disk',
+                'disk_io',
+                {
+                    'read_bytes': 'Read',
+                    'write_bytes': 'Written',
+                    'read_count': 'Read IOPS',
+                    'write_count': 'Write IOPS',
+                },
+            )
+            self.append_pressure('io')
             self.parts.append(PdfBuilder.go_next_page())
 
         if self.network:
+            self.section = 'network'
             """
             Network Information:
             System-wide network I/O statistics as a named tuple including
@@ -449,18 +995,13 @@ class HardwareReport:
                 psutil.NIC_DUPLEX_UNKNOWN: '?',
             }
 
-            # Return information about each NIC (network interface card)
-            # installed on the system
-            stats = psutil.net_if_stats()
-            # Return system-wide network I/O statistics as a named tuple
-            io_counters = psutil.net_io_counters(pernic=True)
-
-            # Creates a table with the network information (with no grid).
+            # Creates a table with the network information (with no grid)
+            # of each NIC (network interface card) installed on the system
             data = []
-            for nic, addrs in psutil.net_if_addrs().items():
+            for nic, nic_info in info.nics.items():
                 data.append([f'{nic}:', '', ''])
-                if nic in stats:
-                    st = stats[nic]
+                if nic_info.stats is not None:
+                    st = nic_info.stats
                     data.append(
                         [
                             '',
@@ -468,8 +1009,8 @@ class HardwareReport:
                             f": speed={st.speed}MB, duplex={duplex_map[st.duplex]}, mtu={st.mtu}, up={'yes' if st.isup else 'no'}",
                         ]
                     )
-                if nic in io_counters:
-                    io = io_counters[nic]
+                if nic_info.io is not None:
+                    io = nic_info.io
                     data.append(
                         [
                             '',
@@ -484,7 +1025,7 @@ class HardwareReport:
                             f': bytes={bytes2human(io.bytes_sent)}, pkts={io.packets_sent}, errs={io.errout}, drops={io.dropout}',
                         ]
                     )
-                for addr in addrs:
+                for addr in nic_info.addrs:
                     data.append(
                         [
                             '',
@@ -502,16 +1043,70 @@ class HardwareReport:
                         data.append(['', '        p2p', f': {addr.ptp}'])
             self.parts.append(PdfBuilder.unformatted_table(data))
 
-        # Creates the final PDF file with all the appended parts
-        PdfBuilder.build_pdf(self.canvas, self.parts)
+            # Throughput and packet rates of each NIC during the analysis
+            # period
+            self.parts.append(PdfBuilder.go_next_page())
+            self.append_io_rates(
+                'Network',
+                'net_io',
+                {
+                    'bytes_recv': 'Received',
+                    'bytes_sent': 'Sent',
+                    'packets_recv': 'Packets received',
+                    'packets_sent': 'Packets sent',
+                },
+            )
+
+        if self.processes:
+            self.section = 'processes'
+            """
+            Heaviest processes of the analysis period, sampled on each tick
+            as the top processes by CPU and by memory (RSS):
+                Mean CPU: Mean percentage of one CPU over the period (0
+                    while the process wasn't in the top)
+                Peak CPU: Maximum percentage of one CPU, above 100% for a
+                    process running on many cores
+                Peak RSS: Maximum resident memory
+                In top: Share of the samples where the process was in the
+                    top
+            """
+            self.parts.append(PdfBuilder.go_next_page())
+            title = ' Processes '
+            text = f"""{title.center(91, "=")}\n\n
+            Heaviest processes by CPU and by memory:
+            """
+            self.parts.append(PdfBuilder.format_text(text))
+            self.append_processes()
 
-        # Delete all saved graph files
-        plots = glob('*.png')
-        for plot in plots:
-            os.remove(plot)
+        # Renders the plots of all the sections at the same time
+        self.section = 'report'
+        with self.span('plot'):
+            self.render_plots()
+
+        if self._rollups:
+            # Under the header, once the placeholders of the plots are
+            # replaced
+            tiers = {tier for tier, _ in self._rollups.values()}
+            self.parts.insert(2, PdfBuilder.format_text(
+                f"Resolution: {' and '.join(sorted(tiers))} rollups "
+                f"({', '.join(self._rollups)}), the percentiles are the ones "
+                'of their means\n'))
+
+        if self.overhead:
+            self.append_overhead()
+
+        # Creates the final PDF file with all the appended parts
+        with self.span('pdf build'):
+            PdfBuilder.build_pdf(self.canvas, self.parts)
 
 
 if __name__ == '__main__':
+    # The default analysis period will have start_time as the current time
+    # and stop_time as the current time plus 1 minute.
+    # It will therefore be a one-minute report. For testing, just run the
+    # code (see cli.py for other windows and for the stored samples).
+    start_time = dt.datetime.now()
+    stop_time = start_time + dt.timedelta(minutes=1)
     report = HardwareReport(
         start_time=start_time,
         stop_time=stop_time,
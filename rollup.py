@@ -0,0 +1,395 @@
+"""
+Multi-resolution rollups of the samples, for the reports of long windows.
+
+A chart is about a thousand pixels wide (see decimation.py), so most of the
+samples of a week at 1 Hz (600k rows per series) would be read only to be
+thrown away. The samples of each metric family are also aggregated as they
+arrive, in buckets of a fixed length, one tier per length:
+
+    1min: A row per minute
+    1h: A row per hour
+
+Each row has the count, min, mean, max and standard deviation of every
+series over its bucket, in columns named '<aggregate>:<series>' (e.g.
+'max:Total'), stamped with the start of the bucket. So a tier is kept as any
+other metric family (e.g. 'cpu@1min' in a MetricsStore, see store.py).
+
+A report picks the coarsest tier with enough buckets for the width of its
+charts (see choose_tiers): the charts show the min/max envelope of the
+buckets (or their means) and the summaries merge the moments of the buckets,
+which is exact for the count, min, mean, standard deviation and max. Only
+the percentiles are estimated, from the means of the buckets weighted by
+their count.
+"""
+import numpy as np
+import pandas as pd
+from stats import PERCENTILES
+
+# Length of the buckets of each tier in nanoseconds, finest first
+TIERS = {
+    '1min': 60 * 10**9,
+    '1h': 60 * 60 * 10**9,
+}
+
+# Aggregates of each series in the rows of a tier
+AGGREGATES = ('count', 'min', 'mean', 'max', 'std')
+
+# Metric families without rollups: the columns of the processes are ranks,
+# a different process on every tick
+EXCLUDED = frozenset({'processes'})
+
+# Metric families of counters that only grow, whose value at the end of a
+# bucket is its max (see plot_frame)
+COUNTERS = frozenset({'disk_io', 'net_io'})
+
+
+class Rollup:
+    """Aggregates of the samples of a metric family over one tier."""
+
+    def __init__(self, width: int) -> None:
+        r"""Contain the initial arguments.
+
+        :param width: Length of the buckets in nanoseconds
+        """
+        self.width = int(width)
+        self.columns = []
+        self._column_index = {}
+        # Names of the aggregates of the columns, rebuilt when a column is
+        # added
+        self._names = []
+        # Column positions of the last samples, to skip the lookup of the
+        # names on every tick
+        self._last_columns = None
+        self._last_index = None
+        self._ordered = False
+        # Start of the open bucket and the moments of its samples
+        self.start = None
+        self._count = np.zeros(0)
+        self._mean = np.zeros(0)
+        self._m2 = np.zeros(0)
+        self._min = np.zeros(0)
+        self._max = np.zeros(0)
+
+    def _index_of(self, columns: list) -> np.ndarray:
+        # Position of each column, adding the columns not seen before
+        # (a list of columns can grow, e.g. the ones of a RingBuffer)
+        if (columns is self._last_columns
+                and len(columns) == len(self._last_index)):
+            return self._last_index
+        new_columns = [column for column in columns
+                       if column not in self._column_index]
+        if new_columns:
+            for column in new_columns:
+                self._column_index[column] = len(self.columns)
+                self.columns.append(column)
+            size = len(self.columns)
+            missing = size - len(self._count)
+            self._count = np.concatenate((self._count, np.zeros(missing)))
+            self._mean = np.concatenate((self._mean, np.zeros(missing)))
+            self._m2 = np.concatenate((self._m2, np.zeros(missing)))
+            self._min = np.concatenate(
+                (self._min, np.full(missing, np.nan)))
+            self._max = np.concatenate(
+                (self._max, np.full(missing, np.nan)))
+            self._names = [f'{aggregate}:{column}'
+                           for aggregate in AGGREGATES
+                           for column in self.columns]
+        self._last_columns = columns
+        self._last_index = np.array(
+            [self._column_index[column] for column in columns], dtype=np.intp)
+        # Whether the values are already in the order of the columns
+        self._ordered = bool(
+            np.array_equal(self._last_index, np.arange(len(columns))))
+        return self._last_index
+
+    @property
+    def names(self) -> list:
+        r"""Names of the columns of the rows of the tier."""
+        return self._names
+
+    def current(self) -> tuple:
+        r"""Get the row of the open bucket, with the samples so far.
+
+        :return: Start of the bucket and its row, None if no sample arrived
+        """
+        if self.start is None:
+            return None
+        with np.errstate(invalid='ignore', divide='ignore'):
+            present = self._count > 0
+            row = np.concatenate((
+                self._count,
+                self._min,
+                np.where(present, self._mean, np.nan),
+                self._max,
+                np.where(present, np.sqrt(self._m2 / self._count), np.nan),
+            ))
+        return self.start, row
+
+    def _close(self) -> tuple:
+        # Row of the open bucket, which starts again without samples
+        closed = self.current()
+        self._count = np.zeros(len(self.columns))
+        self._mean = np.zeros(len(self.columns))
+        self._m2 = np.zeros(len(self.columns))
+        self._min = np.full(len(self.columns), np.nan)
+        self._max = np.full(len(self.columns), np.nan)
+        return closed
+
+    def update(self, timestamp: int, values: np.ndarray, columns: list) -> list:
+        r"""Add one sample, as it arrives.
+
+        :param timestamp: Epoch time of the sample in nanoseconds, after the
+        samples already added
+        :param values: Values of the series named by columns, NaN if missing
+        :param columns: Names of the values. Passing the same list object on
+        every tick avoids looking up the names again.
+        :return: Start and row of the buckets closed by the sample (see
+        names), at most one
+        """
+        index = self._index_of(columns)
+        start = timestamp - timestamp % self.width
+        closed = []
+        if self.start != start:
+            if self.start is not None:
+                closed.append(self._close())
+            self.start = start
+
+        if len(index) == len(self.columns) and self._ordered:
+            row = np.asarray(values, dtype=np.float64)
+        else:
+            row = np.full(len(self.columns), np.nan)
+            row[index] = values
+        # Welford's update of the mean and the sum of squared differences
+        delta = row - self._mean
+        if np.isnan(delta).any():
+            # Only of the series with a value
+            present = ~np.isnan(row)
+            self._count += present
+            delta[~present] = 0.0
+            self._mean += delta / np.maximum(self._count, 1)
+            self._m2 += delta * np.where(present, row - self._mean, 0.0)
+        else:
+            self._count += 1
+            self._mean += delta / self._count
+            self._m2 += delta * (row - self._mean)
+        np.fmin(self._min, row, out=self._min)
+        np.fmax(self._max, row, out=self._max)
+        return closed
+
+    def extend(
+        self,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        columns: list,
+    ) -> list:
+        r"""Add a batch of samples at once.
+
+        :param timestamps: Epoch times of the samples in nanoseconds, in
+        order and after the samples already added
+        :param values: 2D array with a row per sample and a column per series
+        :param columns: Names of the columns of the values
+        :return: Start and row of each bucket closed by the samples (see
+        names)
+        """
+        if not len(timestamps):
+            return []
+        index = self._index_of(columns)
+        rows = np.full((len(timestamps), len(self.columns)), np.nan)
+        rows[:, index] = values
+        starts = timestamps - timestamps % self.width
+        # First sample of each bucket
+        firsts = np.flatnonzero(np.diff(starts, prepend=starts[0] - 1))
+        lengths = np.diff(firsts, append=len(rows))
+
+        present = ~np.isnan(rows)
+        count = np.add.reduceat(present, firsts, axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.add.reduceat(
+                np.where(present, rows, 0.0), firsts, axis=0) / count
+        mean = np.where(count > 0, mean, 0.0)
+        deviations = np.where(
+            present, rows - np.repeat(mean, lengths, axis=0), 0.0)
+        m2 = np.add.reduceat(deviations**2, firsts, axis=0)
+        minimum = np.fmin.reduceat(rows, firsts, axis=0)
+        maximum = np.fmax.reduceat(rows, firsts, axis=0)
+
+        closed = []
+        for bucket, start in enumerate(starts[firsts]):
+            if self.start != start:
+                if self.start is not None:
+                    closed.append(self._close())
+                self.start = int(start)
+            # Chan's formula to merge the samples of the batch with the ones
+            # already in the bucket (none but for the first bucket)
+            total = self._count + count[bucket]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                weight = np.where(total > 0, count[bucket] / total, 0.0)
+            delta = mean[bucket] - self._mean
+            self._mean += delta * weight
+            self._m2 += m2[bucket] + delta**2 * self._count * weight
+            self._count = total
+            np.fmin(self._min, minimum[bucket], out=self._min)
+            np.fmax(self._max, maximum[bucket], out=self._max)
+        return closed
+
+    def flush(self) -> list:
+        r"""Close the open bucket, e.g. before the samples stop.
+
+        A bucket closed early is only partial: the next samples of the same
+        bucket are in another row with the same start.
+
+        :return: Start and row of the open bucket (see names), if any
+        """
+        if self.start is None:
+            return []
+        closed = self._close()
+        self.start = None
+        return [closed]
+
+
+# General functions
+
+
+def family(name: str, tier: str) -> str:
+    r"""Get the name of the metric family of a tier.
+
+    :param name: Metric family of the samples (collector name)
+    :param tier: Tier label (e.g. '1min')
+    :return: Metric family of the rows of the tier, e.g. 'cpu@1min'
+    """
+    return f'{name}@{tier}'
+
+
+def choose_tiers(window: int, points: int) -> list:
+    r"""Get the tiers with enough buckets to plot a window.
+
+    :param window: Length of the window in nanoseconds
+    :param points: Buckets needed in the window, e.g. the width of the
+    chart in pixels
+    :return: Labels of the tiers with at least that many buckets in the
+    window, the coarsest first
+    """
+    return [tier for tier, width in reversed(TIERS.items())
+            if window // width >= points]
+
+
+def aggregate(data: pd.DataFrame, name: str) -> pd.DataFrame:
+    r"""Get one aggregate of every series of the rows of a tier.
+
+    :param data: Rows of a tier, with '<aggregate>:<series>' columns
+    :param name: Aggregate (e.g. 'max', see AGGREGATES)
+    :return: Dataframe with a column per series
+    """
+    prefix = f'{name}:'
+    columns = [column for column in data.columns
+               if column.startswith(prefix)]
+    result = data[columns]
+    result.columns = [column[len(prefix):] for column in columns]
+    return result
+
+
+def envelope(data: pd.DataFrame, width: int) -> pd.DataFrame:
+    r"""Get the min/max envelope of the rows of a tier, to be plotted.
+
+    It's what the minmax decimation of the samples gives (see
+    decimation.minmax_decimate), with a bucket per row.
+
+    :param data: Rows of a tier, with '<aggregate>:<series>' columns
+    :param width: Length of the buckets in nanoseconds
+    :return: Dataframe with two rows per bucket: the minimum at its start and
+    the maximum at its middle
+    """
+    minimum = aggregate(data, 'min')
+    values = np.empty((2 * len(data), minimum.shape[1]))
+    values[0::2] = minimum.to_numpy(dtype=np.float64)
+    values[1::2] = aggregate(data, 'max').to_numpy(dtype=np.float64)
+    index = data.index.repeat(2) + pd.to_timedelta(
+        np.tile([0, width // 2], len(data)), unit='ns')
+    return pd.DataFrame(values, index=index.rename(data.index.name),
+                        columns=minimum.columns, copy=False)
+
+
+def plot_frame(
+    name: str,
+    data: pd.DataFrame,
+    width: int,
+    decimation: str,
+) -> pd.DataFrame:
+    r"""Get the series of the rows of a tier, as the report plots them.
+
+    :param name: Metric family of the samples (collector name)
+    :param data: Rows of a tier, with '<aggregate>:<series>' columns
+    :param width: Length of the buckets in nanoseconds
+    :param decimation: Decimation of the report, 'minmax' plots the
+    envelope of the buckets and 'lttb' their means
+    :return: Dataframe with a column per series. The counters are the max of
+    each bucket, their value at its end, so their rates are the mean rates
+    of the buckets.
+    """
+    if name in COUNTERS:
+        return aggregate(data, 'max')
+    if decimation == 'minmax':
+        return envelope(data, width)
+    return aggregate(data, 'mean')
+
+
+def weighted_quantiles(
+    values: np.ndarray,
+    weights: np.ndarray,
+    q: float,
+) -> np.ndarray:
+    r"""Estimate a quantile of each column of values weighted by counts.
+
+    :param values: 2D array with a column per series, NaN if missing
+    :param weights: Weight of each value, e.g. the samples of its bucket
+    :param q: Quantile between 0 and 1 (e.g. 0.95)
+    :return: Quantile of each column, NaN for a column without values
+    """
+    result = np.full(values.shape[1], np.nan)
+    for column in range(values.shape[1]):
+        present = ~np.isnan(values[:, column]) & (weights[:, column] > 0)
+        if not present.any():
+            continue
+        order = np.argsort(values[present, column], kind='stable')
+        cumulative = np.cumsum(weights[present, column][order])
+        position = np.searchsorted(cumulative, q * cumulative[-1])
+        result[column] = values[present, column][order][
+            min(position, len(order) - 1)]
+    return result
+
+
+def summarize(data: pd.DataFrame) -> pd.DataFrame:
+    r"""Summarize the series of the rows of a tier.
+
+    The count, min, mean, standard deviation and max are the ones of the
+    samples of the buckets, merged with Chan's formula. The percentiles are
+    the ones of the bucket means, so they underestimate the short peaks (the
+    max doesn't).
+
+    :param data: Rows of a tier, with '<aggregate>:<series>' columns
+    :return: Summary of each series (see stats.SeriesStats.summary)
+    """
+    values = {name: aggregate(data, name).to_numpy(dtype=np.float64)
+              for name in AGGREGATES}
+    count = np.nan_to_num(values['count'])
+    mean = np.nan_to_num(values['mean'])
+    total = count.sum(axis=0)
+    present = total > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        overall = (count * mean).sum(axis=0) / total
+        m2 = ((count * np.nan_to_num(values['std'])**2).sum(axis=0)
+              + (count * (mean - overall)**2).sum(axis=0))
+    summary = {
+        'Count': total.astype(np.int64),
+        'Min': np.where(present, np.min(
+            values['min'], axis=0, initial=np.inf, where=count > 0), np.nan),
+        'Mean': np.where(present, overall, np.nan),
+        'Std': np.where(present, np.sqrt(m2 / np.maximum(total, 1)), np.nan),
+    }
+    for percentile in PERCENTILES:
+        summary[f'p{percentile}'] = weighted_quantiles(
+            values['mean'], count, percentile / 100)
+    summary['Max'] = np.where(present, np.max(
+        values['max'], axis=0, initial=-np.inf, where=count > 0), np.nan)
+    return pd.DataFrame(summary, index=pd.Index(
+        list(aggregate(data, 'mean').columns)))
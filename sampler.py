@@ -0,0 +1,418 @@
+"""
+Background sampling engine used by the hardware report.
+
+The sampler runs every registered collector on a dedicated thread, on a fixed
+cadence that is corrected for drift, between a start and a stop time. This
+keeps the collection away from the caller (e.g. the Streamlit script), which
+can keep rendering while the data accumulates.
+
+The sampler also measures its own footprint on the host (see overhead): the
+CPU time of its thread, the memory of the process, how late the ticks are
+and how many were missed.
+
+The buffers also keep the rollups of the samples (see rollup.py), over the
+same span of time as the samples, so the report of a long window reads a row
+per minute or per hour instead of every sample.
+"""
+import collections
+import datetime as dt
+import math
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import rollup
+from stats import DEFAULT_BLOCK, SUMMARIZED
+from store import RingBuffer, to_epoch_ns
+
+# Samples kept per collector when the analysis period has no end
+DEFAULT_CAPACITY = 24 * 60 * 60
+
+# Latest ticks whose lateness is kept for the jitter percentiles
+JITTER_SAMPLES = 1024
+
+
+class Sampler:
+    """Collect samples from a set of collectors on a background thread.
+
+    A collector is any object with a ``name`` attribute and a ``collect()``
+    method returning a dict with the values of the current tick, or a NumPy
+    array of values named by its ``columns`` attribute. All the
+    collectors share the same clock: every tick appends one row per collector
+    stamped with the same timestamp. The rows are kept in a ring buffer per
+    collector (see store.RingBuffer), whose values have the type given by the
+    optional ``dtype`` attribute of the collector (float64 by default).
+    """
+
+    def __init__(
+        self,
+        interval: float = 1.0,
+        start_time: dt.datetime = None,
+        stop_time: dt.datetime = None,
+        capacity: int = None,
+        eviction: str = 'drop_oldest',
+        stats_block: int = DEFAULT_BLOCK,
+        rollups: bool = True,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param interval: Time in seconds between two ticks, defaults to 1.0
+        :param start_time: Time to take the first sample, defaults to None
+        (start right away)
+        :param stop_time: Time to stop sampling, defaults to None
+        (sample until stop() is called)
+        :param capacity: Maximum number of samples kept per collector,
+        defaults to None (enough for the whole analysis period, or
+        DEFAULT_CAPACITY if it has no start or stop)
+        :param eviction: What to do with new samples when the buffer is full
+        (see store.RingBuffer), defaults to 'drop_oldest'
+        :param stats_block: Length in nanoseconds of the blocks of the
+        statistics kept up to date on every tick (see summary), defaults to
+        ten minutes. None keeps no statistics. Only the families summarized
+        by the reports (stats.SUMMARIZED) keep them, the summaries of the
+        others are computed from their samples.
+        :param rollups: Keep the rollups of the samples of each collector
+        (see rollup), defaults to True
+        """
+        if interval <= 0:
+            raise ValueError('The sampling interval must be positive')
+        self.interval = interval
+        self.start_time = start_time
+        self.stop_time = stop_time
+        if capacity is None:
+            capacity = DEFAULT_CAPACITY
+            if start_time is not None and stop_time is not None:
+                window = (stop_time - start_time).total_seconds()
+                capacity = max(math.ceil(window / interval) + 1, 1)
+        self.capacity = capacity
+        self.eviction = eviction
+        self.stats_block = stats_block
+        self.rollups = rollups
+
+        self._collectors = {}
+        self._data = {}
+        self._sinks = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Times the sampling thread was started and finished
+        self.started_at = None
+        self.stopped_at = None
+
+        # Footprint of the sampler, updated by the sampling thread
+        self._process = psutil.Process()
+        self._process_cpu = None
+        self._ticks = 0
+        self._missed_ticks = 0
+        self._lateness = collections.deque(maxlen=JITTER_SAMPLES)
+        self._thread_cpu = 0.0
+        self._rss_peak = 0
+
+    def add_collector(self, collector: object) -> None:
+        r"""Register a collector to be run on every tick.
+
+        :param collector: Object with a name and a collect() method
+        """
+        if self._thread is not None:
+            raise RuntimeError('Collectors must be added before start()')
+        self._collectors[collector.name] = collector
+        tiers = None
+        if self.rollups and collector.name not in rollup.EXCLUDED:
+            # The buckets of the span of the samples, and the open one
+            span = self.capacity * self.interval * 10**9
+            tiers = {tier: math.ceil(span / width) + 1
+                     for tier, width in rollup.TIERS.items()}
+        self._data[collector.name] = RingBuffer(
+            self.capacity,
+            dtype=getattr(collector, 'dtype', np.float64),
+            eviction=self.eviction,
+            stats_block=(self.stats_block if collector.name in SUMMARIZED
+                         else None),
+            rollups=tiers,
+        )
+
+    def add_sink(self, sink: object) -> None:
+        r"""Register a callable that receives every sample.
+
+        The sink is called on the sampling thread, after the sample has been
+        added to the buffers, as sink(name, timestamp, sample, columns,
+        dtype) (see MetricsWriter.append).
+
+        :param sink: Callable receiving the samples, e.g. to persist them
+        """
+        self._sinks.append(sink)
+
+    @property
+    def collectors(self) -> dict:
+        r"""Registered collectors by name."""
+        return dict(self._collectors)
+
+    def start(self) -> 'Sampler':
+        r"""Start the sampling thread.
+
+        :return: The sampler itself, so it can be chained
+        """
+        if self._thread is not None:
+            raise RuntimeError('The sampler can only be started once')
+        self._thread = threading.Thread(
+            target=self._run, name='hardware-report-sampler', daemon=True
+        )
+        self.started_at = dt.datetime.now()
+        self._process_cpu = self._process.cpu_times()
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        r"""Ask the sampling thread to stop after the current tick."""
+        self._stop_event.set()
+
+    def join(self, timeout: float = None) -> bool:
+        r"""Wait for the sampling thread to finish.
+
+        :param timeout: Maximum time in seconds to wait, defaults to None
+        :return: True if the thread has finished
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.is_alive()
+
+    def is_alive(self) -> bool:
+        r"""Whether the sampling thread is still running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self, name: str = None) -> object:
+        r"""Copy the data collected so far.
+
+        :param name: Collector name, defaults to None (all collectors)
+        :return: Dataframe with the samples of the collector, or a dict with
+        one of those per collector name
+        """
+        if name is not None:
+            return self.frame(name)
+        return {collector: self.frame(collector) for collector in self._data}
+
+    def frame(
+        self,
+        name: str,
+        start_time: dt.datetime = None,
+        stop_time: dt.datetime = None,
+        copy: bool = True,
+    ) -> pd.DataFrame:
+        r"""Get the samples of a collector inside a time window.
+
+        :param name: Collector name
+        :param start_time: Start of the window, defaults to None
+        :param stop_time: End of the window, defaults to None
+        :param copy: Copy the values, defaults to True. A view is only safe
+        once the sampler has finished.
+        :return: Dataframe with the samples, indexed by datetime
+        """
+        start = None if start_time is None else to_epoch_ns(start_time)
+        stop = None if stop_time is None else to_epoch_ns(stop_time)
+        with self._lock:
+            return self._data[name].to_frame(start, stop, copy=copy)
+
+    def summary(
+        self,
+        name: str,
+        start_time: dt.datetime = None,
+        stop_time: dt.datetime = None,
+    ) -> pd.DataFrame:
+        r"""Summarize the samples of a collector inside a time window.
+
+        The statistics are kept up to date on every tick, so this doesn't
+        read the whole window again (see store.RingBuffer.summary).
+
+        :param name: Collector name
+        :param start_time: Start of the window, defaults to None
+        :param stop_time: End of the window, defaults to None
+        :return: Min, mean, standard deviation, percentiles and max of each
+        series (see stats.SeriesStats.summary)
+        """
+        start = None if start_time is None else to_epoch_ns(start_time)
+        stop = None if stop_time is None else to_epoch_ns(stop_time)
+        with self._lock:
+            return self._data[name].summary(start, stop)
+
+    def rollup(
+        self,
+        name: str,
+        tier: str,
+        start_time: dt.datetime = None,
+        stop_time: dt.datetime = None,
+    ) -> pd.DataFrame:
+        r"""Get the rollups of a collector overlapping a time window.
+
+        :param name: Collector name
+        :param tier: Tier label (e.g. '1min', see rollup.TIERS)
+        :param start_time: Start of the window, defaults to None
+        :param stop_time: End of the window, defaults to None
+        :return: Dataframe with a row per bucket (see store.RingBuffer.rollup)
+        """
+        start = None if start_time is None else to_epoch_ns(start_time)
+        stop = None if stop_time is None else to_epoch_ns(stop_time)
+        with self._lock:
+            return self._data[name].rollup(tier, start, stop)
+
+    def frame_since(
+        self,
+        name: str,
+        timestamp: int = None,
+        stop: int = None,
+    ) -> tuple:
+        r"""Get the samples of a collector appended after a timestamp.
+
+        Meant to be polled, e.g. by a live view: passing back the returned
+        timestamp reads only the samples appended since the previous call.
+
+        :param name: Collector name
+        :param timestamp: Epoch time in nanoseconds of the last sample
+        already read, defaults to None (all the samples)
+        :param stop: Epoch time in nanoseconds of the last sample to read,
+        defaults to None (up to the newest sample)
+        :return: Dataframe with the new samples and the epoch time in
+        nanoseconds of the newest one read (the given timestamp if there are
+        no new samples)
+        """
+        start = None if timestamp is None else timestamp + 1
+        with self._lock:
+            buffer = self._data[name]
+            data = buffer.to_frame(start, stop)
+            timestamps = buffer.timestamps(start, stop)
+        if len(timestamps):
+            timestamp = int(timestamps[-1])
+        return data, timestamp
+
+    def buffer(self, name: str) -> RingBuffer:
+        r"""Get the ring buffer of a collector.
+
+        The buffer keeps being written by the sampling thread, use lock to
+        read it consistently.
+
+        :param name: Collector name
+        :return: Ring buffer with the samples of the collector
+        """
+        return self._data[name]
+
+    @property
+    def lock(self) -> threading.Lock:
+        r"""Lock held by the sampling thread while appending samples."""
+        return self._lock
+
+    def overhead(self) -> dict:
+        r"""Get the footprint of the sampler on the host since it started.
+
+        The CPU time of the process includes the other threads (e.g. the
+        report being created), the one of the sampling thread is only the
+        collection and the appends to the buffers.
+
+        :return: Time since the start and time sampling in seconds, ticks
+        taken and missed, lateness of the ticks (jitter) in seconds, CPU time
+        of the sampling thread (while sampling) and of the process (since the
+        start) in seconds and as a percentage of one CPU, and current and
+        peak RSS of the process in bytes
+        """
+        if self.started_at is None:
+            raise RuntimeError('The sampler has not been started')
+        now = dt.datetime.now()
+        elapsed = (now - self.started_at).total_seconds()
+        sampling = ((self.stopped_at or now) - self.started_at).total_seconds()
+        cpu_times = self._process.cpu_times()
+        process_cpu = (cpu_times.user - self._process_cpu.user
+                       + cpu_times.system - self._process_cpu.system)
+        rss = self._process.memory_info().rss
+        lateness = np.array(self._lateness)
+        return {
+            'elapsed': elapsed,
+            'sampling': sampling,
+            'ticks': self._ticks,
+            'missed_ticks': self._missed_ticks,
+            'jitter_mean': float(lateness.mean()) if len(lateness) else 0.0,
+            'jitter_p95': (float(np.percentile(lateness, 95))
+                           if len(lateness) else 0.0),
+            'jitter_max': float(lateness.max()) if len(lateness) else 0.0,
+            'thread_cpu': self._thread_cpu,
+            'thread_cpu_percent': 100 * self._thread_cpu / max(sampling, 1e-9),
+            'process_cpu': process_cpu,
+            'process_cpu_percent': 100 * process_cpu / max(elapsed, 1e-9),
+            'rss': rss,
+            'rss_peak': max(self._rss_peak, rss),
+        }
+
+    def _tick(self, timestamp: int) -> None:
+        r"""Run every collector once and append the results.
+
+        :param timestamp: Epoch time in nanoseconds that stamps the samples
+        of this tick
+        """
+        # Collect outside of the lock, so snapshot() is never blocked by a
+        # slow collector
+        samples = {
+            name: collector.collect()
+            for name, collector in self._collectors.items()
+        }
+        with self._lock:
+            for name, sample in samples.items():
+                self._data[name].append(
+                    timestamp,
+                    sample,
+                    getattr(self._collectors[name], 'columns', None),
+                )
+        for sink in self._sinks:
+            for name, sample in samples.items():
+                collector = self._collectors[name]
+                sink(
+                    name,
+                    timestamp,
+                    sample,
+                    getattr(collector, 'columns', None),
+                    getattr(collector, 'dtype', np.float64),
+                )
+
+    def _seconds_until(self, moment: dt.datetime) -> float:
+        return (moment - dt.datetime.now()).total_seconds()
+
+    def _run(self) -> None:
+        try:
+            self._sample()
+        finally:
+            self.stopped_at = dt.datetime.now()
+
+    def _sample(self) -> None:
+        # Wait for the beginning of the window (a window in the future is
+        # valid and should not exit before taking any sample)
+        if self.start_time is not None:
+            delay = self._seconds_until(self.start_time)
+            if delay > 0 and self._stop_event.wait(delay):
+                return
+
+        # The ticks are scheduled on a fixed grid of the monotonic clock, so
+        # the time spent collecting does not accumulate as drift
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            current_time = dt.datetime.now()
+            if self.stop_time is not None and current_time >= self.stop_time:
+                break
+            self._lateness.append(max(time.monotonic() - next_tick, 0.0))
+            thread_cpu = time.thread_time()
+            self._tick(time.time_ns())
+            self._rss_peak = max(self._rss_peak,
+                                 self._process.memory_info().rss)
+            self._thread_cpu += time.thread_time() - thread_cpu
+            self._ticks += 1
+
+            next_tick += self.interval
+            now = time.monotonic()
+            if next_tick < now:
+                # The tick took longer than the interval: skip the missed
+                # slots instead of firing them back to back
+                missed = int((now - next_tick) // self.interval) + 1
+                next_tick += missed * self.interval
+                self._missed_ticks += missed
+            delay = next_tick - now
+            if self.stop_time is not None:
+                delay = min(delay, max(self._seconds_until(self.stop_time), 0))
+            if self._stop_event.wait(delay):
+                break
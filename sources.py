@@ -0,0 +1,482 @@
+"""
+Sources of the samples and of the machine information of a report.
+
+A MetricSource gives HardwareReport everything it reads about a machine:
+
+    collector(name): Collector to sample a metric family live (see
+        collectors.py), None if the source can't be sampled
+    read(name, start, stop): Samples of a time window, for the recorded
+        sources, which don't have to be sampled
+    machine_info(): Static information (system, CPU, disks, NICs) as plain
+        attributes, that can be saved as JSON and loaded back
+
+    PsutilSource: This machine, sampled from /proc on Linux (see procfs.py)
+        and with psutil elsewhere (the default)
+    CgroupSource: This container, sampled from its cgroup against its
+        limits (see cgroup.py)
+    ReplaySource: Samples and machine information saved in a metrics store,
+        so the same window gives the same report
+    SyntheticSource: Made-up samples at any rate and number of cores (e.g.
+        256 cores at 10 kHz), generated for a window at once, to load test
+        the store, the decimation and the rendering without real load
+"""
+import functools
+import platform
+import socket
+from types import SimpleNamespace
+
+import cgroup
+import collectors
+import numpy as np
+import pandas as pd
+import procfs
+import psutil
+from store import MetricsStore, to_datetime_index
+
+# Processes of the synthetic samples
+SYNTHETIC_PROCESSES = 20
+
+
+class MetricSource:
+    """Base class of the sources of samples and machine information."""
+
+    # Whether the samples of a window are read (see read) instead of
+    # sampled with the collectors
+    recorded = False
+    # Whether the samples arrive in real time, so a window is only complete
+    # after its end
+    realtime = True
+    # Whether the rollups of the samples can be read as the families
+    # '<name>@<tier>' (see rollup.py)
+    rollups = False
+
+    def collector(self, name: str) -> object:
+        r"""Get a collector to sample a metric family live.
+
+        :param name: Collector name (e.g. 'cpu', 'memory')
+        :return: Collector, None if the source can't be sampled
+        """
+        return None
+
+    def read(self, name: str, start: int, stop: int) -> pd.DataFrame:
+        r"""Get the samples of a metric family inside a time window.
+
+        Only the recorded sources have the samples of a window.
+
+        :param name: Collector name (e.g. 'cpu', 'memory')
+        :param start: Epoch time in nanoseconds of the start of the window
+        :param stop: Epoch time in nanoseconds of the end of the window
+        :return: Dataframe indexed by datetime
+        """
+        raise NotImplementedError
+
+    def machine_info(self) -> SimpleNamespace:
+        r"""Get the static information of the machine.
+
+        :return: Namespace with uname, boot_time, cpu_count, cpu_freq,
+        partitions, disk_io and nics, with the fields of the psutil named
+        tuples (and cgroup, the limits of a container, see CgroupSource)
+        """
+        raise NotImplementedError
+
+
+# The static information doesn't change while the process runs, so it's
+# read once and reused by every report
+
+
+@functools.lru_cache(maxsize=None)
+def system_info() -> tuple:
+    r"""Get the system information and the boot time.
+
+    :return: platform.uname() and psutil.boot_time()
+    """
+    return platform.uname(), psutil.boot_time()
+
+
+@functools.lru_cache(maxsize=None)
+def cpu_topology() -> tuple:
+    r"""Get the number of physical cores and of logical CPUs.
+
+    :return: Physical and logical CPU counts
+    """
+    return psutil.cpu_count(logical=False), psutil.cpu_count(logical=True)
+
+
+@functools.lru_cache(maxsize=None)
+def disk_partitions() -> tuple:
+    r"""Get the mounted disk partitions.
+
+    The mounts only change when a disk is (un)mounted, the usage of each
+    partition is read on every report.
+
+    :return: Tuple of psutil.disk_partitions() named tuples
+    """
+    return tuple(psutil.disk_partitions())
+
+
+def namespace(fields: object) -> SimpleNamespace:
+    r"""Convert a named tuple (e.g. of psutil) into a namespace.
+
+    :param fields: Named tuple, or None
+    :return: Namespace with the same attributes, or None
+    """
+    if fields is None:
+        return None
+    return SimpleNamespace(**fields._asdict())
+
+
+class PsutilSource(MetricSource):
+    """This machine, sampled with psutil or from /proc on Linux."""
+
+    def __init__(self, fast_path: bool = True) -> None:
+        r"""Contain the initial arguments.
+
+        :param fast_path: Sample /proc directly on Linux (see procfs.py),
+        defaults to True
+        """
+        self.fast_path = fast_path
+
+    def collector(self, name: str) -> object:
+        r"""Create the collector of a metric family of this machine.
+
+        :param name: Collector name (e.g. 'cpu', 'memory')
+        :return: Fast-path collector on Linux, else the psutil one, None if
+        the family can't be sampled (see procfs.collector)
+        """
+        return procfs.collector(name, self.fast_path)
+
+    def machine_info(self) -> SimpleNamespace:
+        r"""Read the static information of this machine.
+
+        :return: Namespace with the fields of MetricSource.machine_info
+        """
+        uname, boot_time = system_info()
+        physical, logical = cpu_topology()
+
+        partitions = []
+        for partition in disk_partitions():
+            try:
+                usage = namespace(psutil.disk_usage(partition.mountpoint))
+            except PermissionError:
+                # This can be catched due to the disk that isn't ready
+                usage = None
+            partitions.append(SimpleNamespace(
+                device=partition.device,
+                mountpoint=partition.mountpoint,
+                fstype=partition.fstype,
+                usage=usage,
+            ))
+
+        stats = psutil.net_if_stats()
+        io_counters = psutil.net_io_counters(pernic=True)
+        nics = {
+            nic: SimpleNamespace(
+                stats=namespace(stats.get(nic)),
+                io=namespace(io_counters.get(nic)),
+                # The families are enums, kept as their value
+                addrs=[
+                    SimpleNamespace(
+                        family=int(addr.family),
+                        address=addr.address,
+                        netmask=addr.netmask,
+                        broadcast=addr.broadcast,
+                        ptp=addr.ptp,
+                    )
+                    for addr in addrs
+                ],
+            )
+            for nic, addrs in psutil.net_if_addrs().items()
+        }
+        for nic in nics.values():
+            if nic.stats is not None:
+                nic.stats.duplex = int(nic.stats.duplex)
+
+        return SimpleNamespace(
+            uname=namespace(uname),
+            boot_time=boot_time,
+            cpu_count=SimpleNamespace(physical=physical, logical=logical),
+            # Current, min and max frequencies in Mhz, None when unknown
+            # (e.g. in some virtual machines)
+            cpu_freq=namespace(psutil.cpu_freq()),
+            partitions=partitions,
+            disk_io=namespace(psutil.disk_io_counters()),
+            nics=nics,
+        )
+
+
+class CgroupSource(PsutilSource):
+    """This container, sampled from the files of its cgroup (v2).
+
+    The CPU, memory, swap, disk I/O and pressure are the ones of the cgroup
+    against its limits (see cgroup.py), the network is the one of the
+    container's namespace. The machine information is the one of the host,
+    with the CPUs the cgroup can run on and its limits.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        root: str = cgroup.CGROUP_ROOT,
+        fast_path: bool = True,
+    ) -> None:
+        r"""Find the cgroup.
+
+        :param path: Directory of the cgroup, defaults to None (the cgroup
+        of this process)
+        :param root: Mount point of the cgroup v2 filesystem, defaults to
+        '/sys/fs/cgroup'
+        :param fast_path: Sample /proc directly on Linux for the metrics
+        that aren't in the cgroup (see procfs.py), defaults to True
+        """
+        super().__init__(fast_path)
+        self.cgroup = cgroup.Cgroup(path, root)
+
+    def collector(self, name: str) -> object:
+        r"""Create the collector of a metric family of the cgroup.
+
+        :param name: Collector name (e.g. 'cpu', 'memory')
+        :return: Collector against the limits of the cgroup, or of the host
+        for the metrics the cgroup doesn't have (see cgroup.collector)
+        """
+        return cgroup.collector(name, self.cgroup, fast_path=self.fast_path)
+
+    def machine_info(self) -> SimpleNamespace:
+        r"""Read the static information of the host, with the cgroup.
+
+        :return: Namespace with the fields of MetricSource.machine_info,
+        the CPUs of the cgroup and its limits in cgroup
+        """
+        info = super().machine_info()
+        info.cpu_count.logical = self.cgroup.cpus()
+        info.cgroup = SimpleNamespace(
+            path=self.cgroup.name,
+            # CPUs worth of time (e.g. 1.5) and bytes, None without a limit
+            cpu_limit=self.cgroup.cpu_limit(),
+            memory_limit=self.cgroup.memory_limit(),
+        )
+        return info
+
+
+class ReplaySource(MetricSource):
+    """Samples and machine information saved in a metrics store.
+
+    The collector daemon saves the machine information when it starts (see
+    daemon.py), stores without it fall back to the information of this
+    machine.
+    """
+
+    recorded = True
+    rollups = True
+
+    def __init__(self, store: MetricsStore) -> None:
+        r"""Contain the initial arguments.
+
+        :param store: Metrics store with the samples
+        """
+        self.store = store
+
+    def read(self, name: str, start: int, stop: int) -> pd.DataFrame:
+        r"""Read the samples of a metric family from the store.
+
+        :param name: Collector name (e.g. 'cpu', 'memory')
+        :param start: Epoch time in nanoseconds of the start of the window
+        :param stop: Epoch time in nanoseconds of the end of the window
+        :return: Dataframe indexed by datetime (see MetricsStore.read)
+        """
+        return self.store.read(name, start, stop)
+
+    def machine_info(self) -> SimpleNamespace:
+        r"""Load the machine information saved in the store.
+
+        :return: Namespace with the fields of MetricSource.machine_info, of
+        this machine if the store has none
+        """
+        info = self.store.machine_info()
+        if info is None:
+            return PsutilSource().machine_info()
+        return info
+
+
+class SyntheticSource(MetricSource):
+    """Made-up samples at any rate, for load tests and benchmarks.
+
+    The samples of a window are generated at once with NumPy, on a grid of
+    the sampling rate, and are the same for the same seed and window: the
+    CPU cores follow sine waves with noise, the memory a slow sine wave, the
+    I/O counters grow at random rates, the processes follow sine waves and
+    the pressure stalls are short.
+    It can also be sampled live with the synthetic collectors (see
+    collectors.py).
+    """
+
+    recorded = True
+    realtime = False
+
+    def __init__(
+        self,
+        cores: int = 256,
+        rate: float = 10_000.0,
+        seed: int = 0,
+        memory: int = 64 * 1024**3,
+        disks: int = 2,
+        nics: int = 2,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param cores: Number of CPU cores, defaults to 256
+        :param rate: Samples per second, defaults to 10_000.0
+        :param seed: Seed of the random values, defaults to 0
+        :param memory: Total memory in bytes, defaults to 64 GB
+        :param disks: Number of disks, defaults to 2
+        :param nics: Number of NICs, defaults to 2
+        """
+        if rate <= 0:
+            raise ValueError('The sampling rate must be positive')
+        self.cores = cores
+        self.rate = rate
+        self.seed = seed
+        self.memory = memory
+        self.disks = [f'disk{i}' for i in range(disks)]
+        self.nics = [f'eth{i}' for i in range(nics)]
+        # Period and phase of the wave of each core
+        random = np.random.default_rng(seed)
+        self._periods = random.uniform(10, 600, cores)
+        self._phases = random.uniform(0, 2 * np.pi, cores)
+        # Same for the CPU and the memory of each process
+        self._process_periods = random.uniform(10, 600, SYNTHETIC_PROCESSES)
+        self._process_phases = random.uniform(0, 2 * np.pi,
+                                              SYNTHETIC_PROCESSES)
+
+    def collector(self, name: str) -> object:
+        r"""Create a synthetic collector to sample live.
+
+        :param name: Collector name, 'cpu' or 'memory'
+        :return: Seeded synthetic collector (see collectors.py), None for
+        the other families
+        """
+        if name == 'cpu':
+            return collectors.SyntheticCpuCollector(self.cores, self.seed)
+        if name == 'memory':
+            return collectors.SyntheticMemoryCollector(self.memory, self.seed)
+        return None
+
+    def timestamps(self, start: int, stop: int) -> np.ndarray:
+        r"""Get the timestamps of the samples of a window.
+
+        :param start: Epoch time in nanoseconds of the start of the window
+        :param stop: Epoch time in nanoseconds of the end of the window
+        :return: Epoch times in nanoseconds on the grid of the rate
+        """
+        period = 1e9 / self.rate
+        first = int(np.ceil(start / period))
+        last = int(np.floor(stop / period))
+        return (np.arange(first, last + 1) * period).astype(np.int64)
+
+    def read(self, name: str, start: int, stop: int) -> pd.DataFrame:
+        r"""Generate the samples of a metric family inside a window.
+
+        :param name: Collector name (e.g. 'cpu', 'memory', 'processes')
+        :param start: Epoch time in nanoseconds of the start of the window
+        :param stop: Epoch time in nanoseconds of the end of the window
+        :return: Dataframe indexed by datetime, with a row per timestamp of
+        the grid of the rate
+        """
+        timestamps = self.timestamps(start, stop)
+        seconds = timestamps / 1e9
+        random = np.random.default_rng((self.seed, start, stop))
+
+        if name == 'cpu':
+            columns = [f'Core_{i}' for i in range(self.cores)] + ['Total']
+            values = np.empty((len(timestamps), self.cores + 1))
+            np.sin(2 * np.pi * seconds[:, np.newaxis] / self._periods
+                   + self._phases, out=values[:, :-1])
+            values[:, :-1] *= 40
+            values[:, :-1] += 50 + random.normal(
+                0, 5, (len(timestamps), self.cores))
+            np.clip(values[:, :-1], 0, 100, out=values[:, :-1])
+            values[:, -1] = values[:, :-1].mean(axis=1)
+            values = values.round(1)
+        elif name in ('memory', 'swap'):
+            total = self.memory if name == 'memory' else self.memory // 4
+            used = total * (0.5 + 0.3 * np.sin(2 * np.pi * seconds / 3600))
+            used = used.astype(np.int64)
+            columns = ['Total', 'Available' if name == 'memory' else 'Free',
+                       'Used']
+            values = np.column_stack((np.full_like(used, total),
+                                      total - used, used))
+        elif name in ('disk_io', 'net_io'):
+            devices, fields = (
+                (self.disks, collectors.DiskIOCollector.fields)
+                if name == 'disk_io'
+                else (self.nics, collectors.NetIOCollector.fields)
+            )
+            columns = [f'{device}:{field}'
+                       for device in devices for field in fields]
+            # The counters grow since the epoch, so consecutive windows
+            # continue each other, with random increments inside the window
+            base = (seconds[:1] * 1e6).astype(np.int64)
+            steps = random.integers(
+                0, 2 * 1e6 / self.rate + 1, (len(timestamps), len(columns)))
+            values = base + np.cumsum(steps, axis=0)
+        elif name == 'processes':
+            # The ranks of collectors.ProcessCollector: the processes
+            # ordered by CPU, with made-up PIDs
+            waves = np.sin(2 * np.pi * seconds[:, np.newaxis]
+                           / self._process_periods + self._process_phases)
+            cpu = np.clip(waves * 60 + 20, 0, None).round(1)
+            rss = ((waves + 2) * self.memory / 100).astype(np.int64)
+            order = np.argsort(-cpu, axis=1, kind='stable')
+            values = np.stack((
+                order + 1000,
+                np.take_along_axis(cpu, order, axis=1),
+                np.take_along_axis(rss, order, axis=1),
+            ), axis=2).reshape(len(timestamps), -1)
+            columns = [f'{rank}:{field}'
+                       for rank in range(SYNTHETIC_PROCESSES)
+                       for field in collectors.ProcessCollector.fields]
+        elif name == 'pressure':
+            # Short stalls, as a percentage of the time
+            columns = ['cpu:some', 'memory:some', 'memory:full', 'io:some',
+                       'io:full']
+            values = np.clip(random.exponential(
+                1.0, (len(timestamps), len(columns))), 0, 100).round(2)
+        else:
+            raise KeyError(name)
+
+        return pd.DataFrame(values, index=to_datetime_index(timestamps),
+                            columns=columns, copy=False)
+
+    def machine_info(self) -> SimpleNamespace:
+        r"""Make up the static information of the synthetic machine.
+
+        :return: Namespace with the fields of MetricSource.machine_info
+        """
+        usage = SimpleNamespace(total=1024**4, used=512 * 1024**3,
+                                free=512 * 1024**3, percent=50.0)
+        return SimpleNamespace(
+            uname=SimpleNamespace(
+                system='Synthetic', node=f'synthetic-{self.seed}',
+                release='', version='', machine='', processor='',
+            ),
+            boot_time=0.0,
+            cpu_count=SimpleNamespace(physical=self.cores,
+                                      logical=self.cores),
+            cpu_freq=None,
+            partitions=[
+                SimpleNamespace(device=f'/dev/{disk}',
+                                mountpoint=f'/mnt/{disk}', fstype='ext4',
+                                usage=usage)
+                for disk in self.disks
+            ],
+            disk_io=None,
+            nics={
+                nic: SimpleNamespace(
+                    stats=None,
+                    io=None,
+                    addrs=[SimpleNamespace(
+                        family=int(socket.AF_INET), address=f'10.0.0.{i}',
+                        netmask='255.0.0.0', broadcast=None, ptp=None)],
+                )
+                for i, nic in enumerate(self.nics, start=1)
+            },
+        )
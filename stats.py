@@ -0,0 +1,458 @@
+"""
+Online statistics of the time series, updated as the samples arrive.
+
+The summaries of a report (min, max, mean, standard deviation and the p50,
+p95 and p99 percentiles of each series) are kept up to date by the sampler
+on every tick, so they are read in constant time for windows of any length,
+without a second pass over the samples:
+
+    SeriesStats: The statistics of a set of series, vectorized across the
+        series. The mean and variance are updated with Welford's algorithm
+        (Chan's formula for a batch of samples), the percentiles with a
+        DDSketch: a histogram with logarithmic buckets, whose quantiles have
+        a bounded relative error (1% by default) and which can be merged
+        with the histogram of other samples by adding the counts. Each
+        series keeps the range of buckets of its own values, at most
+        MAX_BUCKETS (the lowest ones are collapsed, as in DDSketch), so the
+        memory of a sketch is bounded by the number of series.
+    WindowedStats: SeriesStats of consecutive blocks of time, so the
+        statistics of a time window are the merge of the blocks inside it,
+        plus the samples of the blocks only partly inside it.
+
+Only the families summarized by the reports keep them (see SUMMARIZED), the
+others are summarized from their samples.
+"""
+import numpy as np
+import pandas as pd
+
+# Relative error of the percentiles of the sketches
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Values closer to zero than this are counted as zero by the sketches
+MIN_INDEXED_VALUE = 1e-9
+
+# Most buckets of the sketch of a series, about 8 orders of magnitude
+MAX_BUCKETS = 1024
+
+# Length of the blocks of WindowedStats in nanoseconds
+DEFAULT_BLOCK = 10 * 60 * 10**9
+
+# Metric families whose summaries are read by the reports
+SUMMARIZED = {'cpu', 'memory', 'swap', 'pressure'}
+
+# Percentiles of the summaries
+PERCENTILES = (50, 95, 99)
+
+
+class SeriesStats:
+    """Mergeable statistics of a set of series.
+
+    The series are the columns of the samples, new columns can appear over
+    time (e.g. a NIC plugged in) and have no statistics before. Missing
+    values (NaN) are ignored. The sketches only hold positive values and
+    zeros, which is all the series of a report have (usages, sizes, rates).
+    """
+
+    def __init__(
+        self,
+        columns: int = 0,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param columns: Number of series, defaults to 0 (set by the first
+        update)
+        :param relative_accuracy: Relative error of the percentiles, defaults
+        to 0.01
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('The relative accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.count = np.zeros(columns, dtype=np.int64)
+        self.mean = np.zeros(columns)
+        self._m2 = np.zeros(columns)
+        self.min = np.full(columns, np.inf)
+        self.max = np.full(columns, -np.inf)
+        # Counts of the sketches: one row per series, and one column per
+        # bucket, from the bucket _low to the bucket _high of each series
+        # (none while _high < _low)
+        self._zeros = np.zeros(columns, dtype=np.int64)
+        self._buckets = np.zeros((columns, 0), dtype=np.int64)
+        self._low = np.zeros(columns, dtype=np.int64)
+        self._high = np.full(columns, -1, dtype=np.int64)
+
+    def __len__(self) -> int:
+        r"""Get the number of series."""
+        return len(self.count)
+
+    @property
+    def nbytes(self) -> int:
+        r"""Memory used by the statistics in bytes."""
+        return sum(array.nbytes for array in (
+            self.count, self.mean, self._m2, self.min, self.max, self._zeros,
+            self._buckets, self._low, self._high))
+
+    def _add_columns(self, columns: int) -> None:
+        extra = columns - len(self)
+        if extra <= 0:
+            return
+        self.count = np.concatenate((self.count, np.zeros(extra, np.int64)))
+        self.mean = np.concatenate((self.mean, np.zeros(extra)))
+        self._m2 = np.concatenate((self._m2, np.zeros(extra)))
+        self.min = np.concatenate((self.min, np.full(extra, np.inf)))
+        self.max = np.concatenate((self.max, np.full(extra, -np.inf)))
+        self._zeros = np.concatenate((self._zeros, np.zeros(extra, np.int64)))
+        self._buckets = np.pad(self._buckets, ((0, extra), (0, 0)))
+        self._low = np.concatenate((self._low, np.zeros(extra, np.int64)))
+        self._high = np.concatenate((self._high, np.full(extra, -1, np.int64)))
+
+    def _add_buckets(
+        self,
+        series: np.ndarray,
+        first: np.ndarray,
+        last: np.ndarray,
+    ) -> None:
+        r"""Make room in the sketches of some series for more buckets.
+
+        :param series: Positions of the series, without repetitions
+        :param first: Lowest new bucket of each series
+        :param last: Highest new bucket of each series
+        """
+        low, high = self._low[series], self._high[series]
+        empty = high < low
+        if not empty.any() and (low <= first).all() and (last <= high).all():
+            return
+        new_low = np.where(empty, first, np.minimum(low, first))
+        new_high = np.where(empty, last, np.maximum(high, last))
+        # The lowest buckets of a series beyond MAX_BUCKETS are collapsed
+        # into the lowest one kept
+        new_low = np.maximum(new_low, new_high - MAX_BUCKETS + 1)
+        width = max(self._buckets.shape[1],
+                    int((new_high - new_low).max()) + 1)
+        if width > self._buckets.shape[1]:
+            self._buckets = np.pad(
+                self._buckets,
+                ((0, 0), (0, width - self._buckets.shape[1])))
+        for column, shift in zip(series[~empty & (new_low != low)],
+                                 (low - new_low)[~empty & (new_low != low)]):
+            # The buckets of the series move by the change of its lowest
+            # one, rare once the range of its values is known
+            positions = np.maximum(np.arange(width) + shift, 0)
+            self._buckets[column] = np.bincount(
+                positions, self._buckets[column], minlength=width)[:width]
+        self._low[series] = new_low
+        self._high[series] = new_high
+
+    def update(self, values: np.ndarray) -> 'SeriesStats':
+        r"""Add a batch of samples.
+
+        :param values: 2D array with a row per sample and a column per
+        series, or 1D array with one sample
+        :return: The statistics themselves, so they can be chained
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            self._add_sample(values)
+            return self
+        self._add_columns(values.shape[1])
+        if not len(values):
+            return self
+        columns = values.shape[1]
+
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        present = count > 0
+        if not present.any():
+            return self
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(present, np.nansum(values, axis=0) / count, 0.0)
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+        self._merge_moments(count, mean, m2, columns)
+        # fmin/fmax ignore the missing values
+        self.min[:columns] = np.fmin(self.min[:columns],
+                                     np.fmin.reduce(values, axis=0))
+        self.max[:columns] = np.fmax(self.max[:columns],
+                                     np.fmax.reduce(values, axis=0))
+
+        # Sketches: the positive values are counted in their logarithmic
+        # bucket, the others as zeros
+        positive = valid & (values > MIN_INDEXED_VALUE)
+        self._zeros[:columns] += (valid & ~positive).sum(axis=0)
+        rows, series = np.nonzero(positive)
+        if len(rows):
+            index = np.ceil(np.log(values[rows, series])
+                            / self._log_gamma).astype(np.int64)
+            first = np.full(columns, np.iinfo(np.int64).max)
+            last = np.full(columns, np.iinfo(np.int64).min)
+            np.minimum.at(first, series, index)
+            np.maximum.at(last, series, index)
+            present = np.flatnonzero(positive.any(axis=0))
+            self._add_buckets(present, first[present], last[present])
+            width = self._buckets.shape[1]
+            self._buckets[:columns] += np.bincount(
+                series * width
+                + np.maximum(index - self._low[series], 0),
+                minlength=columns * width,
+            ).reshape(columns, width)
+        return self
+
+    def _add_sample(self, values: np.ndarray) -> None:
+        r"""Add one sample, the update of every tick of the sampler.
+
+        Welford's algorithm, with fewer operations than a batch of one.
+        """
+        columns = len(values)
+        self._add_columns(columns)
+        valid = values == values
+        count = self.count[:columns]
+        count += valid
+        delta = np.where(valid, values - self.mean[:columns], 0.0)
+        self.mean[:columns] += delta / np.maximum(count, 1)
+        self._m2[:columns] += np.where(
+            valid, delta * (values - self.mean[:columns]), 0.0)
+        np.fmin(self.min[:columns], values, out=self.min[:columns])
+        np.fmax(self.max[:columns], values, out=self.max[:columns])
+
+        positive = values > MIN_INDEXED_VALUE
+        self._zeros[:columns] += valid & ~positive
+        series = np.flatnonzero(positive)
+        if len(series):
+            index = np.ceil(np.log(values[series])
+                            / self._log_gamma).astype(np.int64)
+            self._add_buckets(series, index, index)
+            # One value per series, so no bucket is counted twice
+            self._buckets[series,
+                          np.maximum(index - self._low[series], 0)] += 1
+
+    def _merge_moments(
+        self,
+        count: np.ndarray,
+        mean: np.ndarray,
+        m2: np.ndarray,
+        columns: int,
+    ) -> None:
+        r"""Merge the moments of other samples of the first columns.
+
+        The count, mean and sum of squared differences, with Chan's formula.
+        """
+        total = self.count[:columns] + count
+        delta = mean - self.mean[:columns]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, count / total, 0.0)
+        self.mean[:columns] += delta * weight
+        self._m2[:columns] += m2 + delta**2 * self.count[:columns] * weight
+        self.count[:columns] = total
+
+    def merge(self, other: 'SeriesStats') -> 'SeriesStats':
+        r"""Add the statistics of other samples of the same series.
+
+        :param other: Statistics with the same relative accuracy
+        :return: The statistics themselves, so they can be chained
+        """
+        if other.gamma != self.gamma:
+            raise ValueError('Sketches of different accuracy can\'t be merged')
+        columns = len(other)
+        self._add_columns(columns)
+        self._merge_moments(other.count, other.mean, other._m2, columns)
+        self.min[:columns] = np.fmin(self.min[:columns], other.min)
+        self.max[:columns] = np.fmax(self.max[:columns], other.max)
+        self._zeros[:columns] += other._zeros
+        series = np.flatnonzero(other._high >= other._low)
+        if len(series):
+            self._add_buckets(series, other._low[series], other._high[series])
+            # Position of each bucket of the other sketches in these ones
+            width = self._buckets.shape[1]
+            positions = np.clip(
+                np.arange(other._buckets.shape[1])
+                + (other._low[series] - self._low[series])[:, np.newaxis],
+                0, width - 1)
+            self._buckets[:columns] += np.bincount(
+                (series[:, np.newaxis] * width + positions).ravel(),
+                other._buckets[series].ravel(),
+                minlength=columns * width,
+            ).reshape(columns, width).astype(np.int64)
+        return self
+
+    def copy(self) -> 'SeriesStats':
+        r"""Copy the statistics, to be merged without changing them.
+
+        :return: Statistics of the same samples
+        """
+        return SeriesStats(0, self.relative_accuracy).merge(self)
+
+    @property
+    def std(self) -> np.ndarray:
+        r"""Standard deviation of each series (population)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0,
+                            np.sqrt(self._m2 / self.count), np.nan)
+
+    def quantile(self, q: float) -> np.ndarray:
+        r"""Estimate a quantile of each series from the sketches.
+
+        :param q: Quantile between 0 and 1 (e.g. 0.95)
+        :return: Quantile of each series, within the relative accuracy, NaN
+        for the series without samples
+        """
+        result = np.full(len(self), np.nan)
+        present = self.count > 0
+        if not present.any():
+            return result
+        rank = q * (self.count - 1)
+        zero = present & (rank < self._zeros)
+        result[zero] = 0.0
+
+        other = present & ~zero
+        if other.any() and self._buckets.shape[1]:
+            cumulative = np.cumsum(self._buckets[other], axis=1)
+            cumulative += self._zeros[other, np.newaxis]
+            bucket = np.argmax(cumulative > rank[other, np.newaxis], axis=1)
+            # Middle of the bucket (in relative terms)
+            result[other] = (2 * self.gamma ** (bucket + self._low[other])
+                             / (self.gamma + 1))
+        # The estimates never go outside the values seen
+        return np.clip(result, self.min, self.max)
+
+    def summary(self, columns: list = None) -> pd.DataFrame:
+        r"""Get the summary of each series.
+
+        :param columns: Names of the series, defaults to None (their
+        positions)
+        :return: Dataframe with the 'Count', 'Min', 'Mean', 'Std', 'p50',
+        'p95', 'p99' and 'Max' of each series
+        """
+        present = self.count > 0
+        summary = {
+            'Count': self.count,
+            'Min': np.where(present, self.min, np.nan),
+            'Mean': np.where(present, self.mean, np.nan),
+            'Std': self.std,
+        }
+        for percentile in PERCENTILES:
+            summary[f'p{percentile}'] = self.quantile(percentile / 100)
+        summary['Max'] = np.where(present, self.max, np.nan)
+        summary = pd.DataFrame(summary)
+        if columns is not None:
+            # Series without any sample yet have no statistics
+            summary = summary.reindex(range(len(columns)))
+            summary['Count'] = summary['Count'].fillna(0).astype(np.int64)
+            summary.index = pd.Index(columns)
+        return summary
+
+
+class WindowedStats:
+    """SeriesStats of consecutive blocks of time.
+
+    The blocks are aligned on the epoch, so the statistics of a window are
+    the merge of the blocks inside it. The blocks only partly inside it are
+    summarized from their samples (see Sampler.summary).
+    """
+
+    def __init__(
+        self,
+        block: int = DEFAULT_BLOCK,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param block: Length of the blocks in nanoseconds, defaults to ten
+        minutes (DEFAULT_BLOCK)
+        :param relative_accuracy: Relative error of the percentiles, defaults
+        to 0.01
+        """
+        if block <= 0:
+            raise ValueError('The block length must be positive')
+        self.block = int(block)
+        self.relative_accuracy = relative_accuracy
+        # Statistics by start of the block, in time order
+        self.blocks = {}
+
+    @property
+    def nbytes(self) -> int:
+        r"""Memory used by the statistics of every block in bytes."""
+        return sum(stats.nbytes for stats in self.blocks.values())
+
+    def update(self, timestamp: int, values: np.ndarray) -> None:
+        r"""Add one sample.
+
+        :param timestamp: Epoch time of the sample in nanoseconds
+        :param values: Value of each series
+        """
+        start = timestamp - timestamp % self.block
+        stats = self.blocks.get(start)
+        if stats is None:
+            stats = self.blocks[start] = SeriesStats(
+                relative_accuracy=self.relative_accuracy)
+        stats.update(values)
+
+    def extend(self, timestamps: np.ndarray, values: np.ndarray) -> None:
+        r"""Add a batch of samples, in time order.
+
+        :param timestamps: Epoch times of the samples in nanoseconds
+        :param values: 2D array with a row per sample and a column per series
+        """
+        if not len(timestamps):
+            return
+        blocks = timestamps - timestamps % self.block
+        # Rows where a new block starts
+        bounds = np.flatnonzero(np.diff(blocks)) + 1
+        for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(blocks)]):
+            start = int(blocks[first])
+            stats = self.blocks.get(start)
+            if stats is None:
+                stats = self.blocks[start] = SeriesStats(
+                    relative_accuracy=self.relative_accuracy)
+            stats.update(values[first:last])
+
+    def evict(self, timestamp: int) -> None:
+        r"""Drop the blocks that end before a time.
+
+        :param timestamp: Epoch time in nanoseconds, e.g. of the oldest
+        sample still in the buffer
+        """
+        # The blocks are in time order, so only the first ones can be old
+        while self.blocks:
+            start = next(iter(self.blocks))
+            if start + self.block > timestamp:
+                break
+            del self.blocks[start]
+
+    def split(self, start: int = None, stop: int = None) -> tuple:
+        r"""Merge the blocks inside a window.
+
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the first block)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the last block)
+        :return: Statistics of the blocks entirely inside the window, and
+        the (start, stop) ranges of the window outside of them, whose
+        samples still have to be added
+        """
+        merged = SeriesStats(relative_accuracy=self.relative_accuracy)
+        inside = [
+            block for block in self.blocks
+            if (start is None or block >= start)
+            and (stop is None or block + self.block - 1 <= stop)
+        ]
+        for block in inside:
+            merged.merge(self.blocks[block])
+        if not inside:
+            return merged, [(start, stop)]
+
+        # The samples of the window before the first and after the last
+        # blocks merged
+        first, last = inside[0], inside[-1] + self.block
+        ranges = [(start, first - 1), (last, stop)]
+        return merged, ranges
+
+
+def summarize(data: pd.DataFrame) -> pd.DataFrame:
+    r"""Summarize the series of a Dataframe in one pass.
+
+    :param data: Dataframe of samples, missing values are ignored
+    :return: Summary of each column (see SeriesStats.summary)
+    """
+    return SeriesStats(data.shape[1]).update(
+        data.to_numpy(dtype=np.float64)).summary(list(data.columns))
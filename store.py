@@ -0,0 +1,1112 @@
+"""
+Compact time-series storage for the sampled data.
+
+Each metric family (cpu, memory, swap, ...) is kept in a preallocated NumPy
+ring buffer: one 2D array with a row per tick and a column per series, plus
+an int64 array with the epoch timestamps in nanoseconds. The memory used is
+bounded by the capacity, no matter how long the analysis period is.
+
+A buffer can also keep the statistics of its samples up to date as they are
+appended (see stats.py), so the summary of a window doesn't need another
+pass over the samples, and their rollups: the aggregates of the samples over
+each minute and each hour (see rollup.py), for the reports of long windows.
+
+The samples can also be persisted in a MetricsStore, so reports can be
+generated for windows in the past, compressed in chunks (see codec.py).
+"""
+import datetime as dt
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import codec
+import numpy as np
+import pandas as pd
+import rollup
+from dateutil import tz
+from stats import SeriesStats, WindowedStats
+
+# Ways to handle a sample that arrives when the buffer is full
+EVICTION_POLICIES = ('drop_oldest', 'drop_newest', 'raise')
+
+LOCAL_TIMEZONE = tz.tzlocal()
+
+# File of a MetricsStore with the static information of the machine
+MACHINE_INFO = 'machine.json'
+
+# Ways to write the samples of a segment of a MetricsStore
+ENCODINGS = ('raw', 'chunks')
+
+# Fields of a row of the index of the chunks of a segment
+CHUNK_INDEX = ('first', 'last', 'offset', 'length', 'rows')
+
+
+class RingBuffer:
+    """Fixed capacity columnar buffer of samples of one metric family."""
+
+    def __init__(
+        self,
+        capacity: int,
+        dtype: object = np.float64,
+        eviction: str = 'drop_oldest',
+        stats_block: int = None,
+        rollups: dict = None,
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param capacity: Maximum number of samples (rows) kept
+        :param dtype: NumPy type of the values, defaults to np.float64
+        :param eviction: What to do when the buffer is full, 'drop_oldest'
+        overwrites the oldest sample, 'drop_newest' ignores the new one and
+        'raise' raises a BufferError, defaults to 'drop_oldest'
+        :param stats_block: Length in nanoseconds of the blocks of the
+        statistics kept as the samples are appended (see summary), defaults
+        to None (no statistics, the summaries are computed from the samples)
+        :param rollups: Number of buckets kept of each tier of rollups kept
+        as the samples are appended (e.g. {'1min': 1440}, see rollup.py),
+        defaults to None (no rollups)
+        """
+        if capacity <= 0:
+            raise ValueError('The capacity must be positive')
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(
+                f'Unknown eviction policy {eviction!r}, '
+                f'expected one of {EVICTION_POLICIES}'
+            )
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self.eviction = eviction
+        self.columns = []
+        self._column_index = {}
+        # Column positions of the last array sample, to skip the lookup of
+        # the names on every tick
+        self._array_columns = None
+        self._array_index = None
+        self._timestamps = np.zeros(self.capacity, dtype=np.int64)
+        self._values = np.zeros((self.capacity, 0), dtype=self.dtype)
+        # Position of the oldest sample and number of samples stored
+        self._head = 0
+        self._size = 0
+        self.stats = None if stats_block is None else WindowedStats(stats_block)
+        # Aggregates of the open bucket of each tier and the closed ones
+        self.rollups = {
+            tier: (rollup.Rollup(rollup.TIERS[tier]), RingBuffer(buckets))
+            for tier, buckets in (rollups or {}).items()
+        }
+
+    def __len__(self) -> int:
+        r"""Get the number of samples in the buffer."""
+        return self._size
+
+    @property
+    def missing_value(self) -> object:
+        r"""Value of a series that wasn't part of a sample."""
+        return np.nan if self.dtype.kind == 'f' else 0
+
+    def _add_columns(self, names: list) -> None:
+        # Columns are rarely added (e.g. a NIC plugged in during the
+        # analysis), the history of a new column is filled as missing
+        values = np.full(
+            (self.capacity, len(self.columns) + len(names)),
+            self.missing_value,
+            dtype=self.dtype,
+        )
+        values[:, :len(self.columns)] = self._values
+        for name in names:
+            self._column_index[name] = len(self.columns)
+            self.columns.append(name)
+        self._values = values
+
+    def append(
+        self,
+        timestamp: int,
+        sample: object,
+        columns: list = None,
+    ) -> None:
+        r"""Append one sample.
+
+        :param timestamp: Epoch time of the sample in nanoseconds
+        :param sample: Dict with the value of each series in this sample, or
+        a NumPy array with the values of the series named by columns
+        :param columns: Names of the values of an array sample, defaults to
+        None. Passing the same list object on every tick avoids looking up
+        the names again.
+        """
+        if isinstance(sample, np.ndarray):
+            if columns is not self._array_columns:
+                self._array_index = self._index_of(columns)
+                self._array_columns = columns
+            index = self._array_index
+        else:
+            index = None
+            self._index_of(sample)
+
+        row = self._next_row()
+        if row is None:
+            return
+        self._timestamps[row] = timestamp
+        values = self._values[row]
+        if index is not None:
+            if len(index) != len(self.columns):
+                values[:] = self.missing_value
+            values[index] = sample
+        else:
+            if len(sample) != len(self.columns):
+                values[:] = self.missing_value
+            for name, value in sample.items():
+                values[self._column_index[name]] = value
+        if self.stats is not None:
+            self.stats.update(timestamp, values)
+            self.stats.evict(int(self._timestamps[self._head]))
+        for aggregates, buckets in self.rollups.values():
+            for start, row in aggregates.update(
+                    timestamp, values, self.columns):
+                buckets.append(start, row, aggregates.names)
+
+    def extend(
+        self,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        columns: list,
+    ) -> None:
+        r"""Append a batch of samples at once.
+
+        :param timestamps: Epoch times of the samples in nanoseconds, in
+        order and after the samples already in the buffer
+        :param values: 2D array with a row per sample and a column per series
+        :param columns: Names of the columns of the values
+        """
+        index = self._index_of(columns)
+        length = len(timestamps)
+        free = self.capacity - self._size
+        if length > free:
+            if self.eviction == 'raise':
+                raise BufferError(
+                    f'The buffer is full ({self.capacity} samples)')
+            if self.eviction == 'drop_newest':
+                length = free
+            else:
+                # Only the newest samples of a batch larger than the buffer
+                # are kept, and as many of the oldest samples are overwritten
+                timestamps = timestamps[-self.capacity:]
+                values = values[-self.capacity:]
+                length = len(timestamps)
+                dropped = max(length - free, 0)
+                self._head = (self._head + dropped) % self.capacity
+                self._size -= dropped
+
+        rows = (self._head + self._size + np.arange(length)) % self.capacity
+        self._timestamps[rows] = timestamps[:length]
+        if len(index) != len(self.columns):
+            self._values[rows] = self.missing_value
+        self._values[rows[:, np.newaxis], index] = values[:length]
+        self._size += length
+        if self.stats is not None:
+            self.stats.extend(timestamps[:length], self._values[rows])
+            self.stats.evict(int(self._timestamps[self._head]))
+        for aggregates, buckets in self.rollups.values():
+            closed = aggregates.extend(
+                timestamps[:length], self._values[rows], self.columns)
+            if closed:
+                buckets.extend(np.array([start for start, _ in closed]),
+                               np.array([row for _, row in closed]),
+                               aggregates.names)
+
+    def _index_of(self, names: object) -> np.ndarray:
+        # Position of each name, adding the columns not seen before
+        new_columns = [name for name in names
+                       if name not in self._column_index]
+        if new_columns:
+            self._add_columns(new_columns)
+        return np.array([self._column_index[name] for name in names],
+                        dtype=np.intp)
+
+    def _next_row(self) -> int:
+        # Row where the next sample is written, or None if it's dropped
+        if self._size == self.capacity:
+            if self.eviction == 'drop_newest':
+                return None
+            if self.eviction == 'raise':
+                raise BufferError(
+                    f'The buffer is full ({self.capacity} samples)')
+            # Overwrite the oldest sample
+            row = self._head
+            self._head = (self._head + 1) % self.capacity
+            return row
+        row = (self._head + self._size) % self.capacity
+        self._size += 1
+        return row
+
+    def _search(self, timestamp: int, side: str) -> int:
+        # Timestamps are appended in order, so the rows of a time window are
+        # found with a binary search on each of the two (at most) contiguous
+        # parts of the buffer, the older one first
+        end = self._head + self._size
+        older = self._timestamps[self._head:min(end, self.capacity)]
+        position = int(np.searchsorted(older, timestamp, side=side))
+        if end <= self.capacity or position < len(older):
+            return position
+        newer = self._timestamps[:end - self.capacity]
+        return position + int(np.searchsorted(newer, timestamp, side=side))
+
+    def _bounds(self, start: int = None, stop: int = None) -> tuple:
+        # Positions of the first and past the last sample of the window, in
+        # the order of the samples
+        first = 0 if start is None else self._search(start, 'left')
+        last = self._size if stop is None else self._search(stop, 'right')
+        return first, max(first, last)
+
+    def _slice(self, array: np.ndarray, first: int, last: int) -> np.ndarray:
+        # Rows of the window in order: a view when they are contiguous and a
+        # copy of the window only (never of the whole buffer) when the window
+        # wraps around the end of the storage
+        row = (self._head + first) % self.capacity
+        length = last - first
+        if row + length <= self.capacity:
+            return array[row:row + length]
+        return np.concatenate(
+            (array[row:], array[:row + length - self.capacity]))
+
+    def timestamps(self, start: int = None, stop: int = None) -> np.ndarray:
+        r"""Get the timestamps in order.
+
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest sample)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest sample)
+        :return: Timestamps in the window, a view unless the window wraps
+        around the end of the buffer
+        """
+        first, last = self._bounds(start, stop)
+        return self._slice(self._timestamps, first, last)
+
+    def values(self, start: int = None, stop: int = None) -> np.ndarray:
+        r"""Get the values in order, one row per sample.
+
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest sample)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest sample)
+        :return: Values in the window, a view unless the window wraps around
+        the end of the buffer
+        """
+        first, last = self._bounds(start, stop)
+        return self._slice(self._values, first, last)
+
+    def to_frame(
+        self,
+        start: int = None,
+        stop: int = None,
+        copy: bool = True,
+    ) -> pd.DataFrame:
+        r"""Convert the samples into a Dataframe indexed by local datetime.
+
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest sample)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest sample)
+        :param copy: Copy the values, defaults to True. Without a copy the
+        Dataframe is a view of the buffer, which is only safe to keep while
+        no more samples are appended.
+        :return: Dataframe with a column per series
+        """
+        first, last = self._bounds(start, stop)
+        values = self._slice(self._values, first, last)
+        return pd.DataFrame(
+            values.copy() if copy and values.base is not None else values,
+            index=to_datetime_index(
+                self._slice(self._timestamps, first, last)),
+            columns=list(self.columns),
+            copy=False,
+        )
+
+    def summary(self, start: int = None, stop: int = None) -> pd.DataFrame:
+        r"""Summarize each series inside a time window.
+
+        With statistics the summary is the merge of the blocks inside the
+        window, only the samples of the blocks partly inside it (or whose
+        oldest samples were overwritten) are read again.
+
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest sample)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest sample)
+        :return: Summary of each series (see stats.SeriesStats.summary)
+        """
+        if self.stats is None or not self._size:
+            stats = SeriesStats(len(self.columns)).update(
+                self.values(start, stop))
+            return stats.summary(self.columns)
+
+        oldest = int(self._timestamps[self._head])
+        stats, ranges = self.stats.split(
+            oldest if start is None else max(start, oldest), stop)
+        for first, last in ranges:
+            if first is None or last is None or first <= last:
+                stats.update(self.values(first, last))
+        return stats.summary(self.columns)
+
+    def rollup(
+        self,
+        tier: str,
+        start: int = None,
+        stop: int = None,
+    ) -> pd.DataFrame:
+        r"""Get the rows of a tier of rollups overlapping a time window.
+
+        :param tier: Tier label (e.g. '1min', see rollup.TIERS)
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest bucket)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest bucket)
+        :return: Dataframe with a row per bucket, the open one included with
+        the samples so far, and '<aggregate>:<series>' columns
+        """
+        aggregates, buckets = self.rollups[tier]
+        if start is not None:
+            # The bucket of the start of the window
+            start -= start % aggregates.width
+        data = buckets.to_frame(start, stop)
+        current = aggregates.current()
+        if (current is None or (start is not None and current[0] < start)
+                or (stop is not None and current[0] > stop)):
+            return data
+        current = pd.DataFrame(
+            [current[1]],
+            index=to_datetime_index(np.array([current[0]], dtype=np.int64)),
+            columns=aggregates.names,
+        )
+        return pd.concat((data, current)) if len(data) else current
+
+    def clear(self) -> None:
+        r"""Remove all the samples, keeping the columns."""
+        self._head = 0
+        self._size = 0
+        if self.stats is not None:
+            self.stats.blocks.clear()
+        for tier, (aggregates, buckets) in self.rollups.items():
+            self.rollups[tier] = (rollup.Rollup(aggregates.width),
+                                  RingBuffer(buckets.capacity))
+
+
+class MetricsStore:
+    """Append-only columnar files with the samples of past windows.
+
+    The samples of each metric family are kept in a directory of segments::
+
+        <path>/<family>/<segment>/meta.json     columns, value type, encoding
+        <path>/<family>/<segment>/chunks.bin    encoded chunks of samples
+        <path>/<family>/<segment>/chunks.idx    int64 first and last
+                                                timestamps, offset, length
+                                                and rows of each chunk
+        <path>/<family>/<segment>/tail.bin      int64 epoch nanoseconds and
+                                                values of each sample not
+                                                yet in a chunk
+
+    The samples are encoded in chunks of codec.CHUNK_SAMPLES rows (see
+    codec.py), so only the chunks that overlap a time window are decoded to
+    read it, found with a binary search on the index. The newest samples
+    are kept raw in the tail until there are enough of them for a chunk
+    (and the last ones when the writer is closed).
+
+    The segments of the 'raw' encoding (e.g. the ones written before the
+    chunks) have the samples as they are instead::
+
+        <path>/<family>/<segment>/timestamps.bin  int64 epoch nanoseconds
+        <path>/<family>/<segment>/values.bin      one row per timestamp
+
+    A new segment is started whenever the columns of a family change (e.g. a
+    NIC is plugged in) or a new writer is opened, so the files are only ever
+    appended to, but the tail, which is replaced when its samples are moved
+    to a chunk. The files are memory-mapped to be read.
+
+    The rollups of a family are kept the same way, as the families
+    <family>@<tier> (e.g. cpu@1min, see rollup.py).
+    """
+
+    def __init__(self, path: str) -> None:
+        r"""Contain the initial arguments.
+
+        :param path: Directory of the store, created if it doesn't exist
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def families(self) -> list:
+        r"""Names of the metric families in the store, without the rollups."""
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, name)) and '@' not in name
+        )
+
+    def segments(self, name: str) -> list:
+        r"""Get the segments of a metric family, oldest first.
+
+        :param name: Metric family (collector name)
+        :return: List of segments
+        """
+        family = os.path.join(self.path, name)
+        if not os.path.isdir(family):
+            return []
+        return [
+            StoreSegment(os.path.join(family, segment))
+            for segment in sorted(os.listdir(family))
+            if os.path.isfile(os.path.join(family, segment, 'meta.json'))
+        ]
+
+    def write_machine_info(self, info: object) -> None:
+        r"""Save the static information of the sampled machine.
+
+        :param info: Machine information (see sources.MetricSource)
+        """
+        with open(os.path.join(self.path, MACHINE_INFO), 'w') as file:
+            json.dump(info, file, default=vars)
+
+    def machine_info(self) -> object:
+        r"""Load the static information of the sampled machine.
+
+        :return: Machine information (see sources.MetricSource), None if it
+        wasn't saved
+        """
+        path = os.path.join(self.path, MACHINE_INFO)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as file:
+            info = json.load(
+                file, object_hook=lambda fields: SimpleNamespace(**fields))
+        # The NICs are a mapping by name, not attributes
+        info.nics = vars(info.nics)
+        return info
+
+    def writer(
+        self,
+        rollups: bool = True,
+        encoding: str = 'chunks',
+    ) -> 'MetricsWriter':
+        r"""Open a writer that appends new samples to the store.
+
+        :param rollups: Also write the rollups of the samples, defaults to
+        True
+        :param encoding: Encoding of the new segments, one of ENCODINGS,
+        defaults to 'chunks'
+        """
+        return MetricsWriter(self, rollups, encoding)
+
+    def time_range(self, name: str) -> tuple:
+        r"""Get the epoch time of the first and last samples of a family.
+
+        :param name: Metric family (collector name)
+        :return: First and last timestamps in nanoseconds, or None if the
+        family has no samples
+        """
+        bounds = [segment.time_range() for segment in self.segments(name)]
+        bounds = [bound for bound in bounds if bound is not None]
+        if not bounds:
+            return None
+        return bounds[0][0], bounds[-1][1]
+
+    def count(self, name: str, start: int = None, stop: int = None) -> int:
+        r"""Count the samples of a metric family inside a time window.
+
+        Only the timestamps are searched (and only the ones of the chunks
+        at the ends of the window decoded), no value is read.
+
+        :param name: Metric family (collector name)
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest sample)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest sample)
+        :return: Number of samples
+        """
+        return sum(segment.count(start, stop)
+                   for segment in self.segments(name))
+
+    def read(
+        self,
+        name: str,
+        start: int = None,
+        stop: int = None,
+    ) -> pd.DataFrame:
+        r"""Read the samples of a metric family inside a time window.
+
+        :param name: Metric family (collector name)
+        :param start: Epoch time in nanoseconds of the start of the window,
+        defaults to None (from the oldest sample)
+        :param stop: Epoch time in nanoseconds of the end of the window,
+        defaults to None (up to the newest sample)
+        :return: Dataframe with a column per series, indexed by datetime
+        """
+        frames = []
+        for segment in self.segments(name):
+            bounds = segment.time_range()
+            if bounds is None:
+                continue
+            # Skip the segments outside of the window without reading them
+            if start is not None and bounds[1] < start:
+                continue
+            if stop is not None and bounds[0] > stop:
+                continue
+            timestamps, values = segment.read(start, stop)
+            if len(timestamps):
+                frames.append(pd.DataFrame(
+                    values,
+                    index=to_datetime_index(timestamps),
+                    columns=segment.columns,
+                ))
+        if not frames:
+            return pd.DataFrame(index=to_datetime_index(
+                np.array([], dtype=np.int64)))
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames)
+
+
+class StoreSegment:
+    """One segment of a metric family in the MetricsStore."""
+
+    def __init__(self, path: str) -> None:
+        r"""Contain the initial arguments.
+
+        :param path: Directory of the segment
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        self.columns = meta['columns']
+        self.dtype = np.dtype(meta['dtype'])
+        # The segments written before the chunks have no encoding
+        self.encoding = meta.get('encoding', 'raw')
+
+    def _memmap(self, filename: str, dtype: object) -> np.ndarray:
+        path = os.path.join(self.path, filename)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def _read_file(self, filename: str, dtype: object) -> np.ndarray:
+        # Whole records of a file that may be replaced while it is read, so
+        # it isn't memory-mapped
+        try:
+            with open(os.path.join(self.path, filename), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            data = b''
+        dtype = np.dtype(dtype)
+        return np.frombuffer(data, dtype, len(data) // dtype.itemsize)
+
+    def _parts(self) -> tuple:
+        # Index and data of the chunks, and timestamps and values of the tail
+        tail = self._read_file(
+            'tail.bin', record_dtype(len(self.columns), self.dtype))
+        # The tail first, it's replaced after the index is written
+        index = self._read_file('chunks.idx', np.int64)
+        index = index[:len(index) // len(CHUNK_INDEX) * len(CHUNK_INDEX)]
+        index = index.reshape(-1, len(CHUNK_INDEX))
+        data = self._memmap('chunks.bin', np.uint8)
+        index = index[index[:, 2] + index[:, 3] <= len(data)]
+        timestamps = tail['timestamp']
+        values = tail['values'].reshape(len(tail), len(self.columns))
+        if len(index) and len(timestamps):
+            # The samples already in a chunk if the writer was interrupted
+            # before replacing the tail
+            first = int(np.searchsorted(timestamps, index[-1, 1],
+                                        side='right'))
+            timestamps, values = timestamps[first:], values[first:]
+        return index, data, timestamps, values
+
+    def arrays(self) -> tuple:
+        r"""Memory-map the timestamps and the values of the segment.
+
+        The chunks of the segments of the 'chunks' encoding are decoded, use
+        read or blocks to read a part of them.
+
+        :return: Timestamps and values (one row per timestamp)
+        """
+        if self.encoding == 'chunks':
+            return self.read()
+        timestamps = self._memmap('timestamps.bin', np.int64)
+        values = self._memmap('values.bin', self.dtype)
+        width = max(len(self.columns), 1)
+        # A row may be partially written if the writer was interrupted
+        rows = min(len(timestamps), len(values) // width)
+        return (timestamps[:rows],
+                values[:rows * width].reshape(rows, width)[:, :len(self.columns)])
+
+    def blocks(self, rows: int) -> object:
+        r"""Iterate over the samples of the segment in blocks of rows.
+
+        :param rows: Most rows of a block, the blocks of the 'chunks'
+        encoding are its chunks and its tail instead
+        :return: Iterator of timestamps and values (one row per timestamp)
+        """
+        if self.encoding != 'chunks':
+            timestamps, values = self.arrays()
+            for first in range(0, len(timestamps), rows):
+                yield (timestamps[first:first + rows],
+                       values[first:first + rows])
+            return
+        index, data, timestamps, values = self._parts()
+        for _, _, offset, length, _ in index:
+            yield codec.decode(data[offset:offset + length], self.dtype)
+        if len(timestamps):
+            yield timestamps, values
+
+    def time_range(self) -> tuple:
+        r"""Get the epoch time of the first and last samples of the segment.
+
+        :return: First and last timestamps in nanoseconds, or None if empty
+        """
+        if self.encoding != 'chunks':
+            timestamps, _ = self.arrays()
+            if not len(timestamps):
+                return None
+            return int(timestamps[0]), int(timestamps[-1])
+        index, _, timestamps, _ = self._parts()
+        if not len(index) and not len(timestamps):
+            return None
+        first = index[0, 0] if len(index) else timestamps[0]
+        last = timestamps[-1] if len(timestamps) else index[-1, 1]
+        return int(first), int(last)
+
+    def count(self, start: int = None, stop: int = None) -> int:
+        r"""Count the rows inside a time window.
+
+        :param start: Epoch time in nanoseconds of the start of the window
+        :param stop: Epoch time in nanoseconds of the end of the window
+        :return: Number of rows
+        """
+        if self.encoding != 'chunks':
+            timestamps, _ = self.arrays()
+            first, last = search_window(timestamps, start, stop)
+            return last - first
+        index, data, timestamps, _ = self._parts()
+        first, last = search_window(timestamps, start, stop)
+        count = last - first
+        first, last = self._overlapping(index, start, stop)
+        for begin, end, offset, length, rows in index[first:last]:
+            if ((start is None or begin >= start)
+                    and (stop is None or end <= stop)):
+                count += int(rows)
+            else:
+                # Only the chunks at the ends of the window are decoded
+                first, last = search_window(codec.decode_timestamps(
+                    data[offset:offset + length]), start, stop)
+                count += last - first
+        return count
+
+    def read(self, start: int = None, stop: int = None) -> tuple:
+        r"""Read the rows inside a time window.
+
+        :param start: Epoch time in nanoseconds of the start of the window
+        :param stop: Epoch time in nanoseconds of the end of the window
+        :return: Timestamps and values of the window, copied from the files
+        (or decoded from the chunks that overlap the window)
+        """
+        if self.encoding != 'chunks':
+            timestamps, values = self.arrays()
+            first, last = search_window(timestamps, start, stop)
+            return (np.array(timestamps[first:last]),
+                    np.array(values[first:last]))
+        index, data, timestamps, values = self._parts()
+        first, last = self._overlapping(index, start, stop)
+        blocks = [codec.decode(data[offset:offset + length], self.dtype)
+                  for _, _, offset, length, _ in index[first:last]]
+        blocks.append((timestamps, values))
+        timestamps = np.concatenate([block[0] for block in blocks])
+        values = np.concatenate([block[1] for block in blocks])
+        first, last = search_window(timestamps, start, stop)
+        return timestamps[first:last], values[first:last]
+
+    @staticmethod
+    def _overlapping(index: np.ndarray, start: int, stop: int) -> tuple:
+        # First and last (excluded) chunks that overlap a time window
+        first = 0 if start is None else int(
+            np.searchsorted(index[:, 1], start, side='left'))
+        last = len(index) if stop is None else int(
+            np.searchsorted(index[:, 0], stop, side='right'))
+        return first, max(first, last)
+
+
+class MetricsWriter:
+    """Append samples to the segments of a MetricsStore."""
+
+    def __init__(
+        self,
+        store: MetricsStore,
+        rollups: bool = True,
+        encoding: str = 'chunks',
+    ) -> None:
+        r"""Contain the initial arguments.
+
+        :param store: Store where the samples are written
+        :param rollups: Also write the rollups of the samples as they are
+        appended (see rollup.py), defaults to True
+        :param encoding: Encoding of the new segments, 'chunks' compresses
+        the samples in chunks (see codec.py) and 'raw' writes them as they
+        are, defaults to 'chunks'
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(
+                f'Unknown encoding {encoding!r}, '
+                f'expected one of {ENCODINGS}'
+            )
+        self.store = store
+        self.rollups = rollups
+        self.encoding = encoding
+        # Open segment of each family: columns, their index and the files
+        self._segments = {}
+        # Open bucket of each tier of each family
+        self._rollups = {}
+        # The samples are appended by the sampling thread while another
+        # thread may flush the files
+        self._lock = threading.Lock()
+
+    def _open_segment(self, name: str, columns: list, dtype: object) -> dict:
+        family = os.path.join(self.store.path, name)
+        os.makedirs(family, exist_ok=True)
+        existing = [int(segment) for segment in os.listdir(family)
+                    if segment.isdigit()]
+        path = os.path.join(family, f'{max(existing, default=-1) + 1:08d}')
+        os.makedirs(path)
+        with open(os.path.join(path, 'meta.json'), 'w') as file:
+            json.dump({'columns': list(columns),
+                       'dtype': np.dtype(dtype).str,
+                       'encoding': self.encoding}, file)
+
+        previous = self._segments.get(name)
+        if previous is not None:
+            self._close_segment(previous)
+        segment = {
+            'path': path,
+            'columns': list(columns),
+            'index': {column: i for i, column in enumerate(columns)},
+            'dtype': np.dtype(dtype),
+            'array_columns': None,
+            'array_index': None,
+        }
+        if self.encoding == 'raw':
+            segment['files'] = {
+                'timestamps': open(os.path.join(path, 'timestamps.bin'), 'ab'),
+                'values': open(os.path.join(path, 'values.bin'), 'ab'),
+            }
+        else:
+            segment['files'] = {
+                'chunks': open(os.path.join(path, 'chunks.bin'), 'ab'),
+                'index': open(os.path.join(path, 'chunks.idx'), 'ab'),
+                'tail': open(os.path.join(path, 'tail.bin'), 'ab'),
+            }
+            segment['record'] = record_dtype(len(columns), dtype)
+            # Samples of the tail and position of the next chunk
+            segment['pending'] = []
+            segment['pending_rows'] = 0
+            segment['offset'] = 0
+        self._segments[name] = segment
+        return segment
+
+    def _write_rows(
+        self,
+        segment: dict,
+        timestamps: np.ndarray,
+        rows: np.ndarray,
+    ) -> None:
+        # Rows with every column of a segment
+        files = segment['files']
+        if self.encoding == 'raw':
+            # The values first, so a reader never sees a timestamp without
+            # row
+            files['values'].write(rows.tobytes())
+            files['timestamps'].write(timestamps.tobytes())
+            return
+        # Copies, the arrays of a batch may be reused by the caller
+        segment['pending'].append((np.array(timestamps), np.array(rows)))
+        segment['pending_rows'] += len(timestamps)
+        if segment['pending_rows'] < codec.CHUNK_SAMPLES:
+            files['tail'].write(self._records(segment, timestamps, rows))
+        else:
+            self._write_chunks(segment)
+
+    @staticmethod
+    def _records(
+        segment: dict,
+        timestamps: np.ndarray,
+        rows: np.ndarray,
+    ) -> bytes:
+        # Samples of the tail of a segment
+        records = np.empty(len(timestamps), dtype=segment['record'])
+        records['timestamp'] = timestamps
+        records['values'] = rows
+        return records.tobytes()
+
+    def _write_chunks(self, segment: dict, last: bool = False) -> None:
+        # Encode the pending samples of a segment in chunks and replace the
+        # tail with the remaining ones, or encode them all if it's the last
+        # chunk
+        timestamps = np.concatenate([block[0] for block in segment['pending']])
+        rows = np.concatenate([block[1] for block in segment['pending']])
+        size = codec.CHUNK_SAMPLES
+        end = len(timestamps) if last else len(timestamps) // size * size
+        index = []
+        for first in range(0, end, size):
+            block = timestamps[first:first + size]
+            chunk = codec.encode(block, rows[first:first + size])
+            index.append((block[0], block[-1], segment['offset'], len(chunk),
+                          len(block)))
+            segment['files']['chunks'].write(chunk)
+            segment['offset'] += len(chunk)
+        # The chunks, then their index, then the tail, so a reader always
+        # finds every sample (see StoreSegment._parts)
+        segment['files']['chunks'].flush()
+        segment['files']['index'].write(
+            np.array(index, dtype=np.int64).tobytes())
+        segment['files']['index'].flush()
+
+        timestamps, rows = timestamps[end:], rows[end:]
+        segment['pending'] = [(timestamps, rows)] if len(timestamps) else []
+        segment['pending_rows'] = len(timestamps)
+        segment['files']['tail'].close()
+        path = os.path.join(segment['path'], 'tail.bin')
+        with open(path + '.tmp', 'wb') as file:
+            file.write(self._records(segment, timestamps, rows))
+        os.replace(path + '.tmp', path)
+        segment['files']['tail'] = open(path, 'ab')
+
+    def _close_segment(self, segment: dict) -> None:
+        # Encode the tail of a segment and close its files
+        if segment.get('pending'):
+            self._write_chunks(segment, last=True)
+        for file in segment['files'].values():
+            file.close()
+
+    def append(
+        self,
+        name: str,
+        timestamp: int,
+        sample: object,
+        columns: list = None,
+        dtype: object = np.float64,
+    ) -> None:
+        r"""Append one sample of a metric family.
+
+        It has the signature of the sampler sinks (see Sampler.add_sink).
+
+        :param name: Metric family (collector name)
+        :param timestamp: Epoch time of the sample in nanoseconds
+        :param sample: Dict with the value of each series, or a NumPy array
+        with the values of the series named by columns
+        :param columns: Names of the values of an array sample
+        :param dtype: NumPy type of the values, defaults to np.float64
+        """
+        with self._lock:
+            self._append(name, timestamp, sample, columns, dtype)
+
+    def _append(
+        self,
+        name: str,
+        timestamp: int,
+        sample: object,
+        columns: list,
+        dtype: object,
+    ) -> None:
+        names = columns if isinstance(sample, np.ndarray) else list(sample)
+        segment = self._segments.get(name)
+        if segment is None or any(column not in segment['index']
+                                  for column in names):
+            merged = [] if segment is None else segment['columns']
+            merged = merged + [column for column in names
+                               if column not in merged]
+            segment = self._open_segment(name, merged, dtype)
+
+        missing = np.nan if segment['dtype'].kind == 'f' else 0
+        row = np.full(len(segment['columns']), missing, dtype=segment['dtype'])
+        if isinstance(sample, np.ndarray):
+            if columns is not segment['array_columns']:
+                segment['array_index'] = np.array(
+                    [segment['index'][column] for column in columns],
+                    dtype=np.intp)
+                segment['array_columns'] = columns
+            row[segment['array_index']] = sample
+        else:
+            for column, value in sample.items():
+                row[segment['index'][column]] = value
+
+        self._write_rows(segment, np.array([timestamp], dtype=np.int64),
+                         row[np.newaxis])
+        for tier, aggregates in self._tiers(name):
+            self._write_buckets(name, tier, aggregates, aggregates.update(
+                timestamp, row, segment['columns']))
+
+    def extend(
+        self,
+        name: str,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        columns: list,
+        dtype: object = None,
+    ) -> None:
+        r"""Append a batch of samples of a metric family at once.
+
+        :param name: Metric family (collector name)
+        :param timestamps: Epoch times of the samples in nanoseconds, after
+        the samples already in the store
+        :param values: 2D array with a row per sample and a column per series
+        :param columns: Names of the columns of the values
+        :param dtype: NumPy type of the values, defaults to None (the type
+        of values)
+        """
+        dtype = np.dtype(values.dtype if dtype is None else dtype)
+        with self._lock:
+            self._extend(name, timestamps, values, columns, dtype)
+            for tier, aggregates in self._tiers(name):
+                self._write_buckets(name, tier, aggregates, aggregates.extend(
+                    timestamps, values, columns))
+
+    def _extend(
+        self,
+        name: str,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        columns: list,
+        dtype: object,
+    ) -> None:
+        segment = self._segments.get(name)
+        if segment is None or any(column not in segment['index']
+                                  for column in columns):
+            merged = [] if segment is None else segment['columns']
+            merged = merged + [column for column in columns
+                               if column not in merged]
+            segment = self._open_segment(name, merged, dtype)
+
+        index = [segment['index'][column] for column in columns]
+        if index == list(range(len(segment['columns']))):
+            rows = np.ascontiguousarray(values, dtype=segment['dtype'])
+        else:
+            missing = np.nan if segment['dtype'].kind == 'f' else 0
+            rows = np.full((len(timestamps), len(segment['columns'])),
+                           missing, dtype=segment['dtype'])
+            rows[:, index] = values
+        self._write_rows(
+            segment, np.ascontiguousarray(timestamps, dtype=np.int64), rows)
+
+    def write_rollups(
+        self,
+        name: str,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        columns: list,
+    ) -> None:
+        r"""Write the rollups of samples already in the store.
+
+        e.g. the samples written before the rollups were kept, the buckets
+        are appended to the tiers of the family.
+
+        :param name: Metric family (collector name)
+        :param timestamps: Epoch times of the samples in nanoseconds, after
+        the samples of the rollups already written
+        :param values: 2D array with a row per sample and a column per series
+        :param columns: Names of the columns of the values
+        """
+        with self._lock:
+            for tier, aggregates in self._tiers(name, force=True):
+                self._write_buckets(name, tier, aggregates, aggregates.extend(
+                    timestamps, values, columns))
+
+    def _tiers(self, name: str, force: bool = False) -> object:
+        # Rollups of each tier of a family, none without rollups
+        if not (self.rollups or force) or name in rollup.EXCLUDED:
+            return ()
+        if name not in self._rollups:
+            self._rollups[name] = {tier: rollup.Rollup(width)
+                                   for tier, width in rollup.TIERS.items()}
+        return self._rollups[name].items()
+
+    def _write_buckets(
+        self,
+        name: str,
+        tier: str,
+        aggregates: rollup.Rollup,
+        closed: list,
+    ) -> None:
+        # Rows of the buckets closed in a tier of a family
+        if not closed:
+            return
+        self._extend(
+            rollup.family(name, tier),
+            np.array([start for start, _ in closed], dtype=np.int64),
+            np.array([row for _, row in closed]),
+            aggregates.names,
+            np.float64,
+        )
+
+    def flush(self) -> None:
+        r"""Write the buffered samples to the files."""
+        with self._lock:
+            for segment in self._segments.values():
+                for file in segment['files'].values():
+                    file.flush()
+
+    def close(self) -> None:
+        r"""Flush and close the files of every segment.
+
+        The open buckets of the rollups are written as they are, the next
+        writer starts them again (in another row with the same start), and
+        the tails are encoded in a last (shorter) chunk.
+        """
+        with self._lock:
+            for name, tiers in self._rollups.items():
+                for tier, aggregates in tiers.items():
+                    self._write_buckets(
+                        name, tier, aggregates, aggregates.flush())
+            self._rollups = {}
+            for segment in self._segments.values():
+                self._close_segment(segment)
+            self._segments = {}
+
+
+# General functions
+
+
+def search_window(timestamps: np.ndarray, start: int, stop: int) -> tuple:
+    r"""Find the rows of sorted timestamps inside a time window.
+
+    :param timestamps: Epoch times in nanoseconds, in order
+    :param start: Epoch time in nanoseconds of the start of the window, None
+    from the first one
+    :param stop: Epoch time in nanoseconds of the end of the window, None up
+    to the last one
+    :return: First and last (excluded) rows of the window
+    """
+    first = 0 if start is None else int(
+        np.searchsorted(timestamps, start, side='left'))
+    last = len(timestamps) if stop is None else int(
+        np.searchsorted(timestamps, stop, side='right'))
+    return first, max(first, last)
+
+
+def record_dtype(columns: int, dtype: object) -> np.dtype:
+    r"""Get the type of the samples of the tail of a segment.
+
+    :param columns: Number of columns of the segment
+    :param dtype: NumPy type of the values
+    :return: Structured type with the timestamp and the values of a sample
+    """
+    return np.dtype([('timestamp', '<i8'), ('values', dtype, (columns,))])
+
+
+def to_epoch_ns(moment: dt.datetime) -> int:
+    r"""Convert a datetime into epoch time in nanoseconds.
+
+    :param moment: Datetime, naive datetimes are taken as local time
+    :return: Epoch time in nanoseconds
+    """
+    return int(moment.timestamp()) * 10**9 + moment.microsecond * 1000
+
+
+def to_datetime_index(timestamps: np.ndarray) -> pd.DatetimeIndex:
+    r"""Convert epoch timestamps into naive local datetimes.
+
+    :param timestamps: Epoch times in nanoseconds
+    :return: Index with the local datetime of each timestamp
+    """
+    index = pd.DatetimeIndex(timestamps.view('datetime64[ns]'), name='Datetime')
+    return index.tz_localize('UTC').tz_convert(LOCAL_TIMEZONE).tz_localize(None)
@@ -0,0 +1,39 @@
+"""Configuration of the tests: the modules are imported from the root."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cgroup  # noqa: E402
+
+# Files of the fake cgroup, with 4 CPUs and no limit
+FILES = {
+    'cgroup.controllers': 'cpuset cpu io memory pids\n',
+    'cpuset.cpus.effective': '0-3\n',
+    'cpu.max': 'max 100000\n',
+    'cpu.stat': 'usage_usec 0\nuser_usec 0\nsystem_usec 0\n',
+    'memory.max': 'max\n',
+    'memory.current': '3000\n',
+    'memory.stat': 'anon 2000\ninactive_file 1000\n',
+    'memory.swap.current': '100\n',
+}
+
+
+@pytest.fixture
+def fake_cgroup(tmp_path):
+    r"""Write the files of a fake cgroup.
+
+    :param tmp_path: Directory of the test
+    :return: Function creating the cgroup with some of its files replaced
+    (a None content removes the file)
+    """
+    def create(**files) -> cgroup.Cgroup:
+        root = tmp_path / 'sys' / 'fs' / 'cgroup'
+        path = root / 'app'
+        path.mkdir(parents=True)
+        for filename, content in {**FILES, **files}.items():
+            if content is not None:
+                (path / filename).write_text(content)
+        return cgroup.Cgroup(str(path), str(root))
+    return create
@@ -0,0 +1,85 @@
+"""Tests of the collectors of a cgroup, on a fake tree of cgroup files."""
+import cgroup
+import psutil
+
+
+def write(group: cgroup.Cgroup, filename: str, content: str) -> None:
+    r"""Replace a file of a cgroup.
+
+    :param group: Cgroup of the file
+    :param filename: Name of the file, e.g. 'cpu.max'
+    :param content: New content of the file
+    """
+    with open(f'{group.path}/{filename}', 'w') as file:
+        file.write(content)
+
+
+def test_cpu_limit_without_quota_is_the_cpuset(fake_cgroup):
+    group = fake_cgroup()
+    assert group.name == '/app'
+    assert group.cpus() == 4
+    assert group.cpu_limit() == 4.0
+
+
+def test_cpu_limit_of_a_numeric_quota(fake_cgroup):
+    assert fake_cgroup(**{'cpu.max': '150000 100000\n'}).cpu_limit() == 1.5
+
+
+def test_cpu_limit_at_most_the_cpuset(fake_cgroup):
+    assert fake_cgroup(**{
+        'cpu.max': '800000 100000\n',
+        'cpuset.cpus.effective': '0,2\n',
+    }).cpu_limit() == 2.0
+
+
+def test_cpu_collector_against_the_quota(fake_cgroup, monkeypatch):
+    group = fake_cgroup(**{'cpu.max': '150000 100000\n'})
+    now = [100.0]
+    monkeypatch.setattr(cgroup.time, 'monotonic', lambda: now[0])
+    collector = cgroup.CgroupCpuCollector(group)
+    now[0] += 1
+    write(group, 'cpu.stat', 'usage_usec 750000\nuser_usec 600000\n'
+                             'system_usec 150000\nthrottled_usec 250000\n')
+    # 0.75 CPU seconds over a second, out of 1.5 CPUs
+    assert list(collector.collect()) == [40.0, 10.0, 25.0, 50.0]
+
+
+def test_memory_without_limit_is_the_host(fake_cgroup):
+    group = fake_cgroup()
+    assert group.memory_limit() is None
+    total = psutil.virtual_memory().total
+    sample = cgroup.CgroupMemoryCollector(group).collect()
+    # memory.current without the inactive page cache
+    assert list(sample) == [total, total - 2000, 2000]
+
+
+def test_memory_limit(fake_cgroup):
+    group = fake_cgroup(**{'memory.max': '10000\n'})
+    assert group.memory_limit() == 10000
+    assert list(cgroup.CgroupMemoryCollector(group).collect()) == [
+        10000, 8000, 2000]
+
+
+def test_swap_without_swap_max_is_the_host(fake_cgroup):
+    group = fake_cgroup(**{'memory.swap.max': None})
+    assert group.memory_limit('memory.swap.max') is None
+    total = psutil.swap_memory().total
+    sample = cgroup.CgroupSwapCollector(group).collect()
+    assert list(sample) == [total, max(total - 100, 0), 100]
+
+
+def test_limits_read_again_after_the_refresh(fake_cgroup, monkeypatch):
+    group = fake_cgroup()
+    now = [100.0]
+    monkeypatch.setattr(cgroup.time, 'monotonic', lambda: now[0])
+    assert group.cpu_limit() == 4.0
+    assert group.memory_limit() is None
+    write(group, 'cpu.max', '50000 100000\n')
+    write(group, 'memory.max', '10000\n')
+    # The limits of the previous reading, until the refresh
+    now[0] += group.refresh / 2
+    assert group.cpu_limit() == 4.0
+    assert group.memory_limit() is None
+    now[0] += group.refresh
+    assert group.cpu_limit() == 0.5
+    assert group.memory_limit() == 10000
@@ -0,0 +1,94 @@
+"""Tests of the compressed encoding of the samples of the metrics store."""
+import codec
+import numpy as np
+import pytest
+
+# Epoch time in nanoseconds of the first sample
+START = 1_675_857_600 * 10**9
+
+
+def grid(rows: int, jitter: int = 0, seed: int = 0) -> np.ndarray:
+    r"""Get the timestamps of samples at 1 Hz.
+
+    :param rows: Number of samples
+    :param jitter: Largest jitter of the timestamps in nanoseconds,
+    defaults to 0
+    :param seed: Seed of the jitter, defaults to 0
+    :return: Epoch times in nanoseconds
+    """
+    random = np.random.default_rng(seed)
+    return (START + np.arange(rows, dtype=np.int64) * 10**9
+            + random.integers(-jitter, jitter + 1, rows))
+
+
+def assert_round_trip(timestamps: np.ndarray, values: np.ndarray) -> None:
+    r"""Check that a chunk decodes back to the exact same samples.
+
+    :param timestamps: Epoch times of the samples in nanoseconds
+    :param values: 2D array with a row per sample and a column per series
+    """
+    chunk = codec.encode(timestamps, values)
+    decoded_timestamps, decoded = codec.decode(chunk, values.dtype)
+    assert decoded.dtype == values.dtype
+    np.testing.assert_array_equal(decoded_timestamps, timestamps)
+    np.testing.assert_array_equal(codec.decode_timestamps(chunk), timestamps)
+    # The same bits, e.g. the sign of -0.0 and the NaNs
+    assert decoded.tobytes() == np.ascontiguousarray(values).tobytes()
+
+
+def test_empty_chunk():
+    assert_round_trip(grid(0), np.zeros((0, 3)))
+
+
+def test_one_row():
+    assert_round_trip(grid(1), np.array([[12.5, 3.0, np.pi]]))
+
+
+def test_one_chunk():
+    random = np.random.default_rng(0)
+    values = random.uniform(0, 100, (codec.CHUNK_SAMPLES, 8)).round(1)
+    assert_round_trip(grid(codec.CHUNK_SAMPLES), values)
+
+
+@pytest.mark.parametrize('jitter', [500_000, 10**9 // 3, 10**12])
+def test_jittered_timestamps(jitter):
+    assert_round_trip(grid(1000, jitter), np.zeros((1000, 1)))
+
+
+def test_mixed_decimal_and_xor_columns():
+    random = np.random.default_rng(1)
+    values = np.column_stack([
+        random.uniform(0, 100, 500).round(1),
+        random.integers(0, 2**40, 500).cumsum().astype(np.float64),
+        random.lognormal(0, 1, 500),
+        random.uniform(-1, 1, 500).round(3),
+    ])
+    assert list(codec.decimals(values)) == [1, 0, -1, 3]
+    assert_round_trip(grid(500), values)
+
+
+def test_nans_and_signed_zeros():
+    values = np.array([
+        [1.5, np.nan, 0.0],
+        [np.nan, 2.0, -0.0],
+        [2.5, np.inf, 0.0],
+    ])
+    assert list(codec.decimals(values)) == [-1, -1, -1]
+    assert_round_trip(grid(3), values)
+
+
+@pytest.mark.parametrize('dtype', [np.int64, np.int32, np.uint8])
+def test_integer_dtypes(dtype):
+    random = np.random.default_rng(2)
+    info = np.iinfo(dtype)
+    values = random.integers(max(info.min, -2**62), min(info.max, 2**62),
+                             (300, 4), dtype=dtype, endpoint=True)
+    assert_round_trip(grid(300), values)
+
+
+def test_narrow_widths_of_slow_series():
+    values = np.full((codec.CHUNK_SAMPLES, 4), 50.0)
+    timestamps = grid(codec.CHUNK_SAMPLES)
+    # A byte per delta-of-delta of the timestamps, and a few bytes of zlib
+    # for the values
+    assert len(codec.encode(timestamps, values)) < len(timestamps) + 200
@@ -0,0 +1,22 @@
+"""Tests of the collectors of this machine."""
+import numpy as np
+from collectors import CpuCollector
+
+# CPU times of a core: user, nice, system, idle, iowait
+TIMES = np.array([100.0, 0.0, 50.0, 800.0, 50.0])
+
+
+def test_cpu_sample_missing_when_a_core_goes_online(monkeypatch):
+    readings = iter([np.tile(TIMES, (2, 1)),
+                     np.tile(TIMES * 2, (3, 1)),
+                     np.tile(TIMES * 3, (3, 1))])
+    monkeypatch.setattr(CpuCollector, '_read', lambda self: next(readings))
+    collector = CpuCollector()
+    collector._set_fields(('user', 'nice', 'system', 'idle', 'iowait'))
+    assert collector.columns == ['Core_0', 'Core_1', 'Total']
+
+    sample = collector.collect()
+    assert collector.columns == ['Core_0', 'Core_1', 'Core_2', 'Total']
+    assert len(sample) == 4 and np.isnan(sample).all()
+    # 150 busy out of 1000 elapsed on every core
+    assert list(collector.collect()) == [15.0] * 4
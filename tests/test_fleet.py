@@ -0,0 +1,61 @@
+"""Tests of the fleet report, with agents and an aggregator on loopback."""
+import sys
+
+import cli
+import fleet
+import numpy as np
+
+# Epoch time in nanoseconds of the first sample
+START = 1_675_857_600 * 10**9
+
+
+def test_aggregate_synthetic_agents(tmp_path, monkeypatch, capsys):
+    # The usage of each host the report is created from
+    usages = []
+    fleet_usage = fleet.fleet_usage
+
+    def record(*args, **kwargs) -> dict:
+        usages.append(fleet_usage(*args, **kwargs))
+        return usages[-1]
+
+    monkeypatch.setattr(fleet, 'fleet_usage', record)
+    output = tmp_path / 'fleet.pdf'
+    monkeypatch.setattr(sys, 'argv', [
+        'cli.py', 'aggregate', '--address', '127.0.0.1:0', '--duration', '3',
+        '--synthetic-agents', '3', '--output', str(output),
+    ])
+    cli.main()
+
+    assert capsys.readouterr().out.strip() == str(output)
+    assert output.stat().st_size
+    usage, = usages
+    assert sorted(usage) == [f'synthetic-{i:03d}' for i in range(3)]
+    for data in usage.values():
+        # A sample per second of each host, each pushed once
+        assert list(data.columns) == ['CPU', 'Memory']
+        assert 2 <= len(data) <= 5
+        assert data.index.is_monotonic_increasing and data.index.is_unique
+        assert data.notna().all().all()
+        assert ((data >= 0) & (data <= 100)).all().all()
+    # The hosts have their own made-up samples
+    assert not usage['synthetic-000'].equals(usage['synthetic-001'])
+
+
+def test_batches_sent_again_are_merged_once():
+    aggregator = fleet.FleetAggregator(('127.0.0.1', 0))
+    try:
+        columns = ['Total']
+        timestamps = START + np.arange(10) * 10**9
+        values = np.arange(10, dtype=np.float64).reshape(-1, 1)
+        aggregator.add_batch('a', 'cpu', timestamps[:6], values[:6], columns)
+        # After a failed push, the agent sends the samples again
+        aggregator.add_batch('a', 'cpu', timestamps[4:], values[4:], columns)
+        aggregator.add_batch('b', 'cpu', timestamps, values + 50, columns)
+        assert aggregator.hosts() == ['a', 'b']
+        frame = aggregator.frame('a', 'cpu')
+        assert list(frame['Total']) == list(range(10))
+        assert list(aggregator.frame('b', 'cpu')['Total']) == list(
+            range(50, 60))
+        assert aggregator.frame('c', 'cpu').empty
+    finally:
+        aggregator.stop()
@@ -0,0 +1,18 @@
+"""Tests of the fast-path collectors of Linux."""
+from procfs import ProcFile
+
+
+def test_proc_file_read_in_place(tmp_path):
+    path = tmp_path / 'stat'
+    path.write_bytes(b'cpu 1 2 3\n')
+    file = ProcFile(str(path), size=4)
+    content = file.read()
+    assert content == b'cpu 1 2 3\n'
+
+    # Longer than the buffer and its spare bytes, then shorter again
+    for data in (b'cpu 10 20 30\n' * 100, b'cpu 9\n', b'', b'cpu 1 2 3 4\n'):
+        path.write_bytes(data)
+        assert file.read() == data
+    # The content is the buffer itself, not a copy
+    assert file.read() is content
+    file.close()
@@ -0,0 +1,50 @@
+"""Tests of the sections of the report."""
+import datetime as dt
+from io import BytesIO
+
+import numpy as np
+from report import HardwareReport
+from sources import CgroupSource, ReplaySource
+from store import MetricsStore
+
+# Epoch time in seconds of the first sample
+START = 1_675_857_600
+
+
+def test_cpu_section_of_a_cgroup(tmp_path, fake_cgroup, monkeypatch):
+    store = MetricsStore(str(tmp_path / 'metrics'))
+    group = fake_cgroup(**{'cpu.max': '150000 100000\n'})
+    store.write_machine_info(
+        CgroupSource(group.path, group.root).machine_info())
+    writer = store.writer(rollups=False)
+    writer.extend('cpu', (START + np.arange(60, dtype=np.int64)) * 10**9,
+                  np.tile([20.0, 10.0, 50.0, 30.0], (60, 1)),
+                  ['User', 'System', 'Throttled', 'Total'])
+    writer.close()
+
+    # Headers of the tables and the data of the plots of the report
+    labels, plots = [], {}
+    summary_table = HardwareReport.summary_table
+    add_plot = HardwareReport.add_plot
+
+    def record_table(self, label, *args, **kwargs) -> object:
+        labels.append(label)
+        return summary_table(self, label, *args, **kwargs)
+
+    def record_plot(self, device, data, *args, **kwargs) -> None:
+        plots[device] = data
+        add_plot(self, device, data, *args, **kwargs)
+
+    monkeypatch.setattr(HardwareReport, 'summary_table', record_table)
+    monkeypatch.setattr(HardwareReport, 'add_plot', record_plot)
+    HardwareReport(
+        start_time=dt.datetime.fromtimestamp(START),
+        stop_time=dt.datetime.fromtimestamp(START + 59),
+        system=False, memory=False, disk=False, network=False,
+        source=ReplaySource(store), chart_format='vector',
+        render_workers=1, output=BytesIO(),
+    ).generate_pdf()
+
+    assert labels[0] == 'Series'
+    # The throttled time isn't a usage, it's only in the table
+    assert list(plots['CPU'].columns) == ['User', 'System', 'Total']
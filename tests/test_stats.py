@@ -0,0 +1,87 @@
+"""Tests of the online statistics of the series."""
+import numpy as np
+import stats
+from collectors import SyntheticCpuCollector
+from sampler import Sampler
+from store import RingBuffer
+
+# Epoch time in nanoseconds of the first sample
+START = 1_675_857_600 * 10**9
+
+
+class IoCollector:
+    """Made-up I/O counters, growing from very different values."""
+
+    name = 'disk_io'
+    columns = ['sda_read_bytes', 'sda_read_count']
+
+    def collect(self) -> np.ndarray:
+        r"""Take one made-up sample."""
+        return np.array([1e12, 1e3])
+
+
+def test_quantiles_within_relative_accuracy():
+    random = np.random.default_rng(0)
+    values = random.lognormal(0, 2, (5000, 3)) * [1e-3, 1, 1e9]
+    summary = stats.SeriesStats().update(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = np.quantile(values, q, axis=0, method='lower')
+        assert np.all(np.abs(summary.quantile(q) - exact)
+                      <= 2 * stats.DEFAULT_RELATIVE_ACCURACY * exact)
+    assert np.allclose(summary.mean, values.mean(axis=0))
+    assert np.allclose(summary.std, values.std(axis=0))
+
+
+def test_merge_equals_update_of_every_sample():
+    random = np.random.default_rng(1)
+    values = random.lognormal(0, 3, (600, 4))
+    values[random.random(values.shape) < 0.1] = 0
+    values[random.random(values.shape) < 0.05] = np.nan
+    whole = stats.SeriesStats().update(values)
+    merged = stats.SeriesStats().update(values[:200])
+    for row in values[200:300]:
+        merged.update(row)
+    merged.merge(stats.SeriesStats().update(values[300:]))
+    for q in (0.01, 0.5, 0.99):
+        assert np.array_equal(merged.quantile(q), whole.quantile(q))
+    assert np.array_equal(merged.count, whole.count)
+    assert np.allclose(merged.mean, whole.mean)
+
+
+def test_sketch_buckets_bounded_per_series():
+    values = np.geomspace(1e-6, 1e15, 10_000)[:, np.newaxis]
+    summary = stats.SeriesStats().update(values)
+    assert summary._buckets.shape == (1, stats.MAX_BUCKETS)
+    # The highest quantiles keep their accuracy
+    exact = np.quantile(values, 0.99, method='lower')
+    assert abs(summary.quantile(0.99)[0] - exact) <= 0.02 * exact
+
+
+def test_windowed_stats_memory_bounded():
+    # A day of series at very different scales, as the I/O counters
+    rows = 24 * 60 * 60
+    timestamps = START + np.arange(rows, dtype=np.int64) * 10**9
+    values = np.column_stack([
+        1e12 + np.arange(rows) * 1e5, 1e3 + np.arange(rows) % 7,
+        np.geomspace(1e-3, 1e12, rows),
+    ])
+    buffer = RingBuffer(rows, stats_block=stats.DEFAULT_BLOCK)
+    buffer.extend(timestamps, values, ['a', 'b', 'c'])
+    blocks = len(buffer.stats.blocks)
+    assert blocks == rows * 10**9 // stats.DEFAULT_BLOCK
+    assert buffer.stats.nbytes <= blocks * 3 * (stats.MAX_BUCKETS + 16) * 8
+    # Each series only keeps the buckets of its own values
+    assert buffer.stats.nbytes < buffer._values.nbytes
+
+
+def test_sampler_keeps_stats_of_summarized_families_only():
+    sampler = Sampler(interval=1.0, capacity=3600)
+    sampler.add_collector(SyntheticCpuCollector(4, seed=0))
+    sampler.add_collector(IoCollector())
+    for tick in range(300):
+        sampler._tick(START + tick * 10**9)
+    assert sampler.buffer('cpu').stats is not None
+    assert sampler.buffer('disk_io').stats is None
+    summary = sampler.summary('disk_io')
+    assert summary.loc['sda_read_bytes', 'Max'] == 1e12
+    assert summary.loc['sda_read_count', 'Count'] == 300
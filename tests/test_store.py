@@ -0,0 +1,114 @@
+"""Tests of the metrics store, written then read back."""
+import codec
+import numpy as np
+import pytest
+from store import ENCODINGS, MetricsStore
+
+# Epoch time in nanoseconds of the first sample
+START = 1_675_857_600 * 10**9
+
+# Samples of the tests, a chunk and a half at 1 Hz
+ROWS = codec.CHUNK_SAMPLES * 3 // 2
+
+
+def samples(rows: int, columns: int, seed: int = 0) -> tuple:
+    r"""Make up samples at 1 Hz.
+
+    :param rows: Number of samples
+    :param columns: Number of series
+    :param seed: Seed of the values, defaults to 0
+    :return: Timestamps and values
+    """
+    random = np.random.default_rng(seed)
+    timestamps = START + np.arange(rows, dtype=np.int64) * 10**9
+    return timestamps, random.uniform(0, 100, (rows, columns)).round(1)
+
+
+def window(timestamps: np.ndarray, first: int, last: int) -> tuple:
+    r"""Get the bounds of the window from a sample to another.
+
+    :param timestamps: Epoch times of the samples in nanoseconds
+    :param first: Position of the first sample of the window
+    :param last: Position of the last sample of the window
+    :return: Epoch times of the start and the end of the window
+    """
+    return int(timestamps[first]), int(timestamps[last])
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_read_across_a_chunk_boundary(tmp_path, encoding):
+    store = MetricsStore(str(tmp_path))
+    writer = store.writer(rollups=False, encoding=encoding)
+    timestamps, values = samples(ROWS, 3)
+    # Batches that don't end on the chunks
+    for first in range(0, ROWS, 1000):
+        writer.extend('cpu', timestamps[first:first + 1000],
+                      values[first:first + 1000], ['a', 'b', 'c'])
+    writer.flush()
+
+    # The samples of the tail are read before the writer is closed
+    for closed in (False, True):
+        boundary = codec.CHUNK_SAMPLES
+        for first, last in ((boundary - 10, boundary + 10), (0, ROWS - 1),
+                            (boundary, boundary), (ROWS - 5, ROWS - 1)):
+            data = store.read('cpu', *window(timestamps, first, last))
+            assert list(data.columns) == ['a', 'b', 'c']
+            np.testing.assert_array_equal(data.index.asi8,
+                                          timestamps[first:last + 1])
+            np.testing.assert_array_equal(data.to_numpy(),
+                                          values[first:last + 1])
+            assert store.count('cpu', *window(timestamps, first, last)) == (
+                last + 1 - first)
+        if not closed:
+            writer.close()
+
+    segment, = store.segments('cpu')
+    assert segment.time_range() == window(timestamps, 0, ROWS - 1)
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_read_across_a_segment_boundary(tmp_path, encoding):
+    store = MetricsStore(str(tmp_path))
+    writer = store.writer(rollups=False, encoding=encoding)
+    timestamps, values = samples(ROWS, 3, seed=1)
+    middle = ROWS // 2
+    writer.extend('net_io', timestamps[:middle], values[:middle, :2],
+                  ['eth0', 'lo'])
+    # A NIC plugged in starts a new segment
+    writer.extend('net_io', timestamps[middle:], values[middle:],
+                  ['eth0', 'lo', 'wlan0'])
+    writer.close()
+    assert len(store.segments('net_io')) == 2
+
+    data = store.read('net_io', *window(timestamps, middle - 5, middle + 5))
+    assert list(data.columns) == ['eth0', 'lo', 'wlan0']
+    np.testing.assert_array_equal(data.index.asi8,
+                                  timestamps[middle - 5:middle + 6])
+    np.testing.assert_array_equal(data[['eth0', 'lo']].to_numpy(),
+                                  values[middle - 5:middle + 6, :2])
+    assert data['wlan0'][:5].isna().all()
+    np.testing.assert_array_equal(data['wlan0'][5:],
+                                  values[middle:middle + 6, 2])
+    assert len(store.read('net_io')) == ROWS
+    assert store.count('net_io') == ROWS
+
+
+def test_appended_samples_of_new_writers(tmp_path):
+    store = MetricsStore(str(tmp_path))
+    timestamps, values = samples(codec.CHUNK_SAMPLES + 10, 2, seed=2)
+    middle = codec.CHUNK_SAMPLES - 5
+    for first, last in ((0, middle), (middle, len(timestamps))):
+        # Each writer starts a new segment
+        writer = store.writer(rollups=False)
+        for timestamp, row in zip(timestamps[first:last],
+                                  values[first:last]):
+            writer.append('memory', int(timestamp), row, ['Total', 'Used'])
+        writer.close()
+
+    assert len(store.segments('memory')) == 2
+    data = store.read('memory')
+    np.testing.assert_array_equal(data.index.asi8, timestamps)
+    np.testing.assert_array_equal(data.to_numpy(), values)
+    data = store.read('memory', *window(timestamps, middle - 1, middle))
+    np.testing.assert_array_equal(data.to_numpy(),
+                                  values[middle - 1:middle + 1])
@@ -0,0 +1,55 @@
+"""Tests of the conversions of the samples for the report."""
+import numpy as np
+import pandas as pd
+import utils
+from store import to_datetime_index
+
+# Epoch time in nanoseconds of the first sample
+START = 1_675_857_600 * 10**9
+
+
+def counters(**columns) -> pd.DataFrame:
+    r"""Get counters sampled at 1 Hz.
+
+    :param columns: Values of each counter
+    :return: Dataframe of the counters indexed by datetime
+    """
+    rows = len(next(iter(columns.values())))
+    index = to_datetime_index(START + np.arange(rows, dtype=np.int64) * 10**9)
+    return pd.DataFrame(columns, index=index, dtype=np.float64)
+
+
+def test_counter_rates():
+    rates = utils.counter_rates(counters(bytes=[0, 100, 300, 300]))
+    assert list(rates['bytes']) == [100, 200, 0]
+    assert rates.index[0] == pd.Timestamp(START + 10**9, tz=rates.index.tz)
+
+
+def test_counter_reset_is_missing():
+    # A NIC plugged in again, far from the 32 bits wrap
+    rates = utils.counter_rates(
+        counters(bytes=[3_000_000_000, 3_000_001_000, 500, 1500]))
+    assert rates['bytes'][0] == 1000
+    assert np.isnan(rates['bytes'][1])
+    assert rates['bytes'][2] == 1000
+    # A 64 bits counter is never wrapped
+    rates = utils.counter_rates(counters(bytes=[2**40, 2**40 + 10, 20]))
+    assert np.isnan(rates['bytes'][1])
+
+
+def test_counter_wrap_around():
+    rates = utils.counter_rates(counters(bytes=[2**32 - 1000, 2**32 - 10,
+                                                2000, 3000]))
+    assert list(rates['bytes']) == [990, 2010, 1000]
+
+
+def test_device_rates():
+    rates = utils.device_rates(counters(**{
+        'sda:read_bytes': [0, 10, 30],
+        'sda:write_bytes': [0, 5, 5],
+        'eth0:read_bytes': [50, 60, 10],
+    }))
+    assert rates.columns.names == ['Device', 'Counter']
+    assert list(rates[('sda', 'read_bytes')]) == [10, 20]
+    assert list(rates[('sda', 'write_bytes')]) == [5, 0]
+    assert np.isnan(rates[('eth0', 'read_bytes')][1])
@@ -1,30 +1,86 @@
-"""Contains all functions related to graph plotting and PDF file generation."""
+"""Contains all functions related to graph plotting and PDF file generation.
+
+seaborn, matplotlib and reportlab take most of the import time of the app, so
+they are only imported when a plot is rendered or a PDF is built.
+"""
 import datetime as dt
+import functools
+import os
+from io import BytesIO
 
+import numpy as np
 import pandas as pd
-import requests
-import seaborn as sns
-from matplotlib import pyplot as plt
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
-from reportlab.platypus import (Image, PageBreak, Paragraph, SimpleDocTemplate,
-                                Table)
+from decimation import decimate
+
+# Page size (A4) and inch in points, as in reportlab.lib.pagesizes and
+# reportlab.lib.units
+A4 = (595.2755905511812, 841.8897637795277)
+inch = 72.0
+
+# Python logo at the top of the PDF, shipped with the app
+LOGO_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'assets', 'python-logo.png')
+
+
+# Colors of the vector charts, the default palette of seaborn
+CHART_COLORS = (
+    '#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf',
+)
 
 
 class GraphBuilder:
-    """Graphic related logic."""
+    """Graphic related logic.
 
-    def lineplot(self, device: str, data: pd, filename: str) -> None:
+    The figures are created with the object-oriented API of matplotlib on
+    the Agg canvas, without the global state of pyplot, so many of them can
+    be rendered at the same time (see render_lineplot).
+    """
+
+    # Size of the figures in inches and their resolution
+    figsize = (12, 8)
+    dpi = 100
+    # More points than pixels don't change the plot, they only slow down
+    # the rendering
+    default_max_points = figsize[0] * dpi
+
+    def lineplot(
+        self,
+        device: str,
+        data: pd,
+        output: object,
+        unit: str = 'GB',
+        max_points: int = None,
+        decimation: str = 'minmax',
+        stacked: bool = False,
+    ) -> None:
         r"""Line plots for CPU and memory data.
 
         :param device: Device to be analysed
         :param data: Data to be plotted
-        :param filename: Filename where will be saved the image
+        :param output: Filename or file object (e.g. BytesIO) where will be
+        saved the PNG image
+        :param unit: Unit of the memory and rate data, defaults to 'GB'
+        :param max_points: Maximum number of points plotted per series,
+        defaults to None (the width of the figure in pixels)
+        :param decimation: Method used to reduce the points to max_points
+        (see decimation.METHODS), defaults to 'minmax'. None plots all the
+        points.
+        :param stacked: Stack the series (all but the total) as areas,
+        e.g. the share of each process, defaults to False
         """
-        fig, axes = plt.subplots(2, 1)
-        fig.set_size_inches(12, 8)
+        import seaborn as sns
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(2, 1)
+
+        if max_points is None:
+            max_points = self.default_max_points
+        data = decimate(data, max_points, decimation)
+
         fig.suptitle(
             f'{device} Usage vs Time',
             fontname='Times New Roman',
@@ -32,7 +88,13 @@ class GraphBuilder:
             fontsize=16,
         )
 
-        sns.lineplot(data=data.iloc[:, :-1], ax=axes[0])
+        if stacked:
+            series = data.iloc[:, :-1].fillna(0)
+            axes[0].stackplot(series.index, series.to_numpy().T,
+                              labels=series.columns, alpha=0.8)
+            axes[0].legend(loc='upper left', fontsize='small')
+        else:
+            sns.lineplot(data=data.iloc[:, :-1], ax=axes[0])
         sns.lineplot(data=data.iloc[:, -1],
                      ax=axes[1], label=f'Total {device}')
 
@@ -40,17 +102,15 @@ class GraphBuilder:
         axes[1].set_title(f'Total {device} Usage')
 
         def fill_plotted_area(
-                axis: list = None,
+                axis: object,
                 alpha: float = 0.2,
                 **kwargs) -> None:
             r"""Display the lineplot with its filled area.
 
-            :param axis: List with the values of a axis, defaults to None
+            :param axis: Axis with the plotted lines
             :param alpha: Transparency level on the filled area,
             defaults to 0.2
             """
-            if axis is None:
-                axis = plt.gca()
             for line in axis.lines:
                 x_axis, y_axis = line.get_xydata().T
                 axis.fill_between(
@@ -66,15 +126,20 @@ class GraphBuilder:
                          ylabel=f'{device} (%)', ylim=(0, 100))
                 axis.tick_params(axis='x', labelrotation=45)
         elif device in ('Memory', 'Swap'):
-            axes[0].set(xlabel='Datetime', ylabel=f'{device} (Gb)')
+            axes[0].set(xlabel='Datetime', ylabel=f'{device} ({unit})')
             axes[0].tick_params(axis='x', labelrotation=45)
             axes[1].set(xlabel='Datetime',
                         ylabel=f'{device} (%)', ylim=(0, 100))
             axes[1].tick_params(axis='x', labelrotation=45)
+        else:
+            # Rates, e.g. the disk and network throughput
+            for axis in axes.flat:
+                axis.set(xlabel='Datetime', ylabel=f'{device} ({unit})')
+                axis.set_ylim(bottom=0)
+                axis.tick_params(axis='x', labelrotation=45)
 
         fig.tight_layout()
-        plt.close(fig)
-        fig.savefig(filename)
+        fig.savefig(output, format='png')
 
 
 class PdfBuilder:
@@ -84,23 +149,35 @@ class PdfBuilder:
     """
 
     pagesize = A4
-    # Gets the logo image location on the web
-    logo_url = (
-        'https://www.python.org/static/community_logos/python-logo-master-v3-TM.png'
-    )
-    # Creates the Image object for the logo, with its size setup
-    logo = Image(requests.get(logo_url, stream=True).raw, 2 * inch, 0.5 * inch)
-    logo.hAlign = 'LEFT'  # Set the logo on the left side of the PDF
 
-    def create_template(self, current_formatted_time: dt, pagesize: object):
+    @property
+    def logo(self) -> object:
+        r"""Python logo for the top of the PDF.
+
+        :return: Object with the formatted logo for the PDF
+        """
+        # Set the logo on the left side of the PDF, with its size setup
+        return self.format_image(BytesIO(load_logo()), 'LEFT',
+                                 2 * inch, 0.5 * inch)
+
+    def create_template(
+        self,
+        current_formatted_time: dt,
+        pagesize: object,
+        filename: str = None,
+    ):
         r"""Create the PDF template.
 
         :param current_formatted_time: Current fomatted time
         :param pagesize: Page type e.g. A4 or LETTER
+        :param filename: Path with the filename of the PDF, defaults to None
+        (Hardware_Report_<current formatted time>.pdf)
         :return: Template for the final PDF
         """
+        from reportlab.platypus import SimpleDocTemplate
+
         return SimpleDocTemplate(
-            f'Hardware_Report_{current_formatted_time}.pdf',
+            filename or f'Hardware_Report_{current_formatted_time}.pdf',
             pagesize=pagesize,
             rightMargin=0.5 * inch,
             leftMargin=0.5 * inch,
@@ -120,6 +197,9 @@ class PdfBuilder:
         :param text: Text to be written on the PDF
         :return: Object with the formatted text for the PDF
         """
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import Paragraph
+
         return Paragraph(
             text.replace('\n', '<br />').replace('\t', '&nbsp;' * 4),
             getSampleStyleSheet()['Normal'],
@@ -127,30 +207,187 @@ class PdfBuilder:
 
     def format_image(
         self,
-        filename: str,
+        filename: object,
         position: str = 'CENTER',
         width: float = A4[0] - inch,
         height: float = (A4[0] - inch) * (8 / 12),
-    ) -> plt:
+    ) -> object:
         r"""Format an image for the PDF file.
 
-        :param filename: Image filename
+        :param filename: Image filename or file object (e.g. BytesIO)
         :param position: Image position (CENTER, LEFT, RIGHT),
         defaults to 'CENTER'
         :param width: Image width in inches, defaults to A4[0]-inch
         :param height: _description_, defaults to (A4[0] - inch)*(8 / 12)
         :return: Object with the formatted image for the PDF
         """
+        from reportlab.platypus import Image
+
         plot = Image(filename, width, height)
         plot.hAlign = position
         return plot
 
+    def format_vector_chart(
+        self,
+        device: str,
+        data: pd.DataFrame,
+        unit: str = 'GB',
+        width: float = A4[0] - inch,
+        height: float = (A4[0] - inch) * (8 / 12),
+    ) -> object:
+        r"""Draw the line plots of GraphBuilder.lineplot as vector graphics.
+
+        The chart is a reportlab Drawing, embedded in the PDF as paths
+        instead of a bitmap: it stays sharp when zoomed and, for decimated
+        data, is smaller than the PNG image.
+
+        :param device: Device to be analysed
+        :param data: Data to be plotted, the last column is the total
+        :param unit: Unit of the memory and rate data, defaults to 'GB'
+        :param width: Chart width, defaults to A4[0]-inch
+        :param height: Chart height, defaults to (A4[0] - inch)*(8 / 12)
+        :return: Drawing with the chart for the PDF
+        """
+        from reportlab.graphics.charts.legends import Legend
+        from reportlab.graphics.charts.lineplots import LinePlot
+        from reportlab.graphics.shapes import Drawing, String
+        from reportlab.lib import colors
+
+        drawing = Drawing(width, height)
+        drawing.add(String(
+            width / 2, height - 14, f'{device} Usage vs Time',
+            textAnchor='middle', fontName='Times-Bold', fontSize=14,
+        ))
+
+        # Same axes as GraphBuilder.lineplot: the percentages from 0 to 100
+        # and the other units from 0
+        if device == 'CPU':
+            panels = ((f'{device} Usage (%)', True),
+                      (f'Total {device} Usage (%)', True))
+        elif device in ('Memory', 'Swap'):
+            panels = ((f'{device} Usage ({unit})', False),
+                      (f'Total {device} Usage (%)', True))
+        else:
+            panels = ((f'{device} Usage ({unit})', False),
+                      (f'Total {device} Usage ({unit})', False))
+
+        # The naive datetimes are plotted as seconds, and shown back as they
+        # are
+        x = data.index.values.astype(np.int64) / 1e9
+        panel_height = (height - 20) / 2
+        legend_width = 70
+        for i, (frame, (title, percent)) in enumerate(
+                zip((data.iloc[:, :-1], data.iloc[:, -1:]), panels)):
+            bottom = (1 - i) * panel_height
+            drawing.add(String(
+                width / 2, bottom + panel_height - 10, title,
+                textAnchor='middle', fontName='Helvetica', fontSize=9,
+            ))
+
+            series, names = [], []
+            for name, values in frame.items():
+                valid = ~np.isnan(values.to_numpy(dtype=np.float64))
+                if valid.any():
+                    series.append(list(zip(x[valid], values.to_numpy()[valid])))
+                    names.append(str(name))
+            if not series:
+                drawing.add(String(
+                    width / 2, bottom + panel_height / 2, 'No samples',
+                    textAnchor='middle', fontName='Helvetica', fontSize=9,
+                ))
+                continue
+
+            plot = LinePlot()
+            plot.x, plot.y = 45, bottom + 35
+            plot.width = width - plot.x - legend_width - 10
+            plot.height = panel_height - 55
+            plot.data = series
+            plot.joinedLines = 1
+            plot.lines.symbol = None
+            plot.lines.strokeWidth = 0.6
+            for j in range(len(series)):
+                color = colors.HexColor(CHART_COLORS[j % len(CHART_COLORS)])
+                plot.lines[j].strokeColor = color
+                if i == 1:
+                    # Display the total with its filled area
+                    plot.lines[j].inFill = True
+                    plot.lines[j].fillColor = colors.Color(
+                        color.red, color.green, color.blue, alpha=0.2)
+
+            first, last = x.min(), x.max()
+            if first == last:
+                first, last = first - 1, last + 1
+            plot.xValueAxis.valueMin = first
+            plot.xValueAxis.valueMax = last
+            time_format = '%H:%M:%S' if last - first < 86400 else '%d/%m %H:%M'
+            plot.xValueAxis.labelTextFormat = (
+                lambda value: pd.Timestamp(value, unit='s').strftime(
+                    time_format))
+            plot.xValueAxis.labels.angle = 30
+            plot.xValueAxis.labels.boxAnchor = 'ne'
+            plot.xValueAxis.labels.fontSize = 6
+            plot.yValueAxis.labels.fontSize = 6
+            plot.yValueAxis.valueMin = 0
+            if percent:
+                plot.yValueAxis.valueMax = 100
+            drawing.add(plot)
+
+            legend = Legend()
+            legend.x = width - legend_width
+            legend.y = bottom + panel_height - 20
+            legend.fontSize = 6
+            legend.columnMaximum = 16
+            legend.alignment = 'right'
+            legend.colorNamePairs = [
+                (colors.HexColor(CHART_COLORS[j % len(CHART_COLORS)]),
+                 names[j] if i == 0 else f'Total {device}')
+                for j in range(len(series))
+            ]
+            drawing.add(legend)
+        return drawing
+
+    def format_sparkline(
+        self,
+        values: np.ndarray,
+        width: float = 1.5 * inch,
+        height: float = 0.3 * inch,
+        maximum: float = 100.0,
+    ) -> object:
+        r"""Draw a small line without axes, e.g. in a table cell.
+
+        :param values: Values in order, the missing ones are skipped
+        :param width: Line width, defaults to 1.5*inch
+        :param height: Line height, defaults to 0.3*inch
+        :param maximum: Value at the top of the line, defaults to 100.0
+        (percentages)
+        :return: Drawing with the line for the PDF
+        """
+        from reportlab.graphics.shapes import Drawing, PolyLine
+        from reportlab.lib import colors
+
+        drawing = Drawing(width, height)
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        if valid.sum() < 2:
+            return drawing
+        x = np.linspace(0, width, len(values))[valid]
+        y = np.clip(values[valid] / maximum, 0, 1) * (height - 2) + 1
+        drawing.add(PolyLine(
+            np.column_stack((x, y)).ravel().tolist(),
+            strokeColor=colors.HexColor(CHART_COLORS[0]),
+            strokeWidth=0.8,
+        ))
+        return drawing
+
     def format_table(self, data: list) -> object:
         r"""Format a table for the PDF file.
 
         :param data: List of strings to be on the table of the PDF file
         :return: Object with the formatted table for the PDF
         """
+        from reportlab.lib import colors
+        from reportlab.platypus import Table
+
         formatted_table = Table(
             data,
             style=[
@@ -170,6 +407,8 @@ class PdfBuilder:
         :param data: List of strings to be on the table of the PDF file
         :return: Object with the unformatted table for the PDF
         """
+        from reportlab.platypus import Table
+
         return Table(data)
 
     def go_next_page(self) -> object:
@@ -177,6 +416,8 @@ class PdfBuilder:
 
         :return: PDF file
         """
+        from reportlab.platypus import PageBreak
+
         return PageBreak()
 
     def build_pdf(self, canvas: object, parts: list) -> None:
@@ -192,6 +433,49 @@ class PdfBuilder:
 # General functions
 
 
+@functools.lru_cache(maxsize=None)
+def load_logo() -> bytes:
+    r"""Read the Python logo, once per process.
+
+    :return: PNG image of the logo
+    """
+    with open(LOGO_PATH, 'rb') as file:
+        return file.read()
+
+
+def render_lineplot(plot: dict) -> bytes:
+    r"""Render a line plot in memory, it can run in a worker process.
+
+    :param plot: Arguments of GraphBuilder.lineplot, except the output
+    :return: PNG image
+    """
+    image = BytesIO()
+    GraphBuilder().lineplot(output=image, **plot)
+    return image.getvalue()
+
+
+def render_page(pdf: object, page_number: int, width: int) -> bytes:
+    r"""Render one page of a PDF as a PNG image (e.g. for the frontend).
+
+    :param pdf: Path with the filename of the PDF file, or its bytes
+    :param page_number: Page to be rendered, starting at 0
+    :param width: Width of the image in pixels
+    :return: PNG image of the page
+    """
+    import fitz
+
+    if isinstance(pdf, bytes):
+        doc = fitz.open(stream=pdf, filetype='pdf')
+    else:
+        doc = fitz.open(pdf)
+    with doc:
+        page = doc.load_page(page_number)
+        # The zoom matches the page to the width of the container
+        zoom = width / page.rect.width
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return pix.tobytes('png')
+
+
 def addMins(tm: dt, mins: int) -> dt:
     r"""Add minutes to a datetime object.
 
@@ -203,3 +487,159 @@ def addMins(tm: dt, mins: int) -> dt:
                            tm.second, tm.microsecond)
     fulldate = fulldate + dt.timedelta(minutes=mins)
     return fulldate.time()
+
+
+def convert_bytes_to_readable_measurement(
+        byte_value: float, suffix: str = 'B') -> str:
+    r"""Scale bytes to its proper format.
+
+    e.g:
+        1253656 => '1.20MB'
+        1253656678 => '1.17GB'
+
+    :param byte_value: Value in bytes
+    :param suffix: Suffix appended to the unit, defaults to 'B'
+    :return: Readable measurement
+    """
+    factor = 1024
+    for unit in ['', 'K', 'M', 'G', 'T', 'P']:
+        if byte_value < factor:
+            return f'{byte_value:.2f}{unit}{suffix}'
+        byte_value /= factor
+
+
+def scale_bytes(data: pd.DataFrame, factor: int = 1024) -> tuple:
+    r"""Scale a Dataframe of bytes to a single readable unit.
+
+    The unit is chosen from the largest value, so all the columns can be
+    plotted on the same axis.
+
+    e.g:
+        [1253656, 1253656678] => [0.00117, 1.17], 'GB'
+
+    :param data: Dataframe with values in bytes
+    :param factor: Size of each unit step, defaults to 1024
+    :return: Scaled Dataframe and its unit
+    """
+    units = ['', 'K', 'M', 'G', 'T', 'P']
+    peak = data.abs().max().max() if data.size else 0
+    exponent = 0
+    while peak >= factor and exponent < len(units) - 1:
+        peak /= factor
+        exponent += 1
+    return data / factor**exponent, f'{units[exponent]}B'
+
+
+def counter_rates(data: pd.DataFrame, wrap: int = 2**32) -> pd.DataFrame:
+    r"""Convert cumulative counters into rates per second.
+
+    A counter that decreases between two samples was reset (e.g. a NIC
+    plugged in again), and the rate of a reset is missing (NaN). It only
+    wrapped around (e.g. a 32 bits counter) when it was close below the
+    wrap value and starts again from a small value, i.e. the increase across
+    the wrap is below a sixteenth of the wrap value.
+
+    :param data: Dataframe of counters indexed by datetime
+    :param wrap: Value where the counters wrap around, defaults to 2**32
+    :return: Rate of each counter between a sample and the previous one,
+    indexed by the datetime of the later sample
+    """
+    values = data.to_numpy(dtype=np.float64)
+    seconds = np.diff(data.index.values.astype(np.int64)) / 1e9
+    deltas = np.diff(values, axis=0)
+
+    decreased = deltas < 0
+    wrapped = (decreased & (values[:-1] < wrap)
+               & (deltas + wrap < wrap // 16))
+    deltas[wrapped] += wrap
+    deltas[decreased & ~wrapped] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = deltas / seconds[:, np.newaxis]
+    rates[~np.isfinite(rates)] = np.nan
+    return pd.DataFrame(rates, index=data.index[1:], columns=data.columns)
+
+
+def device_rates(data: pd.DataFrame) -> pd.DataFrame:
+    r"""Convert the '<device>:<counter>' I/O counters into rates per second.
+
+    :param data: Dataframe of counters indexed by datetime
+    :return: Dataframe of rates with (device, counter) columns
+    """
+    rates = counter_rates(data)
+    rates.columns = pd.MultiIndex.from_tuples(
+        [tuple(column.rsplit(':', 1)) for column in rates.columns],
+        names=['Device', 'Counter'],
+    )
+    return rates
+
+
+def io_throughput(
+    rates: pd.DataFrame,
+    bytes_in: str,
+    bytes_out: str,
+) -> pd.DataFrame:
+    r"""Compute the throughput (bytes in and out) of each device.
+
+    :param rates: Dataframe of rates with (device, counter) columns
+    :param bytes_in: Counter of the bytes in (e.g. 'read_bytes')
+    :param bytes_out: Counter of the bytes out (e.g. 'write_bytes')
+    :return: Dataframe of bytes per second with a column per device and
+    their 'Total'
+    """
+    throughput = (
+        rates.xs(bytes_in, level='Counter', axis=1)
+        .add(rates.xs(bytes_out, level='Counter', axis=1), fill_value=0)
+    )
+    throughput['Total'] = throughput.sum(axis=1, min_count=1)
+    return throughput
+
+
+def process_usage(data: pd.DataFrame) -> tuple:
+    r"""Convert the ranks of the top processes into a series per process.
+
+    :param data: Samples of the '<rank>:pid', '<rank>:cpu' and '<rank>:rss'
+    columns (see collectors.ProcessCollector) indexed by datetime
+    :return: Dataframes of the CPU percentage and of the RSS in bytes with a
+    column per PID, 0 when the process wasn't in the top, and the share of
+    the samples (0 to 1) where each process was in the top
+    """
+    ranks = len(data.columns) // 3
+    values = data[[f'{rank}:{field}' for rank in range(ranks)
+                   for field in ('pid', 'cpu', 'rss')]].to_numpy(
+        dtype=np.float64).reshape(len(data), ranks, 3)
+    ranked = ~np.isnan(values[:, :, 0])
+    pids, columns = np.unique(values[:, :, 0][ranked].astype(np.int64),
+                              return_inverse=True)
+    rows = np.nonzero(ranked)[0]
+
+    usage = []
+    for field in (1, 2):
+        series = np.zeros((len(data), len(pids)))
+        series[rows, columns] = values[:, :, field][ranked]
+        usage.append(pd.DataFrame(series, index=data.index, columns=pids))
+    presence = np.zeros((len(data), len(pids)), dtype=bool)
+    presence[rows, columns] = True
+    return (*usage, pd.Series(presence.mean(axis=0) if len(data) else 0.0,
+                              index=pids))
+
+
+def memory_percentage(name: str, data: pd.DataFrame) -> pd.Series:
+    r"""Compute the percentage usage of memory or swap samples.
+
+    Memory: (total - available) / total * 100
+    Swap: used / total * 100
+
+    :param name: Collector name ('memory' or 'swap')
+    :param data: Samples in bytes
+    :return: Percentage usage of each sample
+    """
+    if data.empty:
+        return pd.Series(dtype=float)
+    if name == 'memory':
+        used = data['Total'] - data['Available']
+    else:
+        used = data['Used']
+    # Systems without swap have a total of 0 bytes
+    total = data['Total'].where(data['Total'] > 0)
+    return (used / total * 100).fillna(0.0).round(1)